@@ -0,0 +1,117 @@
+"""Task polling and linking against a fake Alist server.
+
+Usage:
+    python benchmarks/bench_fake_alist.py [--history 10000] [--resources 100]
+    python benchmarks/bench_fake_alist.py --serve --port 5244
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from unittest.mock import AsyncMock
+
+from loguru import logger
+
+from alist_mikananirss import AnimeRenamer
+from alist_mikananirss.alist import Alist, AlistDownloaderType, AlistTaskType
+from alist_mikananirss.alist.fake_server import FakeAlistOptions, FakeAlistServer
+from alist_mikananirss.core.download_manager import DownloadManager
+from alist_mikananirss.websites.models import ResourceInfo
+
+
+async def bench_polling(alist: Alist, repeat: int) -> float:
+    """Best time of one TaskMonitor poll: both task lists, filtered by tids"""
+    tids = {"not-exist"}
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await alist.get_task_list(AlistTaskType.DOWNLOAD, tids=tids)
+        await alist.get_task_list(AlistTaskType.TRANSFER, tids=tids)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def bench_linking(alist: Alist, n: int) -> float:
+    """Time to download, link, and rename n resources"""
+    DownloadManager.initialize(
+        alist_client=alist,
+        base_download_path="/Google/Anime",
+        use_renamer=True,
+        db=AsyncMock(),
+    )
+    AnimeRenamer.initialize(alist, "{name} S{season:02d}E{episode:02d}")
+    resources = [
+        ResourceInfo(
+            resource_title=f"Bench {i % 10} - {i // 10 + 1:02d}",
+            torrent_url=f"magnet:?xt=urn:btih:{0xBE << 150 | i:040x}",
+            anime_name=f"Bench {i % 10}",
+            season=1,
+            episode=i // 10 + 1,
+        )
+        for i in range(n)
+    ]
+    start = time.perf_counter()
+    await DownloadManager.add_download_tasks(resources)
+    await DownloadManager().task_monitor.wait_finished()
+    return time.perf_counter() - start
+
+
+async def serve(options: FakeAlistOptions, host: str, port: int):
+    server = FakeAlistServer(options)
+    base_url = await server.start(host, port)
+    print(f"Fake Alist is running on {base_url}, token: {server.token}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+async def run(args, options: FakeAlistOptions):
+    async with FakeAlistServer(options) as server:
+        alist = Alist(server.base_url, server.token, AlistDownloaderType.QBIT)
+        try:
+            poll = await bench_polling(alist, args.repeat)
+            print(f"poll {args.history} history tasks: {poll * 1000:8.1f} ms")
+            elapsed = await bench_linking(alist, args.resources)
+            print(
+                f"link {args.resources} resources : {elapsed:8.1f} s "
+                f"({args.resources / elapsed:.1f} resources/s)"
+            )
+            for endpoint, count in sorted(server.requests.items()):
+                print(f"  {endpoint}: {count} requests")
+        finally:
+            await alist.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history", type=int, default=10000)
+    parser.add_argument("--resources", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--download-time", type=float, default=0.5)
+    parser.add_argument("--transfer-time", type=float, default=0.2)
+    parser.add_argument("--failure-rate", type=float, default=0)
+    parser.add_argument("--serve", action="store_true", help="Only run the server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5244)
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    options = FakeAlistOptions(
+        download_time=args.download_time,
+        transfer_time=args.transfer_time,
+        download_failure_rate=args.failure_rate,
+        transfer_failure_rate=args.failure_rate,
+        history_size=args.history,
+        seed=0,
+    )
+    if args.serve:
+        asyncio.run(serve(options, args.host, args.port))
+    else:
+        asyncio.run(run(args, options))
+
+
+if __name__ == "__main__":
+    main()
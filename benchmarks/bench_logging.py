@@ -0,0 +1,172 @@
+"""Event loop stalls caused by logging.
+
+A ticker measures how late the event loop wakes it up while a simulated
+RssMonitor/TaskMonitor logs like it does on every poll. The sinks are a log
+file and a slow terminal (a sink taking --sink-delay seconds per line, like a
+blocked docker log pipe).
+
+Modes:
+    sync      the old init_logging: no enqueue, multi-line resource dumps and
+              eager f-string debug lines
+    enqueue   the same log lines, loguru's enqueue=True
+    thread    the same log lines, written by BackgroundLogWriter
+    lazy      thread, one-line resources, debug lines formatted only if
+              enabled, and per-task progress lines throttled
+
+Usage (the defaults):
+    python benchmarks/bench_logging.py --resources 200 --tasks 500 --polls 3 \
+        --sink-delay 0.002
+"""
+
+import argparse
+import asyncio
+import functools
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from loguru import logger
+
+from alist_mikananirss.utils.log import BackgroundLogWriter, LogThrottle
+from alist_mikananirss.websites.models import ResourceInfo
+
+MODES = ("sync", "enqueue", "thread", "lazy")
+
+
+class FakeTask:
+    def __init__(self, i: int):
+        self.tid = f"task{i:06d}"
+        self.state = "Running"
+        self.progress = i % 100
+
+    def __str__(self):
+        return (
+            f"<AlistDownloadTask {self.tid}: download magnet:?xt=urn:btih:{self.tid}>"
+        )
+
+
+async def ticker(lags: list[float], stop: asyncio.Event, period: float = 0.001):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(period)
+        lags.append(time.perf_counter() - start - period)
+
+
+async def workload(mode: str, args, resources: list[ResourceInfo], tasks: list):
+    throttle = LogThrottle(30)
+    for _ in range(args.polls):
+        for resource in resources:
+            if mode == "lazy":
+                logger.info("Find new resource: {}", resource.brief())
+                logger.debug("Resource info:\n{}", resource)
+            else:
+                logger.info(f"Find new resource: {resource}")
+        for task in tasks:
+            if mode == "lazy":
+                if throttle.allow(task.tid)[0]:
+                    logger.debug(
+                        "Checking {} state: {} progress: {:.2f}%",
+                        task,
+                        task.state,
+                        task.progress,
+                    )
+            else:
+                logger.debug(
+                    f"Checking {task} state: {task.state} progress: {task.progress:.2f}%"
+                )
+        # One poll, other coroutines get to run
+        await asyncio.sleep(0)
+
+
+def slow_sink(delay: float):
+    def sink(message):
+        time.sleep(delay)
+
+    return sink
+
+
+async def run_mode(mode: str, args, log_dir: str) -> dict:
+    logger.remove()
+    writer = None
+    if mode in ("thread", "lazy"):
+        writer = BackgroundLogWriter()
+        add_sink = writer.add
+    else:
+        add_sink = functools.partial(logger.add, enqueue=mode == "enqueue")
+    add_sink(os.path.join(log_dir, f"{mode}.log"), level=args.level)
+    add_sink(slow_sink(args.sink_delay), level=args.level)
+
+    resources = [
+        ResourceInfo(
+            resource_title=f"[ANi] Bench {i} - {i % 24 + 1:02d} [1080P][Baha][WEB-DL]",
+            torrent_url=f"magnet:?xt=urn:btih:{i:040x}",
+            anime_name=f"Bench {i}",
+            season=1,
+            episode=i % 24 + 1,
+            fansub="ANi",
+            languages=["繁"],
+        )
+        for i in range(args.resources)
+    ]
+    tasks = [FakeTask(i) for i in range(args.tasks)]
+
+    lags: list[float] = []
+    stop = asyncio.Event()
+    ticker_task = asyncio.create_task(ticker(lags, stop))
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    await workload(mode, args, resources, tasks)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker_task
+    flush_start = time.perf_counter()
+    if writer:
+        writer.stop(timeout=None)
+    else:
+        await logger.complete()
+        logger.remove()
+    flush = time.perf_counter() - flush_start
+
+    lags.sort()
+    return {
+        "mode": mode,
+        "loop_time": elapsed,
+        "flush_time": flush,
+        "max_lag": lags[-1] if lags else 0,
+        "p99_lag": lags[min(len(lags) - 1, int(len(lags) * 0.99))] if lags else 0,
+        "mean_lag": statistics.fmean(lags) if lags else 0,
+    }
+
+
+async def run(args):
+    results = []
+    with tempfile.TemporaryDirectory() as log_dir:
+        for mode in args.modes:
+            results.append(await run_mode(mode, args, log_dir))
+    logger.add(sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--resources", type=int, default=200)
+    parser.add_argument("--tasks", type=int, default=500)
+    parser.add_argument("--polls", type=int, default=3)
+    parser.add_argument("--level", default="INFO")
+    parser.add_argument("--sink-delay", type=float, default=0.002)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    for r in asyncio.run(run(args)):
+        print(
+            f"{r['mode']:8} event loop busy {r['loop_time'] * 1000:8.1f} ms, "
+            f"max stall {r['max_lag'] * 1000:8.1f} ms, "
+            f"p99 stall {r['p99_lag'] * 1000:6.1f} ms, "
+            f"flush {r['flush_time'] * 1000:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""End-to-end benchmark of the RSS -> Alist path with recorded fixtures.
+
+The recorded Mikan/dmhy/acg.rip feeds and homepages are replayed from a local
+server (see replay.py), the LLM is faked from the recorded answers, and Alist
+is the fake server of alist_mikananirss.alist.fake_server. Nothing leaves the
+machine.
+
+Measured at each size (new items per feed):
+    rss.get_new_resources      feed parsing, homepage parsing and extraction
+    download.add_download_tasks  creating the offline download tasks
+    task_monitor.cycle         one poll of the task lists with all tasks running
+    task_monitor.drain         until every task is linked and renamed
+
+Usage:
+    python benchmarks/bench_pipeline.py [--sizes 10 100 1000] [--output result.json]
+    python benchmarks/bench_pipeline.py --baseline old.json --max-regression 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+from importlib.metadata import PackageNotFoundError, version
+
+from loguru import logger
+from replay import FakeLLMProvider, ReplayServer
+
+from alist_mikananirss import AnimeRenamer, RegexFilter, RssMonitor, SubscribeDatabase
+from alist_mikananirss.alist import Alist, AlistDownloaderType
+from alist_mikananirss.alist.fake_server import FakeAlistOptions, FakeAlistServer
+from alist_mikananirss.common.database import db_dirpath
+from alist_mikananirss.core.download_manager import DownloadManager
+from alist_mikananirss.extractor import Extractor, LLMExtractor
+from alist_mikananirss.utils.tmdb import TMDBClient
+
+SITES = ("mikan", "dmhy", "acgrip")
+
+
+def latency_summary(samples: list[float]) -> dict:
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    return {
+        "avg": statistics.fmean(samples),
+        "p50": samples[len(samples) // 2],
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "max": samples[-1],
+    }
+
+
+def result(name: str, items: int, seconds: float, **extra) -> dict:
+    return {
+        "name": name,
+        "items": items,
+        "seconds": seconds,
+        "throughput": items / seconds if seconds > 0 else 0,
+        **extra,
+    }
+
+
+async def bench_get_new_resources(
+    replay: ReplayServer, db: SubscribeDatabase, site: str, n: int, run_id: str
+):
+    feed = replay.add_feed(site, n, run_id)
+    provider = FakeLLMProvider(feed.truths)
+    llm_extractor = LLMExtractor(provider)
+    llm_extractor.tmdb_client = TMDBClient(api_base_url=replay.base_url + "3")
+    Extractor.destroy_instance()
+    Extractor.initialize(llm_extractor)
+
+    monitor = RssMonitor([feed.rss_url], RegexFilter(), db, use_extractor=True)
+    (website,) = monitor.websites
+    latencies = []
+    extract_resource_info = website.extract_resource_info
+
+    async def timed_extract(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await extract_resource_info(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    website.extract_resource_info = timed_extract
+    start = time.perf_counter()
+    resources = await monitor.get_new_resources(monitor.websites, monitor.filter)
+    elapsed = time.perf_counter() - start
+    if len(resources) != n:
+        logger.warning(f"{site}: expected {n} new resources, got {len(resources)}")
+    return (
+        result(
+            "rss.get_new_resources",
+            n,
+            elapsed,
+            site=site,
+            latency=latency_summary(latencies),
+            llm_calls=provider.calls,
+        ),
+        resources,
+    )
+
+
+async def bench_download(alist_options: FakeAlistOptions, db, resources, cycles: int):
+    results = []
+    n = len(resources)
+    async with FakeAlistServer(alist_options) as server:
+        alist = Alist(server.base_url, server.token, AlistDownloaderType.QBIT)
+        DownloadManager.destroy_instance()
+        AnimeRenamer.destroy_instance()
+        DownloadManager.initialize(
+            alist_client=alist,
+            base_download_path="/Google/Anime",
+            use_renamer=True,
+            db=db,
+        )
+        AnimeRenamer.initialize(alist, "{name} S{season:02d}E{episode:02d}")
+        task_monitor = DownloadManager().task_monitor
+        try:
+            start = time.perf_counter()
+            await DownloadManager.add_download_tasks(resources)
+            results.append(
+                result("download.add_download_tasks", n, time.perf_counter() - start)
+            )
+
+            cycle_times = []
+            for _ in range(cycles):
+                # Between two cycles of the real monitor loop: under its lock
+                # the running tasks are the ones it polls, the finished ones
+                # are already removed. The wait for the lock is not counted
+                async with task_monitor.lock:
+                    start = time.perf_counter()
+                    tasks = await task_monitor._fetch_remote_tasks()
+                    task_monitor._refresh_task(task_monitor.running_tasks, tasks)
+                    cycle_times.append(time.perf_counter() - start)
+                await asyncio.sleep(0)
+            results.append(
+                result(
+                    "task_monitor.cycle",
+                    n,
+                    statistics.fmean(cycle_times),
+                    latency=latency_summary(cycle_times),
+                )
+            )
+
+            start = time.perf_counter()
+            await task_monitor.wait_finished()
+            results.append(
+                result(
+                    "task_monitor.drain",
+                    n,
+                    time.perf_counter() - start,
+                    alist_requests=sum(server.requests.values()),
+                    alist_latency=alist.latency_stats(),
+                )
+            )
+        finally:
+            await alist.close()
+    return results
+
+
+def metadata() -> dict:
+    try:
+        package_version = version("alist-mikananirss")
+    except PackageNotFoundError:
+        package_version = None
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "version": package_version,
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+async def run(args) -> list[dict]:
+    alist_options = FakeAlistOptions(
+        download_time=args.download_time,
+        transfer_time=args.transfer_time,
+        history_size=args.history,
+        seed=0,
+    )
+    replay = ReplayServer()
+    await replay.start()
+    results = []
+    try:
+        for n in args.sizes:
+            # A new database for each size, or the items of the last size are
+            # not new anymore
+            db_name = f"bench_{uuid.uuid4()}.db"
+            db = await SubscribeDatabase.create(db_name)
+            try:
+                run_id = uuid.uuid4().hex[:8]
+                download_resources = []
+                for site in args.sites:
+                    site_result, resources = await bench_get_new_resources(
+                        replay, db, site, n, run_id
+                    )
+                    results.append(site_result)
+                    if site == args.sites[0]:
+                        download_resources = resources
+                results += await bench_download(
+                    alist_options, db, download_resources, args.cycles
+                )
+            finally:
+                await db.close()
+                os.remove(os.path.join(db_dirpath, db_name))
+    finally:
+        await replay.close()
+        DownloadManager.destroy_instance()
+        AnimeRenamer.destroy_instance()
+    return results
+
+
+def result_key(r: dict) -> tuple:
+    return (r["name"], r.get("site"), r["items"])
+
+
+def print_results(results: list[dict], baseline: dict = None):
+    baseline = {result_key(r): r for r in (baseline or {}).get("results", [])}
+    for r in results:
+        line = (
+            f"{r['name']:28} {r.get('site') or '':7} {r['items']:5} items "
+            f"{r['seconds'] * 1000:10.1f} ms {r['throughput']:10.1f} items/s"
+        )
+        old = baseline.get(result_key(r))
+        if old and old["throughput"]:
+            line += f"  ({r['throughput'] / old['throughput'] - 1:+.0%} vs baseline)"
+        print(line)
+
+
+def regressions(results: list[dict], baseline: dict, max_regression: float):
+    old_results = {result_key(r): r for r in baseline.get("results", [])}
+    regressed = []
+    for r in results:
+        old = old_results.get(result_key(r))
+        if old and old["throughput"] > 0:
+            if r["throughput"] < old["throughput"] * (1 - max_regression):
+                regressed.append(r)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--sites", nargs="+", choices=SITES, default=list(SITES))
+    parser.add_argument("--cycles", type=int, default=5, help="Task monitor polls")
+    parser.add_argument("--history", type=int, default=1000, help="Alist history")
+    parser.add_argument("--download-time", type=float, default=0.05)
+    parser.add_argument("--transfer-time", type=float, default=0.05)
+    parser.add_argument("--output", help="Write the results to this json file")
+    parser.add_argument("--baseline", help="Compare with the results of a json file")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=None,
+        help="Exit with 1 if a throughput drops more than this ratio vs baseline",
+    )
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    os.environ.setdefault("NO_PROXY", "127.0.0.1,localhost")
+
+    results = asyncio.run(run(args))
+    report = {"meta": metadata(), "results": results}
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Results are written to {args.output}")
+    if baseline and args.max_regression is not None:
+        regressed = regressions(results, baseline, args.max_regression)
+        for r in regressed:
+            print(f"Regression: {r['name']} {r.get('site') or ''} {r['items']} items")
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Decode a 10k-task Alist task list response.
+
+Usage:
+    python benchmarks/bench_task_decode.py [--tasks 10000] [--repeat 5]
+"""
+
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from alist_mikananirss.alist.api import json_loads
+from alist_mikananirss.alist.tasks import AlistDownloadTask, AlistTransferTask
+
+
+def make_response(n: int) -> tuple[bytes, bytes]:
+    start = datetime(2025, 1, 1)
+    download_tasks = []
+    transfer_tasks = []
+    for i in range(n // 2):
+        start_time = (start + timedelta(minutes=i)).isoformat() + ".4354376Z"
+        common = {
+            "creator": "admin",
+            "creator_role": 2,
+            "end_time": start_time,
+            "error": "",
+            "id": f"tid{i}",
+            "progress": 100,
+            "start_time": start_time,
+            "state": 2,
+            "total_bytes": 390419899,
+        }
+        download_tasks.append(
+            common
+            | {
+                "name": f"download magnet:?xt=urn:btih:{i:040x} to (/Google/Anime/Test {i}/Season 1)",
+                "status": "offline download completed",
+            }
+        )
+        transfer_tasks.append(
+            common
+            | {
+                "name": f"transfer [](/opt/alist/data/temp/qBittorrent/{uuid.uuid4()}/[ANi] Test {i} - 01 [1080P].mp4) to [/Google](/Anime/Test {i}/Season 1)",
+                "status": "",
+            }
+        )
+    return (
+        json.dumps({"code": 200, "data": download_tasks}).encode(),
+        json.dumps({"code": 200, "data": transfer_tasks}).encode(),
+    )
+
+
+def decode(raw: bytes, task_class, parse_description: bool):
+    tasks = [task_class.from_json(t) for t in json_loads(raw)["data"]]
+    if parse_description:
+        for task in tasks:
+            if task_class is AlistDownloadTask:
+                task.url
+            else:
+                task.target_path
+    return tasks
+
+
+def bench(raw_dl: bytes, raw_tf: bytes, repeat: int, parse_description: bool):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decode(raw_dl, AlistDownloadTask, parse_description)
+        decode(raw_tf, AlistTransferTask, parse_description)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    raw_dl, raw_tf = make_response(args.tasks)
+    print(f"json decoder: {json_loads.__module__}")
+    for parse_description in (False, True):
+        best = bench(raw_dl, raw_tf, args.repeat, parse_description)
+        label = "with descriptions" if parse_description else "lazy descriptions"
+        print(
+            f"{label:18}: {best * 1000:8.1f} ms "
+            f"({best / args.tasks * 1e6:.2f} us/task)"
+        )
+
+
+if __name__ == "__main__":
+    main()
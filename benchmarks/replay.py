@@ -0,0 +1,186 @@
+"""Replay the recorded feeds and homepages of fixtures/ from a local server.
+
+The recorded feeds have only a few items, they are scaled to any number of
+items by bumping the episode numbers of the recorded titles. Every item gets
+its own homepage url and magnet link, so nothing is cached between items.
+"""
+
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Type, TypeVar
+
+from aiohttp import web
+
+from alist_mikananirss.extractor.llm import LLMProvider
+from alist_mikananirss.extractor.llm.prompt import PromptType, load_prompt
+
+T = TypeVar("T")
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+ITEM_PATTERN = re.compile(r"<item>.*?</item>", re.S)
+LINK_PATTERN = re.compile(r"<link>[^<]*</link>")
+ENCLOSURE_URL_PATTERN = re.compile(r'(<enclosure[^>]*?url=")[^"]*(")')
+
+
+def load_manifest() -> dict:
+    with open(os.path.join(FIXTURES_DIR, "manifest.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+@dataclass
+class ReplayFeed:
+    site: str
+    rss_url: str
+    xml: str
+    # resource title -> what the LLM should extract from it
+    truths: dict[str, dict]
+
+
+def scale_feed(site: str, spec: dict, n: int, base_url: str, run_id: str) -> ReplayFeed:
+    """Build a feed of n items from the recorded items of a site"""
+    xml = read_fixture(spec["feed"])
+    items = ITEM_PATTERN.findall(xml)
+    head = xml[: xml.index(items[0])]
+    tail = xml[xml.rindex(items[-1]) + len(items[-1]) :]
+
+    new_items = []
+    truths = {}
+    for i in range(n):
+        template = items[i % len(items)]
+        truth = dict(spec["items"][i % len(items)])
+        # Each round of the recorded items is the next batch of episodes
+        episode = truth["episode"] + i // len(items) * len(items)
+        episode_text = truth["episode_text"].replace(
+            f"{truth['episode']:02d}", f"{episode:02d}"
+        )
+        title = truth["title"].replace(truth["episode_text"], episode_text)
+        uid = hashlib.sha1(f"{run_id}/{site}/{i}".encode()).hexdigest()
+
+        item = template.replace(truth["title"], title)
+        item = LINK_PATTERN.sub(f"<link>{base_url}{site}/page/{uid}</link>", item)
+        item = ENCLOSURE_URL_PATTERN.sub(rf"\g<1>magnet:?xt=urn:btih:{uid}\g<2>", item)
+        new_items.append(item)
+        truth.update(title=title, episode=episode)
+        truths[title] = truth
+    # The path keeps the site name in it, WebsiteFactory picks the parser by it
+    sep = "&" if "?" in spec["rss_path"] else "?"
+    rss_url = f"{base_url.rstrip('/')}{spec['rss_path']}{sep}run={run_id}&site={site}"
+    return ReplayFeed(site, rss_url, head + "\n".join(new_items) + tail, truths)
+
+
+class ReplayServer:
+    """Serve the scaled feeds, the recorded homepages and a fake TMDB search"""
+
+    def __init__(self):
+        self.manifest = load_manifest()
+        self.homepages = {
+            site: read_fixture(spec["homepage"]) for site, spec in self.manifest.items()
+        }
+        self.feeds: dict[tuple[str, str], ReplayFeed] = {}
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url: Optional[str] = None
+
+    def add_feed(self, site: str, n: int, run_id: str) -> ReplayFeed:
+        feed = scale_feed(site, self.manifest[site], n, self.base_url, run_id)
+        self.feeds[(run_id, site)] = feed
+        return feed
+
+    async def _feed(self, request: web.Request):
+        feed = self.feeds.get((request.query.get("run"), request.query.get("site")))
+        if feed is None:
+            raise web.HTTPNotFound()
+        return web.Response(text=feed.xml, content_type="application/rss+xml")
+
+    async def _homepage(self, request: web.Request):
+        return web.Response(
+            text=self.homepages[request.match_info["site"]], content_type="text/html"
+        )
+
+    async def _tmdb_search(self, request: web.Request):
+        query = request.query["query"]
+        tvid = int(hashlib.sha1(query.encode()).hexdigest()[:6], 16)
+        return web.json_response(
+            {"results": [{"name": query, "id": tvid, "popularity": 10.0}]}
+        )
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get("/3/search/tv", self._tmdb_search)
+        app.router.add_get("/{site}/page/{uid}", self._homepage)
+        app.router.add_get("/{tail:.*}", self._feed)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}/"
+        return self.base_url
+
+    async def close(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class FakeLLMProvider(LLMProvider):
+    """Answer the extractor prompts from the truths of the replayed feeds"""
+
+    def __init__(self, truths: dict[str, dict], parse_mode=PromptType.JSON_OBJECT):
+        self.truths = truths
+        self.calls = 0
+        self._prompts = {
+            load_prompt(parse_mode, name): name
+            for name in (
+                "resource_title",
+                "tmdb_search_param",
+                "tmdb_retry_search",
+                "tmdb_find_anime",
+            )
+        }
+
+    def _truth(self, title: str) -> dict:
+        title = title.strip()
+        if title not in self.truths:
+            raise ValueError(f"No recorded answer for {title}")
+        return self.truths[title]
+
+    async def parse_as_json(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        self.calls += 1
+        prompt = self._prompts.get(messages[0]["content"])
+        content = messages[-1]["content"]
+        if prompt == "resource_title":
+            truth = self._truth(content)
+            return {
+                key: truth[key]
+                for key in (
+                    "anime_name",
+                    "season",
+                    "episode",
+                    "quality",
+                    "fansub",
+                    "languages",
+                    "version",
+                )
+            }
+        if prompt == "tmdb_search_param":
+            return {"query": self._truth(content)["anime_name"]}
+        if prompt == "tmdb_find_anime":
+            # resource_file_name: {title}, search_results: [...]
+            title, _, results = content.partition(", search_results: ")
+            title = title.removeprefix("resource_file_name: ")
+            tvid = int(re.search(r"'id': (\d+)", results).group(1))
+            return {"anime_name": self._truth(title)["anime_name"], "tvid": tvid}
+        raise ValueError(f"Unexpected prompt: {messages[0]['content'][:50]}")
+
+    async def parse_with_schema(
+        self, messages: List[Dict[str, str]], response_format: Type[T]
+    ) -> Optional[T]:
+        return response_format(**await self.parse_as_json(messages))
@@ -2,3 +2,11 @@ from .common import SubscribeDatabase
 from .common.config import AppConfig, ConfigManager
 from .core import *
 from .main import main
+
+
+def __getattr__(name):
+    if name == "BotAssistant":
+        from .core import BotAssistant
+
+        return BotAssistant
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
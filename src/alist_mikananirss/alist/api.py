@@ -1,10 +1,23 @@
 import asyncio
+import json
 import mimetypes
 import os
+import random
+import time
 import urllib.parse
-from typing import List
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Collection, List, Optional
 
 import aiohttp
+from loguru import logger
+
+try:
+    # Optional, decodes large task lists several times faster
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 from alist_mikananirss.alist.tasks import (
     AlistDeletePolicy,
@@ -13,38 +26,292 @@ from alist_mikananirss.alist.tasks import (
     AlistTask,
     AlistTaskType,
     AlistTransferTask,
+    raw_task_target_path,
 )
+from alist_mikananirss.utils.metrics import metrics
+
+
+def build_task_filter(
+    task_type: AlistTaskType,
+    tids: Optional[Collection[str]] = None,
+    path_prefix: Optional[str] = None,
+    predicate: Optional[Callable[[dict], bool]] = None,
+) -> Optional[Callable[[dict], bool]]:
+    """Combine the task list filters into one check of the raw task json"""
+    checks = []
+    if tids is not None:
+        tids = tids if isinstance(tids, (set, frozenset, dict)) else set(tids)
+        checks.append(lambda task: task["id"] in tids)
+    if path_prefix is not None:
+        prefix = path_prefix.lstrip("/")
+
+        def match_path(task: dict) -> bool:
+            path = raw_task_target_path(task_type, task["name"])
+            return path is not None and path.lstrip("/").startswith(prefix)
+
+        checks.append(match_path)
+    if predicate is not None:
+        checks.append(predicate)
+    if not checks:
+        return None
+    if len(checks) == 1:
+        return checks[0]
+    return lambda task: all(check(task) for check in checks)
 
 
 class AlistClientError(Exception):
     pass
 
 
+class AlistCircuitOpenError(AlistClientError):
+    """Raised without sending the request while Alist is considered down."""
+
+
+@dataclass
+class AlistClientPolicy:
+    """Timeouts, retries and connection limits of the Alist client."""
+
+    # seconds
+    connect_timeout: float = 10
+    read_timeout: float = 30
+    total_timeout: float = 60
+    # Retries after the first attempt. Non-idempotent requests are only
+    # retried when the connection failed, i.e. the request was never sent.
+    max_retries: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 10
+    # Consecutive failures to open the circuit, and how long it stays open
+    breaker_threshold: int = 5
+    breaker_reset_time: float = 30
+    connection_limit: int = 10
+    keepalive_timeout: float = 60
+    # Uploads are read from disk in chunks of upload_chunk_size bytes, with at
+    # most upload_read_ahead chunks buffered. upload_timeout limits a whole
+    # upload, None for no limit.
+    upload_chunk_size: int = 1024 * 1024
+    upload_read_ahead: int = 4
+    upload_concurrency: int = 2
+    upload_timeout: Optional[float] = None
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+
+class CircuitBreaker:
+    """Fail fast after `threshold` consecutive failures. After `reset_time`
+    one trial request is let through (half open), its result closes the
+    circuit or opens it again."""
+
+    def __init__(self, threshold: int = 5, reset_time: float = 30):
+        self.threshold = threshold
+        self.reset_time = reset_time
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_time:
+            return "half_open"
+        return "open"
+
+    def _trial_running(self) -> bool:
+        # A trial that never reported back (e.g. cancelled) expires
+        return (
+            self._trial_started is not None
+            and time.monotonic() - self._trial_started < self.reset_time
+        )
+
+    def before_request(self):
+        state = self.state
+        if state == "open" or (state == "half_open" and self._trial_running()):
+            raise AlistCircuitOpenError(
+                f"Alist is unavailable after {self.failures} failures, retry later"
+            )
+        if state == "half_open":
+            self._trial_started = time.monotonic()
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info("Alist is available again")
+        self.failures = 0
+        self.opened_at = None
+        self._trial_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_started = None
+        if self.failures >= self.threshold:
+            if self.opened_at is None:
+                logger.warning(
+                    f"Alist failed {self.failures} times in a row, "
+                    f"pause requests for {self.reset_time}s"
+                )
+            self.opened_at = time.monotonic()
+
+
+ALIST_REQUEST_SECONDS = metrics.histogram(
+    "alist_request_seconds",
+    "Latency of the Alist api requests",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+ALIST_REQUEST_ERRORS = metrics.counter(
+    "alist_request_errors", "Failed Alist api requests, retries included"
+)
+
+
+@dataclass
+class UploadProgress:
+    file_path: str
+    sent: int
+    total: int
+    elapsed: float
+
+    @property
+    def speed(self) -> float:
+        """bytes per second"""
+        return self.sent / self.elapsed if self.elapsed > 0 else 0
+
+    @property
+    def percent(self) -> float:
+        return self.sent / self.total * 100 if self.total else 100
+
+
+UploadProgressCallback = Callable[[UploadProgress], None]
+
+
+async def _read_chunks(
+    file_path: str, chunk_size: int, read_ahead: int
+) -> AsyncIterator[bytes]:
+    """Read a file in a thread, keep at most read_ahead chunks in memory.
+
+    Nothing is read until the iteration starts, so a request that failed to
+    connect can be retried with the same iterator.
+    """
+    queue: asyncio.Queue = asyncio.Queue(max(1, read_ahead))
+
+    async def produce(f):
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            await queue.put(chunk)
+            if not chunk:
+                return
+
+    # Use utf-8 encoding to avoid UnicodeEncodeError
+    with open(file_path.encode("utf-8"), "rb") as f:
+        producer = asyncio.create_task(produce(f))
+        try:
+            while True:
+                get = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait(
+                    [get, producer], return_when=asyncio.FIRST_COMPLETED
+                )
+                if get not in done:
+                    get.cancel()
+                    # The reader failed
+                    producer.result()
+                chunk = get.result()
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+
+def _is_retryable(e: Exception, idempotent: bool) -> bool:
+    if isinstance(e, aiohttp.ClientConnectorError):
+        # The request was not sent
+        return True
+    if not idempotent:
+        return False
+    if isinstance(e, aiohttp.ClientResponseError):
+        return e.status >= 500 or e.status == 429
+    return isinstance(
+        e, (asyncio.TimeoutError, aiohttp.ServerDisconnectedError, aiohttp.ClientError)
+    )
+
+
 class Alist:
-    def __init__(self, base_url: str, token: str, downloader: AlistDownloaderType):
+    def __init__(
+        self,
+        base_url: str,
+        token: str,
+        downloader: AlistDownloaderType,
+        policy: Optional[AlistClientPolicy] = None,
+    ):
         self.base_url = base_url
         self.token = token
         self.downloader = downloader
+        self.policy = policy or AlistClientPolicy()
+        self.breaker = CircuitBreaker(
+            self.policy.breaker_threshold, self.policy.breaker_reset_time
+        )
         self.session = None
         self._session_lock = asyncio.Lock()
+        # dir path -> names of all the files in it, see list_dir_all
+        self._dir_cache: dict[str, list[str]] = {}
 
     async def _ensure_session(self):
         async with self._session_lock:
             if self.session is None or self.session.closed:
-                self.session = aiohttp.ClientSession(trust_env=True)
+                connector = aiohttp.TCPConnector(
+                    limit=self.policy.connection_limit,
+                    keepalive_timeout=self.policy.keepalive_timeout,
+                )
+                timeout = aiohttp.ClientTimeout(
+                    total=self.policy.total_timeout,
+                    sock_connect=self.policy.connect_timeout,
+                    sock_read=self.policy.read_timeout,
+                )
+                self.session = aiohttp.ClientSession(
+                    trust_env=True, connector=connector, timeout=timeout
+                )
 
     async def close(self):
         if self.session:
             await self.session.close()
             self.session = None
 
+    @staticmethod
+    def latency_stats() -> dict[str, dict]:
+        """Latency summary of each endpoint, from the alist_request_seconds
+        metric of the process"""
+        stats = {}
+        for key, hist in ALIST_REQUEST_SECONDS.values.items():
+            labels = dict(key)
+            stats[labels["endpoint"]] = {
+                "count": hist.count,
+                "errors": ALIST_REQUEST_ERRORS.get(**labels),
+                "avg": hist.sum / hist.count if hist.count else 0,
+                "p50": ALIST_REQUEST_SECONDS.quantile(0.5, **labels),
+                "p95": ALIST_REQUEST_SECONDS.quantile(0.95, **labels),
+                "buckets": dict(zip(ALIST_REQUEST_SECONDS.buckets, hist.counts)),
+            }
+        return stats
+
+    async def _request(self, method: str, url: str, headers: dict, **kwargs):
+        async with self.session.request(method, url, headers=headers, **kwargs) as resp:
+            resp.raise_for_status()
+            return await resp.json(loads=json_loads)
+
     async def _api_call(
         self,
         method: str,
         endpoint: str,
         custom_headers: dict[str, str] = None,
+        idempotent: Optional[bool] = None,
         **kwargs,
     ):
+        """Call the Alist api
+
+        Args:
+            idempotent (bool, optional): Whether the request can be retried
+                safely after it reached Alist. Defaults to True for GET.
+        """
         await self._ensure_session()
         url = urllib.parse.urljoin(self.base_url, endpoint)
         headers = {
@@ -54,9 +321,40 @@ class Alist:
         }
         if custom_headers:
             headers.update(custom_headers)
-        async with self.session.request(method, url, headers=headers, **kwargs) as resp:
-            resp.raise_for_status()
-            data = await resp.json()
+        if idempotent is None:
+            idempotent = method.upper() == "GET"
+        path = "/" + urllib.parse.urlparse(url).path.lstrip("/")
+
+        attempt = 0
+        while True:
+            self.breaker.before_request()
+            start = time.perf_counter()
+            try:
+                data = await self._request(method, url, headers, **kwargs)
+            except Exception as e:
+                elapsed = time.perf_counter() - start
+                ALIST_REQUEST_SECONDS.observe(elapsed, endpoint=path)
+                ALIST_REQUEST_ERRORS.inc(endpoint=path)
+                if isinstance(e, aiohttp.ClientResponseError) and e.status < 500:
+                    # Alist is up, the request is wrong or throttled
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+                if attempt >= self.policy.max_retries or not _is_retryable(
+                    e, idempotent
+                ):
+                    raise
+                delay = self.policy.backoff(attempt)
+                attempt += 1
+                logger.warning(
+                    f"Alist request {method} {path} failed: {e!r}, "
+                    f"retry {attempt}/{self.policy.max_retries} in {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+                continue
+            elapsed = time.perf_counter() - start
+            ALIST_REQUEST_SECONDS.observe(elapsed, endpoint=path)
+            self.breaker.record_success()
             if data["code"] != 200:
                 raise AlistClientError(data.get("message", "Unknown error"))
             return data["data"]
@@ -88,33 +386,110 @@ class Alist:
         )
         return [AlistDownloadTask.from_json(task) for task in response_data["tasks"]]
 
-    async def upload(self, save_path: str, file_path: str) -> bool:
+    async def upload(
+        self,
+        save_path: str,
+        file_path: str,
+        progress: Optional[UploadProgressCallback] = None,
+        chunk_size: Optional[int] = None,
+    ) -> bool:
         """upload local file to Alist.
 
+        The file is streamed from disk in chunks, so large files don't block
+        the event loop or get loaded into memory.
+
         Args:
             save_path (str): Alist path
             file_path (str): local file path
+            progress (UploadProgressCallback, optional): Called after each chunk
+                is sent
+            chunk_size (int, optional): Bytes of each chunk. Defaults to
+                policy.upload_chunk_size.
         """
         file_path = os.path.abspath(file_path)
         file_name = os.path.basename(file_path)
+        chunk_size = chunk_size or self.policy.upload_chunk_size
 
-        # Use utf-8 encoding to avoid UnicodeEncodeError
-        file_path_encoded = file_path.encode("utf-8")
-
-        mime_type = mimetypes.guess_type(file_name)[0]
-        file_stat = os.stat(file_path)
+        mime_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+        total = os.stat(file_path).st_size
         upload_path = urllib.parse.quote(f"{save_path}/{file_name}")
 
         headers = {
             "Content-Type": mime_type,
-            "Content-Length": str(file_stat.st_size),
+            "Content-Length": str(total),
             "file-path": upload_path,
         }
 
-        with open(file_path_encoded, "rb") as f:
-            await self._api_call("PUT", "api/fs/put", custom_headers=headers, data=f)
+        start = time.perf_counter()
+        sent = 0
+
+        async def body():
+            nonlocal sent
+            async for chunk in _read_chunks(
+                file_path, chunk_size, self.policy.upload_read_ahead
+            ):
+                yield chunk
+                sent += len(chunk)
+                if progress:
+                    progress(
+                        UploadProgress(
+                            file_path, sent, total, time.perf_counter() - start
+                        )
+                    )
+
+        # The read timeout covers Alist storing the file after receiving it
+        timeout = aiohttp.ClientTimeout(
+            total=self.policy.upload_timeout,
+            sock_connect=self.policy.connect_timeout,
+        )
+        await self._api_call(
+            "PUT",
+            "api/fs/put",
+            custom_headers=headers,
+            idempotent=False,
+            data=body(),
+            timeout=timeout,
+        )
+        elapsed = time.perf_counter() - start
+        logger.debug(
+            f"Uploaded {file_path} ({total} bytes) in {elapsed:.1f}s, "
+            f"{total / elapsed / 1024 / 1024 if elapsed else 0:.2f}MiB/s"
+        )
+        self.invalidate_dir_cache(save_path)
         return True
 
+    async def upload_many(
+        self,
+        save_path: str,
+        file_paths: list[str],
+        progress: Optional[UploadProgressCallback] = None,
+        concurrency: Optional[int] = None,
+    ) -> list[bool]:
+        """Upload several local files to the same Alist dir.
+
+        Args:
+            save_path (str): Alist path
+            file_paths (list[str]): local file paths
+            progress (UploadProgressCallback, optional): Called after each chunk
+                of any file is sent
+            concurrency (int, optional): Max files uploading at the same time.
+                Defaults to policy.upload_concurrency.
+
+        Returns:
+            list[bool]: Whether each file is uploaded, failures are logged
+        """
+        semaphore = asyncio.Semaphore(concurrency or self.policy.upload_concurrency)
+
+        async def upload_one(file_path: str) -> bool:
+            async with semaphore:
+                try:
+                    return await self.upload(save_path, file_path, progress)
+                except Exception as e:
+                    logger.error(f"Failed to upload {file_path} to {save_path}: {e}")
+                    return False
+
+        return list(await asyncio.gather(*(upload_one(p) for p in file_paths)))
+
     async def list_dir(
         self, path, password=None, page=1, per_page=30, refresh=False
     ) -> list[str]:
@@ -133,6 +508,7 @@ class Alist:
         response_data = await self._api_call(
             "POST",
             "api/fs/list",
+            idempotent=True,
             json={
                 "path": path,
                 "password": password,
@@ -147,38 +523,123 @@ class Alist:
             files_list = []
         return files_list
 
+    async def iter_dir(
+        self, path, password=None, per_page=200, refresh=False
+    ) -> AsyncIterator[str]:
+        """Iterate over the names of all the files in a dir, page by page.
+
+        Args:
+            path (str): dir path
+            password (str, optional): dir's password. Defaults to None.
+            per_page (int, optional): how many item to fetch in one request.
+                Defaults to 200.
+            refresh (bool, optional): force to refresh. Defaults to False.
+        """
+        page = 1
+        fetched = 0
+        while True:
+            response_data = await self._api_call(
+                "POST",
+                "api/fs/list",
+                idempotent=True,
+                json={
+                    "path": path,
+                    "password": password,
+                    "page": page,
+                    "per_page": per_page,
+                    # Only refresh once, the other pages come from the new listing
+                    "refresh": refresh and page == 1,
+                },
+            )
+            content = response_data["content"] or []
+            for file_info in content:
+                yield file_info["name"]
+            fetched += len(content)
+            total = response_data.get("total")
+            if not content or len(content) < per_page:
+                break
+            if total is not None and fetched >= total:
+                break
+            page += 1
+
+    async def list_dir_all(self, path, password=None, use_cache=True) -> list[str]:
+        """List all the files in a dir, without the per_page limit.
+
+        The listing is cached until invalidate_dir_cache is called, or the dir
+        is changed by this client (upload, rename).
+
+        Args:
+            path (str): dir path
+            password (str, optional): dir's password. Defaults to None.
+            use_cache (bool, optional): Use the cached listing if any.
+                Defaults to True.
+        """
+        path = path.rstrip("/") or "/"
+        if use_cache and path in self._dir_cache:
+            return list(self._dir_cache[path])
+        files_list = [name async for name in self.iter_dir(path, password)]
+        self._dir_cache[path] = files_list
+        return list(files_list)
+
+    def invalidate_dir_cache(self, path: Optional[str] = None):
+        """Drop the cached listing of a dir, or of all the dirs if path is None"""
+        if path is None:
+            self._dir_cache.clear()
+        else:
+            self._dir_cache.pop(path.rstrip("/") or "/", None)
+
     async def _fetch_tasks(
-        self, task_type: AlistTaskType, status: str
+        self,
+        task_type: AlistTaskType,
+        status: str,
+        task_filter: Optional[Callable[[dict], bool]] = None,
     ) -> List[AlistTask]:
         json_data = await self._api_call("GET", f"/api/task/{task_type.value}/{status}")
+        if not json_data:
+            return []
 
         if task_type == AlistTaskType.TRANSFER:
             task_class = AlistTransferTask
         else:
             task_class = AlistDownloadTask
 
-        tasks = [task_class.from_json(task) for task in json_data] if json_data else []
-        return tasks
+        if task_filter is not None:
+            json_data = [task for task in json_data if task_filter(task)]
+        return [task_class.from_json(task) for task in json_data]
 
     async def get_task_list(
-        self, task_type: AlistTaskType, status: str = ""
+        self,
+        task_type: AlistTaskType,
+        status: str = "",
+        tids: Optional[Collection[str]] = None,
+        path_prefix: Optional[str] = None,
+        predicate: Optional[Callable[[dict], bool]] = None,
     ) -> List[AlistTask]:
         """
         Get Alist task list.
 
+        The filters are applied to the raw task json, so the skipped tasks are
+        never parsed.
+
         Args:
             task_type (TaskType):
             status (str): undone | done; If None, return all tasks. Defaults to None.
+            tids (Collection[str], optional): Only the tasks of these ids.
+            path_prefix (str, optional): Only the tasks whose target path
+                starts with it, the leading "/" is ignored.
+            predicate (Callable[[dict], bool], optional): Only the tasks whose
+                raw json matches it.
 
         Returns:
             TaskList: The list contains all query tasks.
         """
+        task_filter = build_task_filter(task_type, tids, path_prefix, predicate)
         if not status:
-            done_tasks = await self._fetch_tasks(task_type, "done")
-            undone_tasks = await self._fetch_tasks(task_type, "undone")
+            done_tasks = await self._fetch_tasks(task_type, "done", task_filter)
+            undone_tasks = await self._fetch_tasks(task_type, "undone", task_filter)
             return done_tasks + undone_tasks
         elif status.lower() in ["done", "undone"]:
-            return await self._fetch_tasks(task_type, status)
+            return await self._fetch_tasks(task_type, status, task_filter)
         else:
             raise ValueError("Unknown status when get task list.")
 
@@ -191,6 +652,27 @@ class Alist:
         )
         return True
 
+    async def batch_rename(self, src_dir: str, rename_pairs: list[tuple[str, str]]):
+        """Rename several files or dirs of a dir in one request.
+
+        Args:
+            src_dir (str): The absolute path of the parent dir of Alist
+            rename_pairs (list[tuple[str, str]]): [(old_name, new_name)], only
+                names, not include path.
+        """
+        await self._api_call(
+            "POST",
+            "api/fs/batch_rename",
+            json={
+                "src_dir": src_dir,
+                "rename_objects": [
+                    {"src_name": old_name, "new_name": new_name}
+                    for old_name, new_name in rename_pairs
+                ],
+            },
+        )
+        self.invalidate_dir_cache(src_dir)
+
     async def rename(self, path: str, new_name: str):
         """Rename a file or dir.
 
@@ -201,3 +683,4 @@ class Alist:
         await self._api_call(
             "POST", "api/fs/rename", json={"path": path, "name": new_name}
         )
+        self.invalidate_dir_cache(os.path.dirname(path))
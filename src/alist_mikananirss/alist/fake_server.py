@@ -0,0 +1,361 @@
+"""A fake Alist server for tests and benchmarks.
+
+It implements the part of the Alist api used by the client, and simulates the
+offline download -> transfer task lifecycle without any real downloader.
+
+Example:
+    >>> async with FakeAlistServer(FakeAlistOptions(download_time=0.1)) as server:
+    >>>     alist = Alist(server.base_url, server.token, AlistDownloaderType.QBIT)
+    >>>     await alist.add_offline_download_task("/Google/Anime", [url])
+"""
+
+import os
+import random
+import time
+import urllib.parse
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from aiohttp import web
+
+from alist_mikananirss.alist.tasks import AlistTaskState, AlistTaskType
+
+
+def default_file_name(url: str) -> str:
+    """[Fake] <btih or torrent file name>.mp4"""
+    if url.startswith("magnet:"):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+        stem = query.get("xt", ["unknown"])[0].rsplit(":", 1)[-1]
+    else:
+        stem = os.path.splitext(os.path.basename(urllib.parse.urlparse(url).path))[0]
+    return f"[Fake] {stem}.mp4"
+
+
+@dataclass
+class FakeAlistOptions:
+    # seconds
+    download_time: float = 0.5
+    transfer_time: float = 0.2
+    download_failure_rate: float = 0
+    transfer_failure_rate: float = 0
+    # Finished download and transfer tasks in the task lists at start
+    history_size: int = 0
+    token: str = "fake-token"
+    version: str = "v3.42.0"
+    temp_dir: str = "/opt/alist/data/temp/qBittorrent"
+    file_name: Callable[[str], str] = default_file_name
+    seed: Optional[int] = None
+
+
+@dataclass
+class _FakeTask:
+    tid: str
+    task_type: AlistTaskType
+    name: str
+    started: float
+    duration: float
+    fail: bool
+    start_time: datetime
+    total_bytes: int = 390419899
+    canceled: bool = False
+    # download task: (url, download_path), transfer task: (dirpath, filename)
+    payload: tuple = field(default_factory=tuple)
+    # Already finished when the server starts
+    history: bool = False
+
+    def state(self, now: float) -> AlistTaskState:
+        if self.canceled:
+            return AlistTaskState.Canceled
+        if now - self.started < self.duration:
+            return AlistTaskState.Running
+        return AlistTaskState.Failed if self.fail else AlistTaskState.Succeeded
+
+    def to_json(self, now: float) -> dict:
+        state = self.state(now)
+        done = state not in (AlistTaskState.Pending, AlistTaskState.Running)
+        progress = 100 if done else (now - self.started) / self.duration * 100
+        end_time = self.start_time + timedelta(seconds=self.duration)
+        status = ""
+        if self.task_type == AlistTaskType.DOWNLOAD:
+            status = "offline download completed" if done else "downloading"
+        return {
+            "id": self.tid,
+            "name": self.name,
+            "creator": "admin",
+            "creator_role": 2,
+            "state": state.value,
+            "status": status,
+            "progress": progress,
+            "start_time": self.start_time.isoformat().replace("+00:00", "Z"),
+            "end_time": end_time.isoformat().replace("+00:00", "Z") if done else None,
+            "total_bytes": self.total_bytes,
+            "error": "failed by fake alist" if state == AlistTaskState.Failed else "",
+        }
+
+
+class FakeAlistServer:
+    """In-memory Alist: offline download tasks, transfer tasks and a file tree.
+
+    The task states are computed from the time since the task started, so
+    nothing runs in the background. `requests` counts the requests of each
+    endpoint.
+    """
+
+    def __init__(self, options: Optional[FakeAlistOptions] = None):
+        self.options = options or FakeAlistOptions()
+        self.token = self.options.token
+        self.random = random.Random(self.options.seed)
+        self.tasks: dict[AlistTaskType, dict[str, _FakeTask]] = {
+            AlistTaskType.DOWNLOAD: {},
+            AlistTaskType.TRANSFER: {},
+        }
+        # dir path -> {file name: size}
+        self.files: dict[str, dict[str, int]] = {}
+        # Tasks not moved on yet, see advance
+        self._active: dict[str, _FakeTask] = {}
+        self.requests: Counter = Counter()
+        self._task_count = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url: Optional[str] = None
+        self._fill_history(self.options.history_size)
+
+    # ---- simulation ----
+
+    def _new_tid(self) -> str:
+        self._task_count += 1
+        return f"fake{self._task_count:08d}"
+
+    @staticmethod
+    def _split_drive(path: str) -> tuple[str, str]:
+        """/Google/Anime/X -> (/Google, /Anime/X)"""
+        parts = path.strip("/").split("/", 1)
+        return "/" + parts[0], "/" + (parts[1] if len(parts) > 1 else "")
+
+    def _add_task(self, task: _FakeTask) -> _FakeTask:
+        self.tasks[task.task_type][task.tid] = task
+        self._active[task.tid] = task
+        return task
+
+    def _add_download_task(
+        self,
+        url: str,
+        download_path: str,
+        start_time: datetime,
+        history: bool = False,
+    ) -> _FakeTask:
+        return self._add_task(
+            _FakeTask(
+                tid=self._new_tid(),
+                task_type=AlistTaskType.DOWNLOAD,
+                name=f"download {url} to ({download_path})",
+                started=float("-inf") if history else time.monotonic(),
+                duration=self.options.download_time,
+                fail=not history
+                and self.random.random() < self.options.download_failure_rate,
+                start_time=start_time,
+                payload=(url, download_path),
+                history=history,
+            )
+        )
+
+    def _add_transfer_task(self, download_task: _FakeTask) -> _FakeTask:
+        url, download_path = download_task.payload
+        file_name = self.options.file_name(url)
+        drive, subdir = self._split_drive(download_path)
+        temp_path = f"{self.options.temp_dir}/{uuid.uuid4()}/{file_name}"
+        return self._add_task(
+            _FakeTask(
+                tid=self._new_tid(),
+                task_type=AlistTaskType.TRANSFER,
+                name=f"transfer [](/{temp_path.lstrip('/')}) to [{drive}]({subdir})",
+                started=download_task.started + download_task.duration,
+                duration=self.options.transfer_time,
+                fail=not download_task.history
+                and self.random.random() < self.options.transfer_failure_rate,
+                start_time=download_task.start_time
+                + timedelta(seconds=download_task.duration + 0.001),
+                payload=(download_path.rstrip("/") or "/", file_name),
+                history=download_task.history,
+            )
+        )
+
+    def _fill_history(self, size: int):
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        for i in range(size // 2):
+            self._add_download_task(
+                f"magnet:?xt=urn:btih:{i:040x}",
+                f"/Google/Anime/History {i}/Season 1",
+                start + timedelta(minutes=i),
+                history=True,
+            )
+        self.advance()
+
+    def advance(self, now: Optional[float] = None):
+        """Move the finished downloads to transfer, and the finished transfers
+        to the file tree"""
+        now = time.monotonic() if now is None else now
+        tasks = list(self._active.values())
+        while tasks:
+            new_tasks = []
+            for task in tasks:
+                state = task.state(now)
+                if state == AlistTaskState.Running:
+                    continue
+                del self._active[task.tid]
+                if state != AlistTaskState.Succeeded:
+                    continue
+                if task.task_type == AlistTaskType.DOWNLOAD:
+                    new_tasks.append(self._add_transfer_task(task))
+                else:
+                    dirpath, file_name = task.payload
+                    self.files.setdefault(dirpath, {})[file_name] = task.total_bytes
+            # The transfers may be finished already
+            tasks = new_tasks
+
+    # ---- http ----
+
+    @staticmethod
+    def _ok(data=None) -> web.Response:
+        return web.json_response({"code": 200, "message": "success", "data": data})
+
+    @staticmethod
+    def _error(code: int, message: str) -> web.Response:
+        return web.json_response({"code": code, "message": message, "data": None})
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        resource = request.match_info.route.resource
+        self.requests[resource.canonical if resource else request.path] += 1
+        if (
+            request.path != "/api/public/settings"
+            and request.headers.get("Authorization") != self.token
+        ):
+            return self._error(401, "token is invalidated")
+        self.advance()
+        try:
+            return await handler(request)
+        except (KeyError, ValueError) as e:
+            return self._error(400, f"Bad request: {e}")
+
+    async def _settings(self, request: web.Request):
+        return self._ok({"version": self.options.version})
+
+    async def _add_offline_download(self, request: web.Request):
+        data = await request.json()
+        start_time = datetime.now(timezone.utc)
+        tasks = [
+            self._add_download_task(url, data["path"], start_time)
+            for url in data["urls"]
+        ]
+        now = time.monotonic()
+        return self._ok({"tasks": [task.to_json(now) for task in tasks]})
+
+    async def _task_list(self, request: web.Request):
+        task_type = AlistTaskType(request.match_info["task_type"])
+        want_done = request.match_info["status"] == "done"
+        now = time.monotonic()
+        data = []
+        for task in self.tasks[task_type].values():
+            done = task.state(now) not in (
+                AlistTaskState.Pending,
+                AlistTaskState.Running,
+            )
+            if done == want_done:
+                data.append(task.to_json(now))
+        return self._ok(data)
+
+    async def _cancel_task(self, request: web.Request):
+        task_type = AlistTaskType(request.match_info["task_type"])
+        task = self.tasks[task_type].get(request.query["tid"])
+        if task is None:
+            return self._error(500, "task not found")
+        task.canceled = True
+        return self._ok()
+
+    async def _list(self, request: web.Request):
+        data = await request.json()
+        path = data["path"].rstrip("/") or "/"
+        if path not in self.files:
+            return self._error(500, "object not found")
+        names = sorted(self.files[path])
+        page = data.get("page") or 1
+        per_page = data.get("per_page") or 0
+        if per_page > 0:
+            names = names[(page - 1) * per_page : page * per_page]
+        content = [
+            {"name": name, "size": self.files[path][name], "is_dir": False}
+            for name in names
+        ]
+        return self._ok({"content": content, "total": len(self.files[path])})
+
+    def _rename_file(self, dirpath: str, old_name: str, new_name: str):
+        dirpath = dirpath.rstrip("/") or "/"
+        files = self.files.get(dirpath, {})
+        if old_name not in files:
+            raise KeyError(f"{dirpath}/{old_name} not found")
+        files[new_name] = files.pop(old_name)
+
+    async def _rename(self, request: web.Request):
+        data = await request.json()
+        self._rename_file(
+            os.path.dirname(data["path"]), os.path.basename(data["path"]), data["name"]
+        )
+        return self._ok()
+
+    async def _batch_rename(self, request: web.Request):
+        data = await request.json()
+        for obj in data["rename_objects"]:
+            self._rename_file(data["src_dir"], obj["src_name"], obj["new_name"])
+        return self._ok()
+
+    async def _put(self, request: web.Request):
+        file_path = urllib.parse.unquote(request.headers["file-path"])
+        size = 0
+        async for chunk in request.content.iter_chunked(1024 * 1024):
+            size += len(chunk)
+        dirpath = os.path.dirname(file_path).rstrip("/") or "/"
+        self.files.setdefault(dirpath, {})[os.path.basename(file_path)] = size
+        return self._ok()
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get("/api/public/settings", self._settings)
+        app.router.add_post("/api/fs/add_offline_download", self._add_offline_download)
+        app.router.add_get(
+            "/api/task/{task_type}/{status:(done|undone)}", self._task_list
+        )
+        app.router.add_post("/api/task/{task_type}/cancel", self._cancel_task)
+        app.router.add_post("/api/fs/list", self._list)
+        app.router.add_post("/api/fs/rename", self._rename)
+        app.router.add_post("/api/fs/batch_rename", self._batch_rename)
+        app.router.add_put("/api/fs/put", self._put)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving, port 0 to pick a free one
+
+        Returns:
+            str: The base url of the server
+        """
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}/"
+        return self.base_url
+
+    async def close(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "FakeAlistServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -2,9 +2,10 @@ from __future__ import annotations
 
 import re
 from abc import ABC
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from datetime import datetime
 from enum import Enum
+from typing import Optional
 
 
 # https://github.com/alist-org/alist/blob/86b35ae5cfec400871072356fec4dea88303195d/pkg/task/task.go#L27
@@ -61,7 +62,45 @@ class InvalidTaskDescription(AlistTaskError):
     """Raised when task description is invalid."""
 
 
-@dataclass
+def parse_task_time(value: Optional[str]) -> Optional[datetime]:
+    """Parse the time of Alist task, e.g. 2025-07-11T07:48:41.4354376Z
+
+    The timezone is dropped, like the task times were always handled.
+    """
+    if not value:
+        return None
+    try:
+        # Fast path, Alist uses RFC 3339 with up to 9 fractional digits, only
+        # 6 of them are supported by datetime
+        dt = datetime.fromisoformat(value[:26])
+    except ValueError:
+        dt = datetime.fromisoformat(value)
+    return dt.replace(tzinfo=None) if dt.tzinfo else dt
+
+
+def raw_task_target_path(task_type: AlistTaskType, name: str) -> Optional[str]:
+    """Get the target path from a task description without the regex parsing
+
+    Download tasks: the path to download to.
+    Transfer tasks: the target directory.
+    """
+    if task_type == AlistTaskType.DOWNLOAD:
+        # download {url} to ({download_path})
+        _, sep, path = name.rpartition(" to (")
+        return path[:-1] if sep and path.endswith(")") else None
+    # transfer [](tmp file) to [{drive}]({subdir})
+    _, sep, target = name.rpartition(") to [")
+    drive, sep2, subdir = target.partition("](")
+    if not sep or not sep2 or not subdir.endswith(")"):
+        return None
+    return f"{drive}{subdir[:-1]}"
+
+
+_CREATOR_ROLES = {role.value: role for role in CreatorRole}
+_TASK_STATES = {state.value: state for state in AlistTaskState}
+
+
+@dataclass(slots=True)
 class AlistTask(ABC):
     """Alist offical task object.
     refer to: https://alist.nn.ci/zh/guide/api/task.html#%E8%BF%94%E5%9B%9E%E7%BB%93%E6%9E%9C
@@ -84,56 +123,43 @@ class AlistTask(ABC):
     @classmethod
     def from_json(cls, json_data: dict) -> "AlistTask":
         """Creates an AlistTask instance from a JSON dictionary."""
-        creator = json_data["creator"]
-        creator_role = CreatorRole(json_data["creator_role"])
-        end_time = (
-            datetime.strptime(json_data["end_time"][:26] + "Z", "%Y-%m-%dT%H:%M:%S.%fZ")
-            if json_data["end_time"]
-            else None
-        )
-        error = json_data["error"]
-        tid = json_data["id"]
-        name = json_data["name"]
-        progress = json_data["progress"]
-        start_time = (
-            datetime.strptime(
-                json_data["start_time"][:26] + "Z", "%Y-%m-%dT%H:%M:%S.%fZ"
-            )
-            if json_data["start_time"]
-            else None
-        )
-        state = AlistTaskState(json_data["state"])
-        status = json_data["status"]
-        total_bytes = json_data["total_bytes"]
-
         return cls(
-            creator=creator,
-            creator_role=creator_role,
-            end_time=end_time,
-            error=error,
-            tid=tid,
-            name=name,
-            progress=progress,
-            start_time=start_time,
-            state=state,
-            status=status,
-            total_bytes=total_bytes,
+            creator=json_data["creator"],
+            creator_role=_CREATOR_ROLES.get(json_data["creator_role"])
+            or CreatorRole(json_data["creator_role"]),
+            end_time=parse_task_time(json_data["end_time"]),
+            error=json_data["error"],
+            tid=json_data["id"],
+            name=json_data["name"],
+            progress=json_data["progress"],
+            start_time=parse_task_time(json_data["start_time"]),
+            state=_TASK_STATES.get(json_data["state"])
+            or AlistTaskState(json_data["state"]),
+            status=json_data["status"],
+            total_bytes=json_data["total_bytes"],
         )
 
+    def update_from(self, other: "AlistTask"):
+        """Update the task with a newer copy of it"""
+        for f in fields(self):
+            setattr(self, f.name, getattr(other, f.name))
+
     def __hash__(self):
         return hash(self.tid)
 
 
-@dataclass
+@dataclass(slots=True)
 class AlistTransferTask(AlistTask):
-    """Parsed some neccesary information for transfer task from AlistTask object."""
+    """Parsed some neccesary information for transfer task from AlistTask object.
+
+    The description is parsed on the first access of uuid or target_path.
+    """
 
-    uuid: str = field(init=False)  # local temp directory uuid
-    target_path: str = field(init=False)  # transfer target filepath
     task_type: AlistTaskType = field(default=AlistTaskType.TRANSFER, init=False)
+    _uuid: Optional[str] = field(default=None, init=False, repr=False)
+    _target_path: Optional[str] = field(default=None, init=False, repr=False)
 
-    def __post_init__(self):
-        self.task_type = AlistTaskType.TRANSFER
+    def _parse_description(self):
         match = re.match(TRANSFER_DES_PATTERN, self.name)
         if match:
             # case exmaple:
@@ -157,30 +183,36 @@ class AlistTransferTask(AlistTask):
             raise InvalidTaskDescription(
                 f"Failed to get uuid and target filepath from task description: {self.name}"
             )
-        self.uuid = uuid
-        self.target_path = target_file_path
+        self._uuid = uuid
+        self._target_path = target_file_path
+
+    @property
+    def uuid(self) -> str:
+        """local temp directory uuid"""
+        if self._uuid is None:
+            self._parse_description()
+        return self._uuid
+
+    @property
+    def target_path(self) -> str:
+        """transfer target filepath"""
+        if self._target_path is None:
+            self._parse_description()
+        return self._target_path
 
     def __hash__(self):
         return hash(self.tid)
 
 
-@dataclass
+@dataclass(slots=True)
 class AlistDownloadTask(AlistTask):
-    url: str = field(init=False)  # download url
-    download_path: str = field(init=False)  # The target path in Alist to download to
+    """The description is parsed on the first access of url or download_path."""
+
     task_type: AlistTaskType = field(default=AlistTaskType.DOWNLOAD, init=False)
+    _url: Optional[str] = field(default=None, init=False, repr=False)
+    _download_path: Optional[str] = field(default=None, init=False, repr=False)
 
     def __post_init__(self):
-        match = re.match(DOWNLOAD_DES_PATTERN, self.name)
-        if match:
-            url = match.group(1)
-            download_path = match.group(2)
-            self.url = url
-            self.download_path = download_path
-        else:
-            raise InvalidTaskDescription(
-                f"Failed to get url and download path from task description: {self.name}"
-            )
         # If seeding, the task status will still be Running
         # We need to change it to Succeeded manually to ensure the task is marked as completed
         if (
@@ -189,6 +221,30 @@ class AlistDownloadTask(AlistTask):
         ):
             self.state = AlistTaskState.Succeeded
 
+    def _parse_description(self):
+        match = re.match(DOWNLOAD_DES_PATTERN, self.name)
+        if match:
+            self._url = match.group(1)
+            self._download_path = match.group(2)
+        else:
+            raise InvalidTaskDescription(
+                f"Failed to get url and download path from task description: {self.name}"
+            )
+
+    @property
+    def url(self) -> str:
+        """download url"""
+        if self._url is None:
+            self._parse_description()
+        return self._url
+
+    @property
+    def download_path(self) -> str:
+        """The target path in Alist to download to"""
+        if self._download_path is None:
+            self._parse_description()
+        return self._download_path
+
     def __hash__(self):
         return hash(self.tid)
 
@@ -1,4 +1,4 @@
-from .bot_base import BotBase, BotFactory, BotType
+from .bot_base import BotBase, BotFactory, BotType, close_session, get_session
 from .notificationbot import NotificationBot, NotificationMsg
 from .pushplus_bot import PushPlusBot, PushPlusChannel
 from .tgbot import TelegramBot
@@ -1,5 +1,9 @@
+import asyncio
 from abc import ABC, abstractmethod
 from enum import Enum
+from typing import Optional
+
+import aiohttp
 
 
 class BotType(Enum):
@@ -7,10 +11,47 @@ class BotType(Enum):
     PUSHPLUS = "pushplus"
 
 
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """The HTTP session shared by the bots, created on first use
+
+    Must be called in the event loop, a new session is created if the loop
+    changed (e.g. a new asyncio.run).
+    """
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _session = aiohttp.ClientSession(trust_env=True)
+        _session_loop = loop
+    return _session
+
+
+async def close_session():
+    global _session, _session_loop
+    if _session is not None and _session_loop is asyncio.get_running_loop():
+        await _session.close()
+    _session = None
+    _session_loop = None
+
+
 class BotBase(ABC):
+    # Longest message the service accepts, longer ones are split
+    max_message_length: int = 4096
+    # Messages per second, and how many can be sent at once
+    rate: float = 1.0
+    burst: int = 1
+
     def __init__(self) -> None:
         super().__init__()
 
+    @property
+    def identity(self) -> str:
+        """What the messages are sent to (token, chat...), same across restarts"""
+        return ""
+
     @abstractmethod
     async def send_message(self, message: str) -> bool:
         raise NotImplementedError
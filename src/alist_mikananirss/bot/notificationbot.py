@@ -1,3 +1,8 @@
+import hashlib
+import html
+from typing import Optional
+
+from alist_mikananirss.utils.ratelimit import TokenBucket
 from alist_mikananirss.websites.models import ResourceInfo
 
 from . import BotBase
@@ -9,22 +14,30 @@ class NotificationMsg:
     def __init__(self) -> None:
         self._update_info: dict[str, list] = {}
         self.msg = None
+        # Titles longer than this are cut, set by split()
+        self._max_title_length: Optional[int] = None
+
+    def _format_title(self, title: str) -> str:
+        limit = self._max_title_length
+        if limit is not None and len(title) > limit:
+            title = title[:limit] + "…"
+        return html.escape(title, quote=False)
 
     def format_message(self):
         if not self._update_info:
             return "暂无番剧更新"
 
-        msg = "你订阅的番剧"
-        for name, titles in self._update_info.items():
-            msg += f"<b>[{name}]</b>, "
-        msg = msg.rstrip(", ") + " 更新啦：\n"
-
+        # The bots send html, the names and titles are escaped
+        escaped_names = {
+            name: html.escape(str(name), quote=False) for name in self._update_info
+        }
+        names = ", ".join(f"<b>[{name}]</b>" for name in escaped_names.values())
+        parts = [f"你订阅的番剧{names} 更新啦：\n"]
         for name, titles in self._update_info.items():
-            msg += f"<b>[{name}]</b>:\n"
-            for title in titles:
-                msg += f"{title}\n"
-            msg += "\n"
-        return msg
+            parts.append(f"<b>[{escaped_names[name]}]</b>:\n")
+            parts.extend(f"{self._format_title(title)}\n" for title in titles)
+            parts.append("\n")
+        return "".join(parts)
 
     def __bool__(self):
         return bool(self._update_info)
@@ -62,10 +75,79 @@ class NotificationMsg:
             msg.update(resource.anime_name, [resource.resource_title])
         return msg
 
+    def titles(self) -> list[str]:
+        """The resource titles of the message"""
+        return [title for titles in self._update_info.values() for title in titles]
+
+    def split(self, max_length: int) -> list["NotificationMsg"]:
+        """Split the message into messages of at most max_length characters
+
+        The titles are packed in order, each message has its own header. A
+        title too long for a message of its own is cut, outside of the markup.
+        """
+        if len(str(self)) <= max_length:
+            return [self]
+        parts: list[NotificationMsg] = []
+        part = NotificationMsg()
+        for name, titles in self._update_info.items():
+            for title in titles:
+                part.update(name, [title])
+                if len(str(part)) <= max_length:
+                    continue
+                if len(part.titles()) > 1:
+                    # Doesn't fit, start a new message with it
+                    part._update_info[name].pop()
+                    if not part._update_info[name]:
+                        del part._update_info[name]
+                    part.msg = None
+                    parts.append(part)
+                    part = NotificationMsg()
+                    part.update(name, [title])
+                if len(str(part)) > max_length:
+                    part._shorten_title(title, max_length)
+                    parts.append(part)
+                    part = NotificationMsg()
+        if part:
+            parts.append(part)
+        return parts
+
+    def _shorten_title(self, title: str, max_length: int):
+        """Cut the only title of the message until the message fits"""
+        if len(str(self)) <= max_length:
+            return
+        # Escaping makes the title longer, search the longest cut that fits
+        low, high = 0, len(title) - 1
+        while low < high:
+            limit = (low + high + 1) // 2
+            self._max_title_length = limit
+            self.msg = None
+            if len(str(self)) <= max_length:
+                low = limit
+            else:
+                high = limit - 1
+        self._max_title_length = low
+        self.msg = None
+
 
 class NotificationBot:
     def __init__(self, bot_handler: BotBase):
         self.bot = bot_handler
+        self.rate_limiter = TokenBucket(bot_handler.rate, bot_handler.burst)
+
+    @property
+    def name(self) -> str:
+        return type(self.bot).__name__
+
+    @property
+    def key(self) -> str:
+        """Stable id of the bot, kept when the bots are reordered in the config"""
+        digest = hashlib.sha256(self.bot.identity.encode("utf-8")).hexdigest()
+        return f"{self.name}:{digest[:12]}"
+
+    @property
+    def max_message_length(self) -> int:
+        return self.bot.max_message_length
 
     async def send_message(self, msg: NotificationMsg):
+        await self.rate_limiter.acquire()
         return await self.bot.send_message(str(msg))
@@ -2,7 +2,7 @@ from enum import Enum
 
 import aiohttp
 
-from . import BotBase
+from .bot_base import BotBase, get_session
 
 
 class PushPlusChannel(Enum):
@@ -13,6 +13,11 @@ class PushPlusChannel(Enum):
 
 
 class PushPlusBot(BotBase):
+    # PushPlus limits the content length and the requests per minute
+    max_message_length = 10000
+    rate = 0.2
+    burst = 1
+
     def __init__(self, user_token, channel=None) -> None:
         self.user_token = user_token
         if channel:
@@ -23,6 +28,10 @@ class PushPlusBot(BotBase):
         else:
             self.channel = PushPlusChannel.WECHAT
 
+    @property
+    def identity(self) -> str:
+        return f"{self.user_token}:{self.channel.value}"
+
     async def send_message(self, message: str) -> bool:
         api_url = f"http://www.pushplus.plus/send/{self.user_token}"
         body = {
@@ -31,18 +40,17 @@ class PushPlusBot(BotBase):
             "channel": self.channel.value,
             "template": "html",
         }
-        async with aiohttp.ClientSession(trust_env=True) as session:
-            async with session.post(api_url, json=body) as response:
-                response.raise_for_status()
-                data = await response.json()
-                if data["code"] != 200:
-                    error_code = data["code"]
-                    error_message = data.get("message") or "Unknown error"
-                    full_error_message = f"Error {error_code}: {error_message}"
-                    raise aiohttp.ClientResponseError(
-                        response.request_info,
-                        response.history,
-                        status=data["code"],
-                        message=full_error_message,
-                    )
+        async with get_session().post(api_url, json=body) as response:
+            response.raise_for_status()
+            data = await response.json()
+            if data["code"] != 200:
+                error_code = data["code"]
+                error_message = data.get("message") or "Unknown error"
+                full_error_message = f"Error {error_code}: {error_message}"
+                raise aiohttp.ClientResponseError(
+                    response.request_info,
+                    response.history,
+                    status=data["code"],
+                    message=full_error_message,
+                )
         return True
@@ -1,19 +1,26 @@
-import aiohttp
-
-from . import BotBase
+from .bot_base import BotBase, get_session
 
 
 class TelegramBot(BotBase):
+    # Telegram limits: 4096 characters per message, about 1 message per second
+    # in a chat
+    max_message_length = 4096
+    rate = 1.0
+    burst = 3
+
     def __init__(self, bot_token, user_id) -> None:
         self.bot_token = bot_token
         self.user_id = user_id
         self.support_markdown = True
 
+    @property
+    def identity(self) -> str:
+        return f"{self.bot_token}:{self.user_id}"
+
     async def send_message(self, message: str) -> bool:
         """Send message via Telegram"""
         api_url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
         body = {"chat_id": self.user_id, "text": message, "parse_mode": "HTML"}
-        async with aiohttp.ClientSession(trust_env=True) as session:
-            async with session.post(api_url, json=body) as response:
-                response.raise_for_status()
+        async with get_session().post(api_url, json=body) as response:
+            response.raise_for_status()
         return True
@@ -4,6 +4,7 @@ from typing import Annotated, Dict, List
 from pydantic import BaseModel, Field, HttpUrl, field_validator, model_validator
 
 from alist_mikananirss.alist import AlistDownloaderType
+from alist_mikananirss.websites.models import VideoQuality
 
 from .bot_assistant import TelegramBotAssistantConfig
 from .extractor import ExtractorConfig
@@ -11,6 +12,39 @@ from .notifier import PushPlusConfig, TelegramConfig
 from .remap import RemapConfig
 
 
+class PipelineConfig(BaseModel):
+    fetch_workers: int = Field(default=4, gt=0, description="Feeds fetched in parallel")
+    extract_workers: int = Field(
+        default=8, gt=0, description="Entries extracted in parallel"
+    )
+    queue_size: int = Field(default=100, gt=0, description="Size of each stage queue")
+    submit_batch_size: int = Field(
+        default=20, gt=0, description="Max resources submitted to Alist at once"
+    )
+
+
+class AdaptivePollingConfig(BaseModel):
+    enable: bool = Field(default=False)
+    min_interval: int = Field(
+        default=120, gt=0, description="Poll interval around expected releases"
+    )
+    max_interval: int = Field(
+        default=3600, gt=0, description="Max poll interval of quiet feeds"
+    )
+    window: int = Field(
+        default=3600, ge=0, description="Seconds around expected releases"
+    )
+    state_path: str = Field(
+        default="data/poll_schedule.json", description="File to persist the schedule"
+    )
+
+    @model_validator(mode="after")
+    def validate_intervals(self):
+        if self.min_interval > self.max_interval:
+            raise ValueError("min_interval should not be greater than max_interval")
+        return self
+
+
 class CommonConfig(BaseModel):
     interval_time: int = Field(
         default=300, ge=0, description="Interval time must be non-negative"
@@ -18,6 +52,44 @@ class CommonConfig(BaseModel):
     proxies: Dict[str, str] = Field(
         default_factory=dict, description="Proxies for requests"
     )
+    pipeline: PipelineConfig = Field(
+        default_factory=PipelineConfig, description="RSS processing pipeline"
+    )
+    dedupe_by_info_hash: bool = Field(
+        default=True,
+        description="Skip the resources whose torrent is already downloaded from another feed",
+    )
+    adaptive_polling: AdaptivePollingConfig = Field(
+        default_factory=AdaptivePollingConfig,
+        description="Poll each feed by its release cadence instead of interval_time",
+    )
+
+
+class AlistClientConfig(BaseModel):
+    connect_timeout: float = Field(default=10, gt=0)
+    read_timeout: float = Field(default=30, gt=0)
+    total_timeout: float = Field(default=60, gt=0)
+    max_retries: int = Field(default=3, ge=0, description="Retries of failed requests")
+    breaker_threshold: int = Field(
+        default=5, gt=0, description="Failures in a row to pause the requests"
+    )
+    breaker_reset_time: float = Field(
+        default=30, gt=0, description="Seconds to pause the requests"
+    )
+    connection_limit: int = Field(default=10, gt=0)
+    keepalive_timeout: float = Field(default=60, gt=0)
+    upload_chunk_size: int = Field(
+        default=1024 * 1024, gt=0, description="Bytes read from disk at a time"
+    )
+    upload_read_ahead: int = Field(
+        default=4, gt=0, description="Max chunks buffered of each upload"
+    )
+    upload_concurrency: int = Field(
+        default=2, gt=0, description="Max files uploading at the same time"
+    )
+    upload_timeout: float | None = Field(
+        default=None, gt=0, description="Timeout of a whole upload, none for no limit"
+    )
 
 
 class AlistConfig(BaseModel):
@@ -27,6 +99,10 @@ class AlistConfig(BaseModel):
         default=AlistDownloaderType.QBIT, description="Alist Downloader type"
     )
     download_path: str = Field(..., description="Download path for Alist Downloader")
+    client: AlistClientConfig = Field(
+        default_factory=AlistClientConfig,
+        description="Timeouts, retries and connection limits of Alist requests",
+    )
 
     @field_validator("base_url")
     @classmethod
@@ -39,22 +115,85 @@ class AlistConfig(BaseModel):
             raise ValueError(f"Invalid URL: {url}")
 
 
+class SubscriptionConfig(BaseModel):
+    url: str = Field(..., description="RSS url of the subscription")
+    filters: List[str] | None = Field(
+        default=None,
+        description="Filters of this subscription, replace the global filters if set",
+    )
+    fansub_include: List[str] = Field(
+        default_factory=list, description="Only download resources of these fansubs"
+    )
+    fansub_exclude: List[str] = Field(
+        default_factory=list, description="Never download resources of these fansubs"
+    )
+    qualities: List[VideoQuality] = Field(
+        default_factory=list, description="Accepted video qualities"
+    )
+
+    @field_validator("url")
+    @classmethod
+    def validate_url(cls, url: str) -> str:
+        HttpUrl(url)
+        return url
+
+
+class SelectionConfig(BaseModel):
+    enable: bool = Field(default=False)
+    window: int = Field(
+        default=1800, ge=0, description="Seconds to wait for other releases"
+    )
+    fansubs: List[str] = Field(
+        default_factory=list, description="Preferred fansubs, the best first"
+    )
+    qualities: List[VideoQuality] = Field(
+        default_factory=lambda: [
+            VideoQuality.p2160,
+            VideoQuality.p1080,
+            VideoQuality.p720,
+        ],
+        description="Preferred qualities, the best first",
+    )
+    languages: List[str] = Field(
+        default_factory=lambda: ["简", "繁", "日"],
+        description="Preferred languages, the best first",
+    )
+
+
 class MikanConfig(BaseModel):
-    subscribe_url: List[str] = Field(min_length=1)
+    subscribe_url: List[str | SubscriptionConfig] = Field(min_length=1)
     regex_pattern: Dict[str, str] = Field(
         default_factory=dict,
         description="Regex pattern for filter",
     )
 
-    filters: List[str] = Field(default_factory=list, description="Filters for rss")
+    filters: List[str] = Field(
+        default_factory=list,
+        description="Filters for rss, pattern names or expressions like '简体 | 繁体'",
+    )
+    selection: SelectionConfig = Field(
+        default_factory=SelectionConfig,
+        description="Download only the best release of each episode",
+    )
 
     @field_validator("subscribe_url")
     @classmethod
-    def validate_url(cls, url: List[str]) -> List[str]:
+    def validate_url(
+        cls, url: List[str | SubscriptionConfig]
+    ) -> List[str | SubscriptionConfig]:
         for u in url:
-            HttpUrl(u)
+            if isinstance(u, str):
+                HttpUrl(u)
         return url
 
+    @property
+    def subscriptions(self) -> List[SubscriptionConfig]:
+        """All subscriptions, plain urls are converted to SubscriptionConfig"""
+        return [
+            SubscriptionConfig(url=u) if isinstance(u, str) else u
+            for u in self.subscribe_url
+        ]
+
     @field_validator("regex_pattern")
     @classmethod
     def merge_regex_patterns(cls, patterns: Dict[str, str]) -> Dict[str, str]:
@@ -74,6 +213,11 @@ class RenameConfig(BaseModel):
     rename_format: str = Field(
         "{name} S{season:02d}E{episode:02d}", description="Rename format"
     )
+    batch_window: float = Field(
+        default=3,
+        ge=0,
+        description="Seconds to collect the files of a dir and rename them at once",
+    )
     remap: RemapConfig = Field(
         default_factory=RemapConfig, description="Remap configuration"
     )
@@ -130,6 +274,10 @@ class NotificationConfig(BaseModel):
 class BotAssistantConfig(BaseModel):
     enable: bool = Field(default=False)
     bots: List[TelegramBotAssistantConfig] = Field(default_factory=list)
+    job_workers: int = Field(
+        default=1, ge=1, description="/d jobs run at the same time"
+    )
+    job_queue_size: int = Field(default=20, ge=1, description="/d jobs waiting at most")
 
     @model_validator(mode="after")
     def validate_bot_assistant_config(self):
@@ -138,7 +286,36 @@ class BotAssistantConfig(BaseModel):
         return self
 
 
+class MetricsConfig(BaseModel):
+    enable: bool = Field(default=False)
+    host: str = Field(default="127.0.0.1", description="Address of the endpoint")
+    port: int = Field(default=9108, ge=0, le=65535)
+
+
+class TracingConfig(BaseModel):
+    enable: bool = Field(default=False)
+    path: str = Field(
+        default="data/traces.jsonl", description="Trace log of the resources"
+    )
+    max_bytes: int = Field(
+        default=10 * 1024 * 1024, gt=0, description="Rotate the trace log at this size"
+    )
+    backup_count: int = Field(default=3, ge=0, description="Rotated trace logs kept")
+
+
 class DevConfig(BaseModel):
     log_level: str = Field(
         default="INFO", pattern="^(DEBUG|INFO|WARNING|ERROR|CRITICAL)$"
     )
+    log_enqueue: bool = Field(
+        default=True,
+        description="Write the logs in a background thread, not in the event loop",
+    )
+    metrics: MetricsConfig = Field(
+        default_factory=MetricsConfig,
+        description="Serve the metrics in Prometheus text format on /metrics",
+    )
+    tracing: TracingConfig = Field(
+        default_factory=TracingConfig,
+        description="Trace the stage timings of each resource",
+    )
@@ -15,6 +15,9 @@ class OpenAIConfig(BaseModel):
     output_type: PromptType = Field(
         PromptType.JSON_OBJECT, description="Structure output type for OpenAI API"
     )
+    record_path: str | None = Field(
+        None, description="Record the LLM responses to this jsonl file for replay"
+    )
 
 
 class DeepSeekConfig(BaseModel):
@@ -27,6 +30,9 @@ class DeepSeekConfig(BaseModel):
     output_type: PromptType = Field(
         PromptType.JSON_OBJECT, description="Structure output type for DeepSeek API"
     )
+    record_path: str | None = Field(
+        None, description="Record the LLM responses to this jsonl file for replay"
+    )
 
 
 class GoogleConfig(BaseModel):
@@ -34,8 +40,24 @@ class GoogleConfig(BaseModel):
     api_key: str = Field(..., description="Google API key")
     model: str = Field("gemini-2.0-flash")
     output_type: PromptType = Field(PromptType.JSON_SCHEMA)
+    record_path: str | None = Field(
+        None, description="Record the LLM responses to this jsonl file for replay"
+    )
+
+
+class ReplayConfig(BaseModel):
+    """Replay the responses recorded with record_path, without any api call"""
+
+    extractor_type: Literal["replay"]
+    record_path: str = Field(..., description="The jsonl file of recorded responses")
+    latency: float = Field(0, description="Simulated latency of each call in seconds")
+    latency_jitter: float = Field(0, description="Random extra latency in seconds")
+    error_rate: float = Field(0, description="Ratio of calls failing on purpose")
+    seed: int | None = Field(None, description="Random seed of latency and errors")
+    output_type: PromptType = Field(PromptType.JSON_OBJECT)
 
 
 ExtractorConfig = Annotated[
-    OpenAIConfig | DeepSeekConfig | GoogleConfig, Field(discriminator="extractor_type")
+    OpenAIConfig | DeepSeekConfig | GoogleConfig | ReplayConfig,
+    Field(discriminator="extractor_type"),
 ]
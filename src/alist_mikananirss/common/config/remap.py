@@ -7,3 +7,9 @@ class RemapConfig(BaseModel):
         default="./remap.yaml",
         description="Path to the remap configuration file",
     )
+    hot_reload: bool = Field(
+        default=True, description="Reload the remap file when it is modified"
+    )
+    reload_interval: int = Field(
+        default=10, gt=0, description="Interval time to check the remap file"
+    )
@@ -1,14 +1,32 @@
+import dataclasses
+import json
 import os
+import re
 from datetime import datetime
 
 import aiosqlite
 from loguru import logger
 
-from alist_mikananirss.websites.models import ResourceInfo
+from alist_mikananirss.websites.models import ResourceInfo, VideoQuality
 
 db_dirpath = "data"
 os.makedirs(db_dirpath, exist_ok=True)
 
+# The language column used to be the languages joined without separator
+LEGACY_LANGUAGE_PATTERN = re.compile(r"Unknown|.")
+
+
+def dump_languages(languages: list[str]):
+    return json.dumps(list(languages), ensure_ascii=False) if languages else None
+
+
+def load_languages(value) -> list[str]:
+    if not value:
+        return []
+    if value.startswith("["):
+        return json.loads(value)
+    return LEGACY_LANGUAGE_PATTERN.findall(value)
+
 
 class SubscribeDatabase:
     def __init__(self):
@@ -56,10 +74,24 @@ class SubscribeDatabase:
                 episode INTEGER,
                 fansub TEXT,
                 quality TEXT,
-                language TEXT
+                language TEXT,
+                info_hash TEXT
             )
             """
         )
+        await self.db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_info_hash ON resource_data(info_hash)"
+        )
+        await self.db.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_episode
+            ON resource_data(anime_name, season, episode)
+            """
+        )
+        await self.__create_subscriptions_table()
+        await self.__create_outbox_table()
+        await self.__create_skipped_table()
+        await self.__create_pending_releases_table()
         await self.db.execute(
             """
             CREATE TABLE IF NOT EXISTS db_version (
@@ -67,9 +99,75 @@ class SubscribeDatabase:
             )
             """
         )
-        await self.db.execute("INSERT INTO db_version (version) VALUES (1)")
+        await self.db.execute("INSERT INTO db_version (version) VALUES (8)")
         await self.db.commit()
 
+    async def __create_subscriptions_table(self):
+        # Subscriptions added at runtime, rules is the json of the
+        # SubscriptionConfig fields other than url
+        await self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS subscriptions (
+                url TEXT PRIMARY KEY,
+                rules TEXT,
+                added_date TEXT
+            )
+            """
+        )
+
+    async def __create_outbox_table(self):
+        # Notifications not sent yet, a row for each bot and resource
+        await self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS notification_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                bot TEXT NOT NULL,
+                resource_title TEXT NOT NULL,
+                torrent_url TEXT,
+                anime_name TEXT,
+                created_date TEXT,
+                attempts INTEGER DEFAULT 0
+            )
+            """
+        )
+
+    async def __create_skipped_table(self):
+        # Resources seen in the feeds but not downloaded, e.g. the duplicates
+        # of a downloaded torrent. Kept apart from resource_data, which only
+        # holds the downloaded resources
+        await self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS skipped_resources (
+                resource_title TEXT PRIMARY KEY,
+                info_hash TEXT,
+                reason TEXT,
+                skipped_date TEXT
+            )
+            """
+        )
+        await self.db.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_skipped_info_hash
+            ON skipped_resources(info_hash)
+            """
+        )
+
+    async def __create_pending_releases_table(self):
+        # The releases held by the ReleaseSelector until their window closes,
+        # resource is the json of the ResourceInfo
+        await self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pending_releases (
+                anime_name TEXT,
+                season INTEGER,
+                episode INTEGER,
+                resource TEXT,
+                deadline REAL,
+                PRIMARY KEY (anime_name, season, episode)
+            )
+            """
+        )
+
     async def _upgrade_database(self):
         try:
             cursor = await self.db.execute("SELECT version FROM db_version")
@@ -132,6 +230,109 @@ class SubscribeDatabase:
             except Exception as e:
                 logger.error(f"Error during database upgrade: {e}")
                 await self.db.rollback()
+                return
+
+        if version < 2:
+            try:
+                await self.db.execute(
+                    "ALTER TABLE resource_data ADD COLUMN info_hash TEXT"
+                )
+                await self.db.execute(
+                    """
+                        CREATE INDEX IF NOT EXISTS idx_info_hash
+                        ON resource_data(info_hash)
+                    """
+                )
+                await self.db.execute("DELETE FROM db_version")
+                await self.db.execute("INSERT INTO db_version (version) VALUES (2)")
+                await self.db.commit()
+                logger.info("Database upgraded to version 2")
+            except Exception as e:
+                logger.error(f"Error during database upgrade: {e}")
+                await self.db.rollback()
+                return
+
+        if version < 3:
+            try:
+                await self.db.execute(
+                    """
+                        CREATE INDEX IF NOT EXISTS idx_episode
+                        ON resource_data(anime_name, season, episode)
+                    """
+                )
+                await self.db.execute("DELETE FROM db_version")
+                await self.db.execute("INSERT INTO db_version (version) VALUES (3)")
+                await self.db.commit()
+                logger.info("Database upgraded to version 3")
+            except Exception as e:
+                logger.error(f"Error during database upgrade: {e}")
+                await self.db.rollback()
+                return
+
+        if version < 4:
+            try:
+                await self.__create_subscriptions_table()
+                await self.db.execute("DELETE FROM db_version")
+                await self.db.execute("INSERT INTO db_version (version) VALUES (4)")
+                await self.db.commit()
+                logger.info("Database upgraded to version 4")
+            except Exception as e:
+                logger.error(f"Error during database upgrade: {e}")
+                await self.db.rollback()
+                return
+
+        if version < 5:
+            try:
+                await self.__create_outbox_table()
+                await self.db.execute("DELETE FROM db_version")
+                await self.db.execute("INSERT INTO db_version (version) VALUES (5)")
+                await self.db.commit()
+                logger.info("Database upgraded to version 5")
+            except Exception as e:
+                logger.error(f"Error during database upgrade: {e}")
+                await self.db.rollback()
+                return
+
+        if version < 6:
+            try:
+                await self.__create_skipped_table()
+                await self.db.execute("DELETE FROM db_version")
+                await self.db.execute("INSERT INTO db_version (version) VALUES (6)")
+                await self.db.commit()
+                logger.info("Database upgraded to version 6")
+            except Exception as e:
+                logger.error(f"Error during database upgrade: {e}")
+                await self.db.rollback()
+                return
+
+        if version < 7:
+            try:
+                await self.__create_pending_releases_table()
+                await self.db.execute("DELETE FROM db_version")
+                await self.db.execute("INSERT INTO db_version (version) VALUES (7)")
+                await self.db.commit()
+                logger.info("Database upgraded to version 7")
+            except Exception as e:
+                logger.error(f"Error during database upgrade: {e}")
+                await self.db.rollback()
+                return
+
+        if version < 8:
+            try:
+                # Created with the column if upgraded from before version 5
+                cursor = await self.db.execute("PRAGMA table_info(notification_outbox)")
+                columns = [row[1] for row in await cursor.fetchall()]
+                if "attempts" not in columns:
+                    await self.db.execute(
+                        "ALTER TABLE notification_outbox ADD COLUMN attempts INTEGER DEFAULT 0"
+                    )
+                await self.db.execute("DELETE FROM db_version")
+                await self.db.execute("INSERT INTO db_version (version) VALUES (8)")
+                await self.db.commit()
+                logger.info("Database upgraded to version 8")
+            except Exception as e:
+                logger.error(f"Error during database upgrade: {e}")
+                await self.db.rollback()
 
     async def insert(
         self,
@@ -145,14 +346,15 @@ class SubscribeDatabase:
         fansub=None,
         quality=None,
         language=None,
+        info_hash=None,
     ):
-        language_str = "".join(language) if language else None
+        language_str = dump_languages(language)
         try:
             await self.db.execute(
                 """
                     INSERT INTO resource_data 
-                    (resource_title, torrent_url, published_date, downloaded_date, anime_name, season, episode, fansub, quality, language)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    (resource_title, torrent_url, published_date, downloaded_date, anime_name, season, episode, fansub, quality, language, info_hash)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
                 (
                     resource_title,
@@ -165,6 +367,7 @@ class SubscribeDatabase:
                     fansub,
                     quality,
                     language_str,
+                    info_hash,
                 ),
             )
             await self.db.commit()
@@ -187,6 +390,7 @@ class SubscribeDatabase:
             fansub=resource.fansub,
             quality=resource.quality,
             language=resource.languages,
+            info_hash=resource.info_hash,
         )
 
     async def is_resource_title_exist(self, resource_title: str):
@@ -200,6 +404,124 @@ class SubscribeDatabase:
             logger.error(f"Error checking resource existence: {e}")
             return False
 
+    async def insert_skipped_resource(self, resource: ResourceInfo, reason: str):
+        """Record a resource which is not downloaded, so it's not processed again"""
+        skipped_date = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+        await self.db.execute(
+            """
+                INSERT OR REPLACE INTO skipped_resources
+                (resource_title, info_hash, reason, skipped_date)
+                VALUES (?, ?, ?, ?)
+            """,
+            (resource.resource_title, resource.info_hash, reason, skipped_date),
+        )
+        await self.db.commit()
+
+    async def is_resource_skipped(self, resource_title: str) -> bool:
+        cursor = await self.db.execute(
+            "SELECT 1 FROM skipped_resources WHERE resource_title = ? LIMIT 1",
+            (resource_title,),
+        )
+        return await cursor.fetchone() is not None
+
+    async def delete_skipped_by_info_hash(self, info_hash: str):
+        """Forget the resources skipped as duplicates of a torrent, e.g. when its
+        download failed, so they are processed again"""
+        await self.db.execute(
+            "DELETE FROM skipped_resources WHERE info_hash = ?", (info_hash,)
+        )
+        await self.db.commit()
+
+    async def save_pending_release(self, resource: ResourceInfo, deadline: float):
+        """Save the release held for its episode, replacing the previous one"""
+        data = {
+            f.name: getattr(resource, f.name)
+            for f in dataclasses.fields(resource)
+            if f.name != "trace"
+        }
+        await self.db.execute(
+            """
+                INSERT OR REPLACE INTO pending_releases
+                (anime_name, season, episode, resource, deadline)
+                VALUES (?, ?, ?, ?, ?)
+            """,
+            (
+                resource.anime_name,
+                resource.season,
+                resource.episode,
+                json.dumps(data, ensure_ascii=False),
+                deadline,
+            ),
+        )
+        await self.db.commit()
+
+    async def delete_pending_release(self, anime_name: str, season: int, episode: int):
+        await self.db.execute(
+            """
+                DELETE FROM pending_releases
+                WHERE anime_name = ? AND season = ? AND episode = ?
+            """,
+            (anime_name, season, episode),
+        )
+        await self.db.commit()
+
+    async def get_pending_releases(self) -> list[tuple[ResourceInfo, float]]:
+        """[(resource, deadline)] of the held releases"""
+        cursor = await self.db.execute(
+            "SELECT resource, deadline FROM pending_releases ORDER BY deadline"
+        )
+        releases = []
+        for row in await cursor.fetchall():
+            data = json.loads(row[0])
+            if data.get("quality") is not None:
+                data["quality"] = VideoQuality(data["quality"])
+            releases.append((ResourceInfo(**data), row[1]))
+        return releases
+
+    async def is_info_hash_exist(self, info_hash: str):
+        try:
+            cursor = await self.db.execute(
+                "SELECT 1 FROM resource_data WHERE info_hash = ? LIMIT 1",
+                (info_hash,),
+            )
+            return await cursor.fetchone() is not None
+        except Exception as e:
+            logger.error(f"Error checking info-hash existence: {e}")
+            return False
+
+    async def get_resources_by_episode(
+        self, anime_name: str, season: int, episode: int
+    ) -> list[ResourceInfo]:
+        """Get the downloaded resources of an episode"""
+        try:
+            cursor = await self.db.execute(
+                """
+                    SELECT resource_title, torrent_url, published_date, fansub, quality, language, info_hash
+                    FROM resource_data
+                    WHERE anime_name = ? AND season = ? AND episode = ?
+                """,
+                (anime_name, season, episode),
+            )
+            rows = await cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error when getting resources of episode: {e}")
+            return []
+        return [
+            ResourceInfo(
+                resource_title=row[0],
+                torrent_url=row[1],
+                published_date=row[2],
+                anime_name=anime_name,
+                season=season,
+                episode=episode,
+                fansub=row[3],
+                quality=row[4],
+                languages=load_languages(row[5]),
+                info_hash=row[6],
+            )
+            for row in rows
+        ]
+
     async def delete_by_id(self, id):
         try:
             await self.db.execute("DELETE FROM resource_data WHERE id=?", (id,))
@@ -227,3 +549,114 @@ class SubscribeDatabase:
             logger.debug(f"Delete resource data: {title}")
         except Exception as e:
             logger.error(f"Error when delete resource data:\n {e}")
+
+    async def insert_subscription(self, url: str, rules: dict = None) -> bool:
+        """Save a subscription added at runtime
+
+        Returns:
+            bool: False if the url is already subscribed
+        """
+        added_date = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+        try:
+            await self.db.execute(
+                "INSERT INTO subscriptions (url, rules, added_date) VALUES (?, ?, ?)",
+                (url, json.dumps(rules or {}, ensure_ascii=False), added_date),
+            )
+            await self.db.commit()
+            logger.debug(f"Insert subscription: {url}")
+            return True
+        except aiosqlite.IntegrityError:
+            logger.debug(f"Subscription already exists: {url}")
+            return False
+
+    async def delete_subscription(self, url: str) -> bool:
+        """
+        Returns:
+            bool: False if the url is not subscribed
+        """
+        cursor = await self.db.execute("DELETE FROM subscriptions WHERE url=?", (url,))
+        await self.db.commit()
+        logger.debug(f"Delete subscription: {url}")
+        return cursor.rowcount > 0
+
+    async def get_subscriptions(self) -> list[tuple[str, dict]]:
+        """[(url, rules)] of the subscriptions added at runtime, oldest first"""
+        cursor = await self.db.execute(
+            "SELECT url, rules FROM subscriptions ORDER BY rowid"
+        )
+        rows = await cursor.fetchall()
+        return [(row[0], json.loads(row[1]) if row[1] else {}) for row in rows]
+
+    async def insert_outbox(self, bots: list[str], resource: ResourceInfo):
+        """Queue the notification of a resource for each of the bots"""
+        created_date = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+        await self.db.executemany(
+            """
+                INSERT INTO notification_outbox
+                (bot, resource_title, torrent_url, anime_name, created_date)
+                VALUES (?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    bot,
+                    resource.resource_title,
+                    resource.torrent_url,
+                    resource.anime_name,
+                    created_date,
+                )
+                for bot in bots
+            ],
+        )
+        await self.db.commit()
+
+    async def get_outbox(self) -> list[tuple[str, ResourceInfo, int]]:
+        """[(bot, resource, failed attempts)] of the notifications not sent yet,
+        oldest first"""
+        cursor = await self.db.execute(
+            """
+                SELECT bot, resource_title, torrent_url, anime_name, attempts
+                FROM notification_outbox ORDER BY id
+            """
+        )
+        rows = await cursor.fetchall()
+        return [
+            (
+                row[0],
+                ResourceInfo(
+                    resource_title=row[1], torrent_url=row[2], anime_name=row[3]
+                ),
+                row[4] or 0,
+            )
+            for row in rows
+        ]
+
+    async def rename_outbox_bot(self, old_bot: str, new_bot: str):
+        """Move the notifications of a bot to another key"""
+        await self.db.execute(
+            "UPDATE notification_outbox SET bot=? WHERE bot=?", (new_bot, old_bot)
+        )
+        await self.db.commit()
+
+    async def increment_outbox_attempts(self, bot: str, resource_titles: list[str]):
+        """Count a failed attempt to send the notifications of a bot"""
+        await self.db.executemany(
+            """
+                UPDATE notification_outbox SET attempts = attempts + 1
+                WHERE bot=? AND resource_title=?
+            """,
+            [(bot, title) for title in resource_titles],
+        )
+        await self.db.commit()
+
+    async def delete_outbox(self, bot: str, resource_titles: list[str] = None):
+        """Remove the sent notifications of a bot, all of them if resource_titles is None"""
+        if resource_titles is None:
+            await self.db.execute(
+                "DELETE FROM notification_outbox WHERE bot=?", (bot,)
+            )
+        else:
+            await self.db.executemany(
+                "DELETE FROM notification_outbox WHERE bot=? AND resource_title=?",
+                [(bot, title) for title in resource_titles],
+            )
+        await self.db.commit()
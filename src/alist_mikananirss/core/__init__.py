@@ -1,7 +1,18 @@
-from .bot_assistant import BotAssistant
 from .download_manager import *
-from .filter import RegexFilter
+from .filter import RegexFilter, SubscriptionFilter
 from .notification_sender import NotificationSender
+from .poll_scheduler import PollScheduler
+from .release_selector import ReleaseSelector
 from .remapper import RemapFrom, Remapper, RemapperManager, RemapTo
 from .renamer import AnimeRenamer
 from .rss_monitor import RssMonitor
+
+
+def __getattr__(name):
+    # BotAssistant imports python-telegram-bot, only load it when the bot
+    # assistant is enabled
+    if name == "BotAssistant":
+        from .bot_assistant import BotAssistant
+
+        return BotAssistant
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
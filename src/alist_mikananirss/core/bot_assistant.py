@@ -1,18 +1,31 @@
+import asyncio
+from typing import Optional
+
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
 
+from alist_mikananirss.common.config.basic import SubscriptionConfig
 from alist_mikananirss.websites.models import ResourceInfo
 
+from .job_queue import Job, JobQueue, JobState
 from .rss_monitor import RssMonitor
 
 
 class BotAssistant:
-    def __init__(self, token: str, rss_monitor: RssMonitor):
+    def __init__(
+        self,
+        token: str,
+        rss_monitor: RssMonitor,
+        job_workers: int = 1,
+        job_queue_size: int = 20,
+    ):
         """An assistant to manage the rss download tasks via Telegram Bot
 
         Args:
             token (str): Telegram Bot Token
             rss_monitor (RssMonitor): RssMonitor instance
+            job_workers (int): /d jobs run at the same time
+            job_queue_size (int): /d jobs waiting at most
 
         Example:
             bot_assistant = BotAssistant(cfg.bot_assistant_telegram_bot_token, rss_monitor)
@@ -20,10 +33,16 @@ class BotAssistant:
         """
         self.app = Application.builder().token(token).build()
         self.rss_monitor = rss_monitor
+        self.job_queue = JobQueue(job_workers, job_queue_size)
         self._setup_handlers()
 
     def _setup_handlers(self):
         self.app.add_handler(CommandHandler("d", self._download_rss_command))
+        self.app.add_handler(CommandHandler("status", self._status_command))
+        self.app.add_handler(CommandHandler("jobs", self._jobs_command))
+        self.app.add_handler(CommandHandler("sub", self._subscribe_command))
+        self.app.add_handler(CommandHandler("unsub", self._unsubscribe_command))
+        self.app.add_handler(CommandHandler("subs", self._list_subscriptions_command))
 
     async def _download_rss_command(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
@@ -34,25 +53,107 @@ class BotAssistant:
 
         rss_url = context.args[0]
         try:
-            await update.message.reply_text("分析 RSS 链接...")
-            results: ResourceInfo = await self.rss_monitor.run_once_with_url(rss_url)
-            if results:
-                replymsg = "开始下载:\n" + "\n".join(
-                    [r_info.resource_title for r_info in results]
-                )
-                await update.message.reply_text(replymsg)
-            else:
-                await update.message.reply_text("未能找到新的资源")
+            job = self.job_queue.submit(
+                rss_url, lambda: self._download_rss(update, rss_url)
+            )
+        except asyncio.QueueFull:
+            await update.message.reply_text("任务队列已满，请稍后再试")
+            return
+        await update.message.reply_text(
+            f"任务 #{job.job_id} 已加入队列，排在第 {self.job_queue.position(job)} 位\n"
+            f"使用 /status {job.job_id} 查看进度"
+        )
+
+    async def _download_rss(self, update: Update, rss_url: str) -> list[ResourceInfo]:
+        """The job of /d, reply the result when done"""
+        try:
+            results = await self.rss_monitor.run_once_with_url(rss_url)
         except Exception as e:
             await update.message.reply_text(f"RSS 下载失败:\n{str(e)}")
+            raise
+        if results:
+            replymsg = "开始下载:\n" + "\n".join(
+                [r_info.resource_title for r_info in results]
+            )
+            await update.message.reply_text(replymsg)
+        else:
+            await update.message.reply_text("未能找到新的资源")
+        return results
+
+    @staticmethod
+    def _format_job(job: Job, position: Optional[int]) -> str:
+        lines = [str(job)]
+        if position is not None:
+            lines.append(f"队列位置: {position}")
+        for stage, duration in job.stage_durations().items():
+            lines.append(f"{stage}: {duration:.1f}s")
+        if job.state == JobState.DONE:
+            lines.append(f"新资源: {len(job.result or [])}")
+        elif job.state == JobState.FAILED:
+            lines.append(f"错误: {job.error}")
+        return "\n".join(lines)
+
+    async def _status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not context.args or not context.args[0].lstrip("#").isdigit():
+            await update.message.reply_text("usage: /status <job_id>")
+            return
+        job = self.job_queue.get(int(context.args[0].lstrip("#")))
+        if job is None:
+            await update.message.reply_text("找不到该任务")
+            return
+        await update.message.reply_text(
+            self._format_job(job, self.job_queue.position(job))
+        )
+
+    async def _jobs_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        jobs = self.job_queue.jobs()
+        await update.message.reply_text(
+            "\n".join(str(job) for job in jobs) or "没有任务"
+        )
+
+    async def _subscribe_command(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ):
+        if not context.args:
+            await update.message.reply_text("usage: /sub <rss_url>")
+            return
+        try:
+            sub = SubscriptionConfig(url=context.args[0])
+            await self.rss_monitor.add_subscription(sub)
+            await update.message.reply_text(f"已订阅: {sub.url}")
+        except ValueError as e:
+            await update.message.reply_text(f"订阅失败:\n{str(e)}")
+
+    async def _unsubscribe_command(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ):
+        if not context.args:
+            await update.message.reply_text("usage: /unsub <rss_url>")
+            return
+        try:
+            await self.rss_monitor.remove_subscription(context.args[0])
+            await update.message.reply_text(f"已取消订阅: {context.args[0]}")
+        except ValueError as e:
+            await update.message.reply_text(f"取消订阅失败:\n{str(e)}")
+
+    async def _list_subscriptions_command(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ):
+        lines = [
+            f"{url}{'' if runtime else ' (配置文件)'}"
+            for url, runtime in self.rss_monitor.list_subscriptions()
+        ]
+        await update.message.reply_text("\n".join(lines) or "没有订阅")
 
     async def run(self):
         """Initialize and start the bot"""
+        self.job_queue.start()
         await self.app.initialize()
         await self.app.start()
         await self.app.updater.start_polling()
 
     async def stop(self):
         """Stop the bot gracefully"""
+        await self.job_queue.stop()
         await self.app.stop()
         await self.app.shutdown()
@@ -1,5 +1,6 @@
 import asyncio
 import os
+import time
 from typing import Optional
 
 from loguru import logger
@@ -18,14 +19,29 @@ from alist_mikananirss.alist.tasks import (
     AlistTaskState,
     AlistTaskType,
     AlistTransferTask,
+    InvalidTaskDescription,
 )
 from alist_mikananirss.common.database import SubscribeDatabase
 from alist_mikananirss.websites.models import ResourceInfo
 
 from ..utils import FixedSizeSet, Singleton
+from ..utils.log import LogThrottle
+from ..utils.metrics import metrics
+from ..utils.tracing import span, use_trace
+from ..utils.torrent import fetch_info_hashes
 from .notification_sender import NotificationSender
 from .renamer import AnimeRenamer
 
+TASK_POLL_SECONDS = metrics.histogram(
+    "task_monitor_poll_seconds", "Time of one TaskMonitor cycle"
+)
+TASK_POLL_INTERVAL = metrics.histogram(
+    "task_monitor_poll_interval_seconds", "Time between two TaskMonitor cycles"
+)
+TASKS_FINISHED = metrics.counter(
+    "task_monitor_finished_tasks", "Alist tasks finished, by type and result"
+)
+
 
 class TaskMonitor:
     NORMAL_STATUS = [
@@ -52,15 +68,24 @@ class TaskMonitor:
 
         self.lock = asyncio.Lock()
         self.coroutine = None
+        # The task list is polled every second, don't log each poll
+        self._progress_log = LogThrottle(30)
+        self._missing_log = LogThrottle(60)
+        metrics.gauge(
+            "task_monitor_running_tasks",
+            "Alist tasks being monitored",
+            lambda: len(self.running_tasks),
+        )
 
     async def _fetch_remote_tasks(self):
         """获取远程任务列表"""
+        tids = {task.tid for task in self.running_tasks}
         try:
             download_tasks = await self.alist_client.get_task_list(
-                AlistTaskType.DOWNLOAD
+                AlistTaskType.DOWNLOAD, tids=tids
             )
             transfer_tasks = await self.alist_client.get_task_list(
-                AlistTaskType.TRANSFER
+                AlistTaskType.TRANSFER, tids=tids
             )
             return download_tasks + transfer_tasks
         except Exception as e:
@@ -73,14 +98,26 @@ class TaskMonitor:
         new_tid_map = {task.tid: task for task in new_task_list}
         for task in old_task_list:
             if task.tid not in new_tid_map:
-                logger.warning(f"Task {task.tid} not found in remote task list")
+                allowed, suppressed = self._missing_log.allow(task.tid)
+                if allowed:
+                    logger.warning(
+                        "Task {} not found in remote task list{}",
+                        task.tid,
+                        f" ({suppressed} times)" if suppressed else "",
+                    )
                 continue
 
             new_task = new_tid_map[task.tid]
-            task.__dict__.update(new_task.__dict__)
-            logger.debug(
-                f"Checking {task} state: {task.state} progress: {task.progress:.2f}%"
-            )
+            old_state = task.state
+            task.update_from(new_task)
+            # Every state change, but the progress only once in a while
+            if task.state != old_state or self._progress_log.allow(task.tid)[0]:
+                logger.debug(
+                    "Checking {} state: {} progress: {:.2f}%",
+                    task,
+                    task.state,
+                    task.progress,
+                )
 
     @retry(
         stop=stop_after_attempt(7),
@@ -101,33 +138,40 @@ class TaskMonitor:
         """
         try:
             transfer_task_list: list[AlistTransferTask] = (
-                await self.alist_client.get_task_list(AlistTaskType.TRANSFER)
+                await self.alist_client.get_task_list(
+                    AlistTaskType.TRANSFER, path_prefix=download_task.download_path
+                )
             )
         except Exception as e:
             logger.warning(f"Error when getting transfer task list: {e}")
             return None
+
         # Filter out the transfer tasks by start_time and state
-        transfer_task_list = [
-            task
-            for task in transfer_task_list
-            if (
-                # 1. The transfer task is not already linked
-                task.uuid not in self.uuid_set
-                # 2. It's a video file
-                and utils.is_video(task.target_path)
-                # 3. It's created after the download task
-                and task.start_time > download_task.start_time
-                # 4. The transfer task is in a valid state
-                and task.state
-                in [
-                    AlistTaskState.Pending,
-                    AlistTaskState.Running,
-                    AlistTaskState.Succeeded,
-                ]
-                # 5. Same anime, same season
-                and download_task.download_path in task.target_path
-            )
-        ]
+        def is_candidate(task: AlistTransferTask) -> bool:
+            try:
+                return (
+                    # 1. The transfer task is not already linked
+                    task.uuid not in self.uuid_set
+                    # 2. It's a video file
+                    and utils.is_video(task.target_path)
+                    # 3. It's created after the download task
+                    and task.start_time > download_task.start_time
+                    # 4. The transfer task is in a valid state
+                    and task.state
+                    in [
+                        AlistTaskState.Pending,
+                        AlistTaskState.Running,
+                        AlistTaskState.Succeeded,
+                    ]
+                    # 5. Same anime, same season
+                    and download_task.download_path in task.target_path
+                )
+            except InvalidTaskDescription as e:
+                # Transfer tasks not created by offline download
+                logger.debug(e)
+                return False
+
+        transfer_task_list = [task for task in transfer_task_list if is_candidate(task)]
         if len(transfer_task_list) == 0:
             return None
         # Sort by start time, the latest one first
@@ -140,11 +184,18 @@ class TaskMonitor:
     async def _post_process(self, tf_task: AlistTransferTask, resource: ResourceInfo):
         "Something to do after download task success"
         logger.info(f"Download {resource.resource_title} success")
+        trace = resource.trace
         if self.use_renamer:
             remote_filepath = tf_task.target_path
-            await AnimeRenamer.rename(remote_filepath, resource)
+            with use_trace(trace), span("rename"):
+                await AnimeRenamer.rename(remote_filepath, resource)
         if self.need_notification:
+            # Finished when the notification is sent
+            if trace:
+                trace.begin("notify")
             await NotificationSender.add_resource(resource)
+        elif trace:
+            trace.finish()
 
     async def _process_successed_tasks(self, task_list: list[AlistTask]):
         """Process the successed tasks
@@ -153,17 +204,27 @@ class TaskMonitor:
             task_list (list[AlistTask]): The task list to process
         """
         for task in task_list:
+            resource = self.task_resource_map[task]
+            trace = resource.trace
             if task.task_type == AlistTaskType.DOWNLOAD:
-                tf_task = await self._find_transfer_task(task)
+                if trace:
+                    trace.end("download")
+                with use_trace(trace), span("link"):
+                    tf_task = await self._find_transfer_task(task)
                 if tf_task is None:
                     logger.error(
-                        f"Can't find transfer task for [{self.task_resource_map[task].resource_title}]"
+                        f"Can't find transfer task for [{resource.resource_title}]"
                     )
+                    if trace:
+                        trace.finish("link_failed")
                 else:
                     self.running_tasks.append(tf_task)
-                    self.task_resource_map[tf_task] = self.task_resource_map[task]
+                    self.task_resource_map[tf_task] = resource
+                    if trace:
+                        trace.begin("transfer")
             elif task.task_type == AlistTaskType.TRANSFER:
-                resource = self.task_resource_map[task]
+                if trace:
+                    trace.end("transfer")
                 await self._post_process(task, resource)
 
     async def _process_failed_tasks(self, task_list: list[AlistTask]):
@@ -177,7 +238,12 @@ class TaskMonitor:
             logger.error(
                 f"{type(task)} of [{resource.resource_title}] failed: {task.error}"
             )
+            if resource.trace:
+                resource.trace.finish("failed", task.error)
             await self.db.delete_by_resource_title(resource.resource_title)
+            if resource.info_hash:
+                # The other releases of the torrent may download
+                await self.db.delete_skipped_by_info_hash(resource.info_hash)
 
     async def monitor(self, task: AlistTask, resource_info: ResourceInfo):
         """Start monitor the download task.
@@ -198,7 +264,12 @@ class TaskMonitor:
                 self.coroutine = asyncio.create_task(self.run())
 
     async def run(self):
+        last_start = None
         while len(self.running_tasks) > 0:
+            start = time.perf_counter()
+            if last_start is not None:
+                TASK_POLL_INTERVAL.observe(start - last_start)
+            last_start = start
             # 1. Get remote task list
             async with self.lock:
                 new_task_list = await self._fetch_remote_tasks()
@@ -227,6 +298,11 @@ class TaskMonitor:
                 for task in tasks_to_remove:
                     self.running_tasks.remove(task)
                     del self.task_resource_map[task]
+                for task in successed_task:
+                    TASKS_FINISHED.inc(type=task.task_type.value, result="succeeded")
+                for task in failed_task:
+                    TASKS_FINISHED.inc(type=task.task_type.value, result="failed")
+            TASK_POLL_SECONDS.observe(time.perf_counter() - start)
 
             await asyncio.sleep(1)
 
@@ -243,10 +319,12 @@ class DownloadManager(metaclass=Singleton):
         use_renamer: bool = False,
         need_notification: bool = False,
         db: SubscribeDatabase = None,
+        dedupe_by_info_hash: bool = False,
     ):
         self.alist_client = alist_client
         self.base_download_path = base_download_path
         self.db = db
+        self.dedupe_by_info_hash = dedupe_by_info_hash
         self.task_monitor = TaskMonitor(
             alist_client=alist_client,
             db=db,
@@ -262,6 +340,7 @@ class DownloadManager(metaclass=Singleton):
         use_renamer: bool = False,
         need_notification: bool = False,
         db: SubscribeDatabase = None,
+        dedupe_by_info_hash: bool = False,
     ) -> None:
         cls(
             alist_client=alist_client,
@@ -269,6 +348,7 @@ class DownloadManager(metaclass=Singleton):
             use_renamer=use_renamer,
             need_notification=need_notification,
             db=db,
+            dedupe_by_info_hash=dedupe_by_info_hash,
         )
 
     def _build_download_path(self, resource: ResourceInfo) -> str:
@@ -295,6 +375,11 @@ class DownloadManager(metaclass=Singleton):
                 download_path = os.path.join(download_path, f"Season {resource.season}")
         return download_path
 
+    @classmethod
+    def download_path(cls, resource: ResourceInfo) -> str:
+        """The path the resource is downloaded to"""
+        return cls()._build_download_path(resource)
+
     async def download(
         self, new_resources: list[ResourceInfo]
     ) -> list[AlistDownloadTask]:
@@ -328,10 +413,52 @@ class DownloadManager(metaclass=Singleton):
                 continue
         return task_list
 
+    async def remove_duplicates(
+        self, resources: list[ResourceInfo]
+    ) -> list[ResourceInfo]:
+        """Remove the resources whose torrent is already downloaded, or appears
+        twice in the list, e.g. the same release from Mikan and dmhy.
+
+        Resources without info-hash are kept.
+        """
+        missing = [resource for resource in resources if resource.info_hash is None]
+        info_hashes = await fetch_info_hashes([r.torrent_url for r in missing])
+        for resource, info_hash in zip(missing, info_hashes):
+            resource.info_hash = info_hash
+
+        unique_resources = []
+        seen = set()
+        for resource in resources:
+            info_hash = resource.info_hash
+            if info_hash is None:
+                unique_resources.append(resource)
+                continue
+            if info_hash in seen or await self.db.is_info_hash_exist(info_hash):
+                logger.info(
+                    f"Skip {resource.resource_title}, the same torrent is already downloaded"
+                )
+                # Recorded apart from the downloaded resources, so it won't be
+                # checked again, but is retried if the download fails
+                await self.db.insert_skipped_resource(resource, "duplicate")
+                if resource.trace:
+                    resource.trace.finish("duplicate")
+                continue
+            seen.add(info_hash)
+            unique_resources.append(resource)
+        return unique_resources
+
     @classmethod
     async def add_download_tasks(cls, resources: list[ResourceInfo]):
         instance = cls()
+        for resource in resources:
+            if resource.trace:
+                resource.trace.begin("submit")
+        if instance.dedupe_by_info_hash:
+            resources = await instance.remove_duplicates(resources)
+            if not resources:
+                return
         dl_tasks = await instance.download(resources)
+        submitted = set()
         for dl_task in dl_tasks:
             matched_resource = None
             for resource in resources:
@@ -341,5 +468,12 @@ class DownloadManager(metaclass=Singleton):
             if not matched_resource:
                 logger.error(f"Can't matched download task [{dl_task.url}] to resource")
                 continue
+            submitted.add(id(matched_resource))
+            if matched_resource.trace:
+                matched_resource.trace.end("submit")
+                matched_resource.trace.begin("download")
             await instance.db.insert_resource_info(matched_resource)
             await instance.task_monitor.monitor(dl_task, matched_resource)
+        for resource in resources:
+            if id(resource) not in submitted and resource.trace:
+                resource.trace.finish("submit_failed")
@@ -1,4 +1,399 @@
 import re
+import time
+from typing import Callable, Optional
+
+from alist_mikananirss.common.config.basic import SubscriptionConfig
+from alist_mikananirss.websites.models import FeedEntry, VideoQuality
+
+REGEX_META_CHARS = set(".^$*+?{}[]()|\\")
+OPTIONAL_QUANTIFIERS = set("*?{")
+EXPRESSION_TOKEN_PATTERN = re.compile(r"\s*(\(|\)|&&?|\|\|?|!|[^\s()&|!]+)")
+# Reorder the expression by the observed statistics every N single evaluations
+REORDER_INTERVAL = 256
+QUALITY_PATTERNS = {
+    VideoQuality.p2160: re.compile(r"2160p|4k|3840x2160", re.IGNORECASE),
+    VideoQuality.p1080: re.compile(r"1080p|1920x1080", re.IGNORECASE),
+    VideoQuality.p720: re.compile(r"720p|1280x720", re.IGNORECASE),
+}
+# [ANi], 【喵萌奶茶屋】, the group tags of a title
+BRACKET_TAG_PATTERN = re.compile(r"[\[【]([^\]】]+)[\]】]")
+# Joint releases, e.g. [喵萌奶茶屋&LoliHouse]
+FANSUB_SEPARATOR_PATTERN = re.compile(r"[&＆/×]")
+
+
+def _split_top_level(pattern: str) -> list[str]:
+    """Split a regex pattern by the top-level "|" """
+    branches = []
+    depth = 0
+    start = 0
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = c != "]"
+        elif c == "[":
+            in_class = True
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "|" and depth == 0:
+            branches.append(pattern[start:i])
+            start = i + 1
+        i += 1
+    branches.append(pattern[start:])
+    return branches
+
+
+def _strip_group(pattern: str) -> str:
+    """Remove the capture group wrapping the whole pattern, e.g. (A|B) -> A|B"""
+    if not pattern.startswith("(") or pattern.startswith("(?"):
+        return pattern
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = c != "]"
+        elif c == "[":
+            in_class = True
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                return pattern[1:-1] if i == len(pattern) - 1 else pattern
+        i += 1
+    return pattern
+
+
+def _literal_prefix(branch: str) -> tuple[str, bool]:
+    """Get the leading literal of a regex branch.
+
+    Returns:
+        tuple[str, bool]: The literal prefix, and whether the whole branch is literal
+    """
+    prefix = []
+    for c in branch:
+        if c in REGEX_META_CHARS:
+            # The last char is optional, e.g. abc? or abc*
+            if c in OPTIONAL_QUANTIFIERS and prefix:
+                prefix.pop()
+            return "".join(prefix), False
+        prefix.append(c)
+    return "".join(prefix), True
+
+
+def extract_literals(pattern: str) -> tuple[Optional[tuple[str, ...]], bool]:
+    """Extract the literals of which at least one must be in a string matching the pattern.
+
+    Example:
+        >>> extract_literals("(简体|简中|CHS)")
+        (("简体", "简中", "chs"), True)
+        >>> extract_literals("^(?!.*合集).*")
+        (None, False)
+
+    Returns:
+        tuple[Optional[tuple[str, ...]], bool]: The lowercase literals, None if
+            the pattern has no literal prefilter; and whether the pattern is
+            fully decided by the literals.
+    """
+    literals = []
+    exact = True
+    for branch in _split_top_level(_strip_group(pattern)):
+        prefix, is_literal = _literal_prefix(branch)
+        if not prefix:
+            return None, False
+        literals.append(prefix.lower())
+        exact = exact and is_literal
+    return tuple(literals), exact
+
+
+class FilterRule:
+    """A named regex pattern with a literal prefilter and hit/time counters"""
+
+    def __init__(self, name: str, pattern: str):
+        self.name = name
+        self.pattern = pattern
+        self.regex = re.compile(pattern, re.IGNORECASE)
+        self.literals, self.exact = extract_literals(pattern)
+
+        self.evaluations = 0
+        self.hits = 0
+        self.prefilter_rejects = 0
+        self.total_time = 0.0
+
+    def match(self, string: str, lowered: str) -> bool:
+        start = time.perf_counter()
+        if self.literals is not None and not any(
+            literal in lowered for literal in self.literals
+        ):
+            self.prefilter_rejects += 1
+            result = False
+        elif self.exact:
+            result = True
+        else:
+            result = self.regex.search(string) is not None
+        self.total_time += time.perf_counter() - start
+        self.evaluations += 1
+        self.hits += result
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "evaluations": self.evaluations,
+            "hits": self.hits,
+            "prefilter_rejects": self.prefilter_rejects,
+            "total_time": self.total_time,
+        }
+
+
+class FilterNode:
+    """Node of a compiled filter expression"""
+
+    def __init__(self):
+        self.evaluations = 0
+        self.passes = 0
+        self.total_time = 0.0
+
+    @property
+    def pass_rate(self) -> float:
+        # Laplace smoothing, so that the nodes without statistics are neutral
+        return (self.passes + 1) / (self.evaluations + 2)
+
+    @property
+    def cost(self) -> float:
+        return self.total_time / self.evaluations if self.evaluations else 0.0
+
+    def evaluate(self, string: str, lowered: str) -> bool:
+        start = time.perf_counter()
+        result = self._evaluate(string, lowered)
+        self.total_time += time.perf_counter() - start
+        self.evaluations += 1
+        self.passes += result
+        return result
+
+    def evaluate_batch(
+        self, strings: list[str], lowered: list[str], indices: list[int]
+    ) -> list[int]:
+        """Evaluate the strings of the given indices, return the passed indices"""
+        start = time.perf_counter()
+        result = self._evaluate_batch(strings, lowered, indices)
+        self.total_time += time.perf_counter() - start
+        self.evaluations += len(indices)
+        self.passes += len(result)
+        return result
+
+    def _evaluate(self, string: str, lowered: str) -> bool:
+        raise NotImplementedError
+
+    def _evaluate_batch(
+        self, strings: list[str], lowered: list[str], indices: list[int]
+    ) -> list[int]:
+        return [i for i in indices if self._evaluate(strings[i], lowered[i])]
+
+    def optimize(self):
+        """Reorder the children by the observed statistics"""
+        pass
+
+    def rules(self) -> list[FilterRule]:
+        raise NotImplementedError
+
+
+class PatternNode(FilterNode):
+    def __init__(self, rule: FilterRule):
+        super().__init__()
+        self.rule = rule
+
+    def _evaluate(self, string: str, lowered: str) -> bool:
+        return self.rule.match(string, lowered)
+
+    def rules(self) -> list[FilterRule]:
+        return [self.rule]
+
+    def __str__(self):
+        return self.rule.name
+
+
+class NotNode(FilterNode):
+    def __init__(self, child: FilterNode):
+        super().__init__()
+        self.child = child
+
+    def _evaluate(self, string: str, lowered: str) -> bool:
+        return not self.child.evaluate(string, lowered)
+
+    def _evaluate_batch(
+        self, strings: list[str], lowered: list[str], indices: list[int]
+    ) -> list[int]:
+        passed = set(self.child.evaluate_batch(strings, lowered, indices))
+        return [i for i in indices if i not in passed]
+
+    def optimize(self):
+        self.child.optimize()
+
+    def rules(self) -> list[FilterRule]:
+        return self.child.rules()
+
+    def __str__(self):
+        return f"!{self.child}"
+
+
+class AndNode(FilterNode):
+    def __init__(self, children: list[FilterNode]):
+        super().__init__()
+        self.children = children
+
+    def _evaluate(self, string: str, lowered: str) -> bool:
+        return all(child.evaluate(string, lowered) for child in self.children)
+
+    def _evaluate_batch(
+        self, strings: list[str], lowered: list[str], indices: list[int]
+    ) -> list[int]:
+        for child in self.children:
+            if not indices:
+                break
+            indices = child.evaluate_batch(strings, lowered, indices)
+        return indices
+
+    def optimize(self):
+        for child in self.children:
+            child.optimize()
+        # Cheap and selective children first
+        self.children.sort(key=lambda c: c.cost / max(1 - c.pass_rate, 1e-6))
+
+    def rules(self) -> list[FilterRule]:
+        return [rule for child in self.children for rule in child.rules()]
+
+    def __str__(self):
+        return "(" + " & ".join(str(c) for c in self.children) + ")"
+
+
+class OrNode(FilterNode):
+    def __init__(self, children: list[FilterNode]):
+        super().__init__()
+        self.children = children
+
+    def _evaluate(self, string: str, lowered: str) -> bool:
+        return any(child.evaluate(string, lowered) for child in self.children)
+
+    def _evaluate_batch(
+        self, strings: list[str], lowered: list[str], indices: list[int]
+    ) -> list[int]:
+        passed = set()
+        remaining = indices
+        for child in self.children:
+            if not remaining:
+                break
+            passed.update(child.evaluate_batch(strings, lowered, remaining))
+            remaining = [i for i in remaining if i not in passed]
+        return [i for i in indices if i in passed]
+
+    def optimize(self):
+        for child in self.children:
+            child.optimize()
+        # Cheap and likely to pass children first
+        self.children.sort(key=lambda c: c.cost / max(c.pass_rate, 1e-6))
+
+    def rules(self) -> list[FilterRule]:
+        return [rule for child in self.children for rule in child.rules()]
+
+    def __str__(self):
+        return "(" + " | ".join(str(c) for c in self.children) + ")"
+
+
+class _ExpressionParser:
+    """Parse filter expression like "(简体 | 繁体) & 1080p & !合集"
+
+    Operators: "&"/"and", "|"/"or", "!"/"not", the precedence is not > and > or.
+    """
+
+    def __init__(self, expression: str, get_rule: Callable[[str], FilterRule]):
+        self.expression = expression
+        self.tokens = EXPRESSION_TOKEN_PATTERN.findall(expression)
+        if "".join(self.tokens) != re.sub(r"\s+", "", expression):
+            raise ValueError(f"Invalid filter expression: {expression}")
+        self.pos = 0
+        self.get_rule = get_rule
+
+    def _peek(self) -> Optional[str]:
+        if self.pos < len(self.tokens):
+            token = self.tokens[self.pos]
+            return token.lower() if token.lower() in ("and", "or", "not") else token
+        return None
+
+    def _next(self) -> str:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self) -> FilterNode:
+        if not self.tokens:
+            raise ValueError("Empty filter expression")
+        node = self._parse_or()
+        if self._peek() is not None:
+            raise ValueError(
+                f"Unexpected token <{self._peek()}> in filter expression: {self.expression}"
+            )
+        return node
+
+    def _parse_or(self) -> FilterNode:
+        children = [self._parse_and()]
+        while self._peek() in ("|", "||", "or"):
+            self._next()
+            children.append(self._parse_and())
+        return children[0] if len(children) == 1 else OrNode(children)
+
+    def _parse_and(self) -> FilterNode:
+        children = [self._parse_unary()]
+        while self._peek() in ("&", "&&", "and"):
+            self._next()
+            children.append(self._parse_unary())
+        return children[0] if len(children) == 1 else AndNode(children)
+
+    def _parse_unary(self) -> FilterNode:
+        token = self._peek()
+        if token is None:
+            raise ValueError(f"Unexpected end of filter expression: {self.expression}")
+        if token in ("!", "not"):
+            self._next()
+            return NotNode(self._parse_unary())
+        if token == "(":
+            self._next()
+            node = self._parse_or()
+            if self._peek() != ")":
+                raise ValueError(f"Missing ')' in filter expression: {self.expression}")
+            self._next()
+            return node
+        if token in (")", "&", "&&", "|", "||", "and", "or"):
+            raise ValueError(
+                f"Unexpected token <{token}> in filter expression: {self.expression}"
+            )
+        return PatternNode(self.get_rule(self._next()))
+
+
+def parse_filter_expression(
+    expression: str, get_rule: Callable[[str], FilterRule]
+) -> FilterNode:
+    """Compile a filter expression of pattern names
+
+    Args:
+        expression (str): e.g. "简体", "!非合集", "(简体 | 繁体) & 1080p"
+        get_rule (Callable[[str], FilterRule]): get the rule of a pattern name
+
+    Returns:
+        FilterNode: The root node of the compiled expression
+    """
+    return _ExpressionParser(expression, get_rule).parse()
 
 
 class RegexFilter:
@@ -10,7 +405,10 @@ class RegexFilter:
     }
 
     def __init__(self, patterns_name: list = None):
-        self.patterns = []
+        self.patterns: list[FilterNode] = []
+        self._rules: dict[str, FilterRule] = {}
+        self._root = AndNode(self.patterns)
+        self._evaluations = 0
         if patterns_name is not None:
             for pattern in patterns_name:
                 self.add_pattern(pattern)
@@ -18,22 +416,57 @@ class RegexFilter:
     def update_regex(self, regex_pattern: dict) -> None:
         if regex_pattern is not None:
             self._default_patterns.update(regex_pattern)
+            self._rules.clear()
+
+    def _get_rule(self, pattern_name: str) -> FilterRule:
+        if pattern_name not in self._rules:
+            try:
+                tmp_pattern = self._default_patterns[pattern_name]
+            except KeyError:
+                raise KeyError(f"Can't find the filter <{pattern_name}>")
+            self._rules[pattern_name] = FilterRule(pattern_name, tmp_pattern)
+        return self._rules[pattern_name]
 
     def add_pattern(self, pattern_name: str) -> None:
-        """Add regex pattern to filter"""
-        try:
-            tmp_pattern = self._default_patterns[pattern_name]
-        except KeyError:
-            raise KeyError(f"Can't find the filter <{pattern_name}>")
-        pattern = re.compile(tmp_pattern, re.IGNORECASE)
-        self.patterns.append(pattern)
+        """Add regex pattern to filter.
+
+        Args:
+            pattern_name (str): The name of a pattern, or a boolean expression of
+                pattern names, e.g. "(简体 | 繁体) & 1080p"
+        """
+        # A pattern name is looked up as is first, names may contain spaces,
+        # parentheses or and/or/not
+        if pattern_name in self._default_patterns:
+            self.patterns.append(PatternNode(self._get_rule(pattern_name)))
+        else:
+            self.patterns.append(parse_filter_expression(pattern_name, self._get_rule))
 
     def filt_single(self, string) -> bool:
         """Filter single string using regex"""
-        match_result = True
-        for pattern in self.patterns:
-            match_result = match_result and bool(re.search(pattern, string))
-        return match_result
+        result = self._root.evaluate(string, string.lower())
+        self._evaluations += 1
+        if self._evaluations % REORDER_INTERVAL == 0:
+            self._root.optimize()
+        return result
+
+    def filt_batch(self, string_list: list[str]) -> list[bool]:
+        """Filter list of string using regex, each pattern is evaluated over the
+        whole list before the next one.
+
+        Args:
+            string_list (list[str]): list of string to be filtered
+
+        Returns:
+            list[bool]: whether each string matches the regex pattern
+        """
+        lowered = [string.lower() for string in string_list]
+        passed = set(
+            self._root.evaluate_batch(
+                string_list, lowered, list(range(len(string_list)))
+            )
+        )
+        self._root.optimize()
+        return [i in passed for i in range(len(string_list))]
 
     def filt_list(self, string_list: list[str]) -> list[int]:
         """Filter list of string using regex
@@ -44,4 +477,111 @@ class RegexFilter:
         Returns:
             list[int]: index of string that match the regex pattern
         """
-        return [i for i, string in enumerate(string_list) if self.filt_single(string)]
+        return [i for i, passed in enumerate(self.filt_batch(string_list)) if passed]
+
+    def stats(self) -> list[dict]:
+        """Hit and time counters of each pattern, the most expensive first"""
+        rules = {id(rule): rule for rule in self._root.rules()}.values()
+        return sorted(
+            (rule.stats() for rule in rules),
+            key=lambda s: s["total_time"],
+            reverse=True,
+        )
+
+    def __str__(self):
+        return str(self._root)
+
+
+def extract_fansubs(resource_title: str, author: Optional[str] = None) -> set[str]:
+    """The lowercased fansub candidates of a feed entry: the bracketed tags of
+    the title, each group of a joint release, and the author
+    """
+    fansubs = set()
+    for tag in BRACKET_TAG_PATTERN.findall(resource_title):
+        fansubs.add(tag.strip().lower())
+        for group in FANSUB_SEPARATOR_PATTERN.split(tag):
+            fansubs.add(group.strip().lower())
+    if author:
+        fansubs.add(author.strip().lower())
+    fansubs.discard("")
+    return fansubs
+
+
+def detect_quality(resource_title: str) -> Optional[VideoQuality]:
+    """Detect the video quality from the resource title, None if unknown"""
+    for quality, pattern in QUALITY_PATTERNS.items():
+        if pattern.search(resource_title):
+            return quality
+    return None
+
+
+class SubscriptionFilter:
+    """Rules of a single subscription, applied to the feed entries before any
+    homepage parsing or LLM call.
+
+    Example:
+        >>> sub_filter = SubscriptionFilter(RegexFilter(["简体"]), fansub_exclude=["ANi"])
+        >>> entries = sub_filter.filt_entries(feed_entries, global_filter)
+    """
+
+    def __init__(
+        self,
+        regex_filter: Optional[RegexFilter] = None,
+        fansub_include: list[str] = None,
+        fansub_exclude: list[str] = None,
+        qualities: list[VideoQuality] = None,
+    ):
+        """
+        Args:
+            regex_filter (RegexFilter, optional): Replace the global filter if set
+            fansub_include (list[str], optional): Only keep the entries of these
+                fansubs, matched case-insensitively with the bracketed tags of
+                the title or the author
+            fansub_exclude (list[str], optional): Drop the entries of these
+                fansubs, matched like fansub_include
+            qualities (list[VideoQuality], optional): Accepted qualities, entries
+                of unknown quality are kept
+        """
+        self.regex_filter = regex_filter
+        self.fansub_include = {f.strip().lower() for f in fansub_include or []}
+        self.fansub_exclude = {f.strip().lower() for f in fansub_exclude or []}
+        self.qualities = list(qualities or [])
+
+    @classmethod
+    def from_config(cls, sub: SubscriptionConfig) -> "SubscriptionFilter":
+        return cls(
+            regex_filter=RegexFilter(sub.filters) if sub.filters is not None else None,
+            fansub_include=sub.fansub_include,
+            fansub_exclude=sub.fansub_exclude,
+            qualities=sub.qualities,
+        )
+
+    def _filt_rules(self, entry: FeedEntry) -> bool:
+        if self.fansub_include or self.fansub_exclude:
+            fansubs = extract_fansubs(entry.resource_title, entry.author)
+            if self.fansub_include and fansubs.isdisjoint(self.fansub_include):
+                return False
+            if not fansubs.isdisjoint(self.fansub_exclude):
+                return False
+        if self.qualities:
+            quality = detect_quality(entry.resource_title)
+            if quality is not None and quality not in self.qualities:
+                return False
+        return True
+
+    def filt_entries(
+        self, entries: list[FeedEntry], default_filter: RegexFilter
+    ) -> list[FeedEntry]:
+        """Filter the feed entries of the subscription
+
+        Args:
+            entries (list[FeedEntry]): The feed entries of the subscription
+            default_filter (RegexFilter): The global filter, used if the
+                subscription has no filter of its own
+
+        Returns:
+            list[FeedEntry]: The entries that pass the filter
+        """
+        regex_filter = self.regex_filter or default_filter
+        matched_indices = regex_filter.filt_list([e.resource_title for e in entries])
+        return [entries[i] for i in matched_indices if self._filt_rules(entries[i])]
@@ -0,0 +1,175 @@
+import asyncio
+import time
+from collections import OrderedDict
+from enum import StrEnum
+from typing import Any, Awaitable, Callable, Optional
+
+from loguru import logger
+
+from alist_mikananirss.utils.metrics import metrics
+from alist_mikananirss.utils.tracing import Trace, use_trace
+
+JOBS_FINISHED = metrics.counter("jobs_finished", "Jobs of the job queue, by state")
+
+
+class JobState(StrEnum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class Job:
+    """A unit of work of the JobQueue
+
+    The stages of the job are the spans of its trace: code run by the job adds
+    them with `span(name)` of utils.tracing. The trace is not written to the
+    trace log.
+    """
+
+    def __init__(self, job_id: int, title: str, func: Callable[[], Awaitable[Any]]):
+        self.job_id = job_id
+        self.title = title
+        self.func = func
+        self.state = JobState.QUEUED
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.trace = Trace(title, self.created)
+
+    @property
+    def current_stages(self) -> list[str]:
+        """The stages running now"""
+        return [s.name for s in self.trace.spans if s.duration is None]
+
+    def stage_durations(self) -> dict[str, float]:
+        """{stage: total seconds} of the finished stages, in order"""
+        durations: dict[str, float] = {}
+        for s in self.trace.spans:
+            if s.duration is not None:
+                durations[s.name] = durations.get(s.name, 0) + s.duration
+        return durations
+
+    def elapsed(self, now: Optional[float] = None) -> float:
+        """Seconds since the job started, 0 if it hasn't"""
+        if self.started is None:
+            return 0
+        end = self.finished or (time.time() if now is None else now)
+        return end - self.started
+
+    def __str__(self):
+        text = f"#{self.job_id} [{self.state}] {self.title}"
+        if self.state == JobState.RUNNING:
+            stages = ", ".join(self.current_stages) or "-"
+            text += f" ({stages}, {self.elapsed():.0f}s)"
+        elif self.state in (JobState.DONE, JobState.FAILED):
+            text += f" ({self.elapsed():.1f}s)"
+        return text
+
+
+class JobQueue:
+    """A bounded queue of jobs run by a fixed number of workers
+
+    Example:
+        >>> jobs = JobQueue(workers=1, maxsize=20)
+        >>> jobs.start()
+        >>> job = jobs.submit("Download xxx", lambda: download("xxx"))
+        >>> jobs.position(job)
+    """
+
+    def __init__(self, workers: int = 1, maxsize: int = 20, history: int = 50):
+        """
+        Args:
+            workers (int): Jobs run at the same time
+            maxsize (int): Jobs waiting at most, submit fails beyond that
+            history (int): Finished jobs kept for get() and jobs()
+        """
+        self.workers = workers
+        self.history = history
+        self._queue: asyncio.Queue[Job] = asyncio.Queue(maxsize)
+        # job_id -> job, the queued, running and recent finished ones
+        self._jobs: OrderedDict[int, Job] = OrderedDict()
+        self._next_id = 1
+        self._worker_tasks: list[asyncio.Task] = []
+        metrics.gauge(
+            "jobs_queued", "Jobs waiting in the job queue", lambda: self._queue.qsize()
+        )
+
+    def submit(self, title: str, func: Callable[[], Awaitable[Any]]) -> Job:
+        """Queue a job
+
+        Raises:
+            asyncio.QueueFull: Too many jobs waiting
+        """
+        job = Job(self._next_id, title, func)
+        self._queue.put_nowait(job)
+        self._next_id += 1
+        self._jobs[job.job_id] = job
+        self._forget_finished()
+        return job
+
+    def get(self, job_id: int) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> list[Job]:
+        """The known jobs, oldest first"""
+        return list(self._jobs.values())
+
+    def position(self, job: Job) -> Optional[int]:
+        """1 for the next job to run, None if the job is not waiting"""
+        if job.state != JobState.QUEUED:
+            return None
+        queued = [j for j in self._jobs.values() if j.state == JobState.QUEUED]
+        return queued.index(job) + 1
+
+    def _forget_finished(self):
+        finished = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.state in (JobState.DONE, JobState.FAILED)
+        ]
+        for job_id in finished[: max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    async def _run_job(self, job: Job):
+        job.state = JobState.RUNNING
+        job.started = time.time()
+        try:
+            with use_trace(job.trace):
+                job.result = await job.func()
+            job.state = JobState.DONE
+        except Exception as e:
+            logger.error(f"Job {job} failed: {e}")
+            job.error = str(e)
+            job.state = JobState.FAILED
+        finally:
+            job.finished = time.time()
+            JOBS_FINISHED.inc(state=job.state.value)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run_job(job)
+            finally:
+                self._queue.task_done()
+                self._forget_finished()
+
+    def start(self):
+        if self._worker_tasks:
+            return
+        for i in range(self.workers):
+            task = asyncio.create_task(self._worker(), name=f"job-worker-{i}")
+            self._worker_tasks.append(task)
+
+    async def join(self):
+        """Wait until the queued jobs are finished"""
+        await self._queue.join()
+
+    async def stop(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks.clear()
@@ -1,54 +1,171 @@
 import asyncio
-from typing import List
+from typing import List, Optional
 
+import aiohttp
 from loguru import logger
-from tenacity import retry, stop_after_attempt, wait_exponential
 
 from alist_mikananirss.bot import NotificationBot, NotificationMsg
+from alist_mikananirss.common.database import SubscribeDatabase
 from alist_mikananirss.websites.models import ResourceInfo
 
 from ..utils import Singleton
+from ..utils.metrics import metrics
+
+NOTIFICATIONS_SENT = metrics.counter(
+    "notifications_sent", "Notifications sent, by bot and result"
+)
+NOTIFICATIONS_DROPPED = metrics.counter(
+    "notifications_dropped", "Resources dropped from the outbox, by bot and reason"
+)
+# A resource is dropped from the outbox of a bot after this many failed sends
+MAX_SEND_ATTEMPTS = 3
+
+
+def _is_rejected(error: Exception) -> bool:
+    """The service refused the message itself, sending it again won't help"""
+    return (
+        isinstance(error, aiohttp.ClientResponseError)
+        and 400 <= error.status < 500
+        and error.status != 429
+    )
 
 
 class NotificationSender(metaclass=Singleton):
-
-    def __init__(self, notification_bots: list[NotificationBot], interval: int = 60):
+    """Send the downloaded resources to the notification bots every interval
+
+    Each bot has its own outbox: the resources not sent to it yet. With a
+    database, the outbox is persisted and survives restarts. A bot failing
+    keeps its outbox, which is sent together with the new resources at the
+    next interval, grouped by anime and split to the bot's message size.
+    A resource is dropped after MAX_SEND_ATTEMPTS failed sends, or at once if
+    the bot rejects the message (4xx), so one bad message doesn't block the
+    outbox.
+    """
+
+    def __init__(
+        self,
+        notification_bots: list[NotificationBot],
+        interval: int = 60,
+        db: Optional[SubscribeDatabase] = None,
+    ):
         self.notification_bots = notification_bots
         self._interval = interval
+        self._db = db
         self._queue = asyncio.Queue()
-        self._max_retries = 3
+        # bot key -> resources not sent to the bot yet
+        self._pending: dict[str, list[ResourceInfo]] = {
+            key: [] for key in self._bot_keys()
+        }
+        # (bot key, resource title) -> failed sends
+        self._attempts: dict[tuple[str, str], int] = {}
+        self._outbox_loaded = False
+        metrics.gauge(
+            "notification_queue_size",
+            "Resources waiting to be notified",
+            lambda: self._queue.qsize(),
+        )
+        metrics.gauge(
+            "notification_outbox_size",
+            "Notifications not sent yet, summed over the bots",
+            lambda: sum(len(pending) for pending in self._pending.values()),
+        )
 
     @classmethod
-    def initialize(cls, notification_bots: List[NotificationBot], interval: int = 60):
-        cls(notification_bots, interval)
+    def initialize(
+        cls,
+        notification_bots: List[NotificationBot],
+        interval: int = 60,
+        db: Optional[SubscribeDatabase] = None,
+    ):
+        cls(notification_bots, interval, db)
 
     @classmethod
     def set_notification_bots(cls, notification_bots: List[NotificationBot]):
         instance = cls()
         instance.notification_bots = notification_bots
+        instance._pending = {
+            key: instance._pending.get(key, []) for key in instance._bot_keys()
+        }
 
     @classmethod
     async def add_resource(cls, resource: ResourceInfo):
         instance = cls()
         await instance._queue.put(resource)
+        keys = instance._bot_keys()
+        if instance._db and keys:
+            await instance._db.insert_outbox(keys, resource)
 
     @classmethod
     def set_interval(cls, interval: int):
         instance = cls()
         instance._interval = interval
 
+    def _bots(self) -> dict[str, NotificationBot]:
+        """{outbox key: bot}, a bot configured twice is notified once"""
+        bots = {}
+        for bot in self.notification_bots:
+            bots.setdefault(bot.key, bot)
+        return bots
+
+    def _bot_keys(self) -> List[str]:
+        return list(self._bots())
+
+    def _legacy_keys(self) -> dict[str, str]:
+        """{old outbox key by position in the config: key} of the bots"""
+        return {
+            f"{i}:{bot.name}": bot.key for i, bot in enumerate(self.notification_bots)
+        }
+
+    def _get_queued(self) -> List[ResourceInfo]:
+        resources = []
+        while not self._queue.empty():
+            try:
+                resource = self._queue.get_nowait()
+                resources.append(resource)
+            except asyncio.QueueEmpty:
+                break
+        return resources
+
+    def _add_pending(self, key: str, resource: ResourceInfo):
+        pending = self._pending[key]
+        if all(r.resource_title != resource.resource_title for r in pending):
+            pending.append(resource)
+
+    async def _load_outbox(self):
+        """Add the notifications left unsent by the last run to the outboxes"""
+        if self._outbox_loaded or not self._db:
+            return
+        self._outbox_loaded = True
+        # Saved by an older version, keyed by the position of the bot
+        for old_key, key in self._legacy_keys().items():
+            await self._db.rename_outbox_bot(old_key, key)
+        stale = set()
+        for key, resource, attempts in await self._db.get_outbox():
+            if key in self._pending:
+                self._add_pending(key, resource)
+                if attempts:
+                    self._attempts[(key, resource.resource_title)] = attempts
+            else:
+                stale.add(key)
+        # Bots removed from the config
+        for key in stale:
+            await self._db.delete_outbox(key)
+        count = sum(len(pending) for pending in self._pending.values())
+        if count:
+            logger.info(f"Loaded {count} unsent notifications")
+
     async def _run(self):
+        await self._load_outbox()
         while True:
             await asyncio.sleep(self._interval)
-            resources = []
-            while not self._queue.empty():
-                try:
-                    resource = self._queue.get_nowait()
-                    resources.append(resource)
-                except asyncio.QueueEmpty:
-                    break
-            if resources:
-                await self._send(resources)
+            await self._send(self._get_queued())
+
+    @classmethod
+    async def flush(cls):
+        """Send the queued resources now, for the one-shot runs"""
+        instance = cls()
+        await instance._load_outbox()
+        await instance._send(instance._get_queued())
 
     @classmethod
     async def run(cls):
@@ -56,26 +173,80 @@ class NotificationSender(metaclass=Singleton):
         await instance._run()
 
     async def _send(self, resources: List[ResourceInfo]):
-        if not self.notification_bots:
-            return
-        msg = NotificationMsg.from_resources(resources)
-        logger.debug(f"Send notification\n: {msg}")
-
-        tasks = [self._send_with_retry(bot, msg) for bot in self.notification_bots]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        for result in results:
-            if isinstance(result, Exception):
-                logger.error(f"Failed to send notification after all retries: {result}")
-
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=3, min=5, max=30),
-        reraise=True,
-    )
-    async def _send_with_retry(self, bot: NotificationBot, msg: NotificationMsg):
         try:
-            await bot.send_message(msg)
-        except Exception as e:
-            logger.warning(f"Attempt failed for {type(bot.bot)}: {e}")
-            raise
+            for key in self._pending:
+                for resource in resources:
+                    self._add_pending(key, resource)
+            await asyncio.gather(
+                *(self._send_to_bot(key, bot) for key, bot in self._bots().items())
+            )
+        finally:
+            for resource in resources:
+                if resource.trace:
+                    resource.trace.finish()
+
+    async def _send_to_bot(self, key: str, bot: NotificationBot):
+        """Send the outbox of the bot, stop at the first failure
+
+        The rest of the outbox is sent at the next interval.
+        """
+        pending = self._pending[key]
+        if not pending:
+            return
+        msg = NotificationMsg.from_resources(pending)
+        for part in msg.split(bot.max_message_length):
+            logger.debug("Send notification to {}:\n{}", bot.name, part)
+            titles = part.titles()
+            try:
+                await bot.send_message(part)
+            except Exception as e:
+                NOTIFICATIONS_SENT.inc(bot=bot.name, result="failed")
+                if _is_rejected(e):
+                    logger.error(
+                        f"{bot.name} rejected the notification of {len(titles)} "
+                        f"resources, dropped: {e}"
+                    )
+                    await self._remove(key, titles)
+                    NOTIFICATIONS_DROPPED.inc(
+                        len(titles), bot=bot.name, reason="rejected"
+                    )
+                    continue
+                await self._failed(key, bot, titles, e)
+                return
+            NOTIFICATIONS_SENT.inc(bot=bot.name, result="succeeded")
+            await self._remove(key, titles)
+
+    async def _failed(
+        self, key: str, bot: NotificationBot, titles: list[str], error: Exception
+    ):
+        expired = []
+        for title in titles:
+            attempts = self._attempts.get((key, title), 0) + 1
+            self._attempts[(key, title)] = attempts
+            if attempts >= MAX_SEND_ATTEMPTS:
+                expired.append(title)
+        if self._db:
+            await self._db.increment_outbox_attempts(key, titles)
+        if expired:
+            logger.error(
+                f"Failed to send the notification of {len(expired)} resources via "
+                f"{bot.name} {MAX_SEND_ATTEMPTS} times, dropped: {error}"
+            )
+            await self._remove(key, expired)
+            NOTIFICATIONS_DROPPED.inc(len(expired), bot=bot.name, reason="attempts")
+        if len(expired) < len(titles):
+            logger.warning(
+                f"Failed to send notification via {bot.name}, "
+                f"will retry in {self._interval}s: {error}"
+            )
+
+    async def _remove(self, key: str, titles: list[str]):
+        """Remove the resources from the outbox of the bot, sent or dropped"""
+        removed = set(titles)
+        self._pending[key] = [
+            r for r in self._pending[key] if r.resource_title not in removed
+        ]
+        for title in titles:
+            self._attempts.pop((key, title), None)
+        if self._db:
+            await self._db.delete_outbox(key, titles)
@@ -0,0 +1,174 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from loguru import logger
+
+# handler(item) -> items for the next stage
+StageHandler = Callable[[Any], Awaitable[list]]
+
+
+class Stage:
+    """A pipeline stage: a bounded queue consumed by a fixed number of workers.
+
+    Each item is passed to the handler, and the returned items are put into the
+    queue of the next stage. A full queue blocks the workers of the previous
+    stage, so a slow stage slows down its producers instead of buffering
+    without limit.
+    """
+
+    def __init__(
+        self, name: str, handler: StageHandler, workers: int = 1, maxsize: int = 100
+    ):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.next_stage: Optional["Stage"] = None
+        self._worker_tasks: list[asyncio.Task] = []
+
+        self.processed = 0
+        self.failed = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    async def _get_items(self) -> list:
+        return [await self.queue.get()]
+
+    async def _handle(self, items: list) -> list:
+        return await self.handler(items[0])
+
+    async def _worker(self):
+        while True:
+            items = await self._get_items()
+            start = time.perf_counter()
+            try:
+                outputs = await self._handle(items)
+            except Exception as e:
+                logger.error(f"Error in pipeline stage <{self.name}>: {e}")
+                self.failed += len(items)
+                outputs = []
+            elapsed = time.perf_counter() - start
+            self.processed += len(items)
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+            try:
+                if self.next_stage is not None:
+                    for output in outputs or []:
+                        await self.next_stage.queue.put(output)
+            finally:
+                # Mark done after the outputs are queued, so that joining the
+                # stages in order waits for the items to flow through
+                for _ in items:
+                    self.queue.task_done()
+
+    def start(self):
+        for i in range(self.workers):
+            task = asyncio.create_task(self._worker(), name=f"{self.name}-{i}")
+            self._worker_tasks.append(task)
+
+    async def stop(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks.clear()
+
+    def stats(self) -> dict:
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "queue_size": self.queue.qsize(),
+            "queue_maxsize": self.queue.maxsize,
+            "processed": self.processed,
+            "failed": self.failed,
+            "avg_latency": self.total_time / self.processed if self.processed else 0,
+            "max_latency": self.max_time,
+        }
+
+
+class BatchStage(Stage):
+    """A stage whose handler takes all the queued items at once (up to batch_size).
+
+    It doesn't wait for more items to come, so a lone item is handled at once.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: StageHandler,
+        workers: int = 1,
+        maxsize: int = 100,
+        batch_size: int = 20,
+    ):
+        super().__init__(name, handler, workers, maxsize)
+        self.batch_size = batch_size
+
+    async def _get_items(self) -> list:
+        items = [await self.queue.get()]
+        while len(items) < self.batch_size:
+            try:
+                items.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return items
+
+    async def _handle(self, items: list) -> list:
+        return await self.handler(items)
+
+
+class Pipeline:
+    """Chain of stages
+
+    Example:
+        >>> pipeline = Pipeline([Stage("a", handle_a, 2), BatchStage("b", handle_b)])
+        >>> pipeline.start()
+        >>> await pipeline.put(item)
+        >>> await pipeline.join()
+    """
+
+    def __init__(self, stages: list[Stage]):
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return
+        for stage in self.stages:
+            stage.start()
+        self.running = True
+
+    async def stop(self):
+        for stage in self.stages:
+            await stage.stop()
+        self.running = False
+
+    async def put(self, item, stage: Optional[str] = None):
+        """Put an item into the first stage, or into the stage of the given name"""
+        if stage is None:
+            await self.stages[0].queue.put(item)
+            return
+        for s in self.stages:
+            if s.name == stage:
+                await s.queue.put(item)
+                return
+        raise ValueError(f"No stage named {stage}")
+
+    async def join(self):
+        """Wait until all the queued items flow through the pipeline"""
+        for stage in self.stages:
+            await stage.queue.join()
+
+    def stats(self) -> list[dict]:
+        return [stage.stats() for stage in self.stages]
+
+    def __str__(self):
+        return ", ".join(
+            f"{s['stage']}: {s['queue_size']}/{s['queue_maxsize']} "
+            f"done={s['processed']} failed={s['failed']} "
+            f"avg={s['avg_latency']:.3f}s max={s['max_latency']:.3f}s"
+            for s in self.stats()
+        )
@@ -0,0 +1,238 @@
+import asyncio
+import json
+import os
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import Iterable, Optional
+
+from loguru import logger
+from pydantic import BaseModel, Field
+
+# Publish times kept per feed to learn its cadence
+MAX_HISTORY = 20
+
+
+def parse_published_date(published_date: Optional[str]) -> Optional[float]:
+    """Parse the published date of a feed entry to a timestamp.
+
+    Mikan uses ISO 8601 ("2024-07-17T19:09:00"), dmhy and acg.rip use RFC 822
+    ("Wed, 17 Jul 2024 19:09:00 +0800"). Naive dates are taken as UTC+8.
+    """
+    if not published_date:
+        return None
+    try:
+        dt = datetime.fromisoformat(published_date)
+    except ValueError:
+        try:
+            dt = parsedate_to_datetime(published_date)
+        except (TypeError, ValueError):
+            return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone(timedelta(hours=8)))
+    return dt.timestamp()
+
+
+class FeedSchedule(BaseModel):
+    interval: float
+    next_poll: float = 0
+    last_poll: Optional[float] = None
+    publish_times: list[float] = Field(default_factory=list)
+
+    def cadence(self) -> Optional[float]:
+        """Median gap between releases, None if there is not enough history"""
+        if len(self.publish_times) < 3:
+            return None
+        gaps = [b - a for a, b in zip(self.publish_times, self.publish_times[1:])]
+        # Releases of the same batch (e.g. several fansub versions) are not gaps
+        gaps = [gap for gap in gaps if gap > 3600]
+        if len(gaps) < 2:
+            return None
+        return statistics.median(gaps)
+
+    def expected_release(self, now: float, window: float) -> Optional[float]:
+        """The next release time predicted from the cadence"""
+        cadence = self.cadence()
+        if cadence is None:
+            return None
+        expected = self.publish_times[-1] + cadence
+        # Skip the missed releases, e.g. the anime takes a week off
+        while expected + window < now:
+            expected += cadence
+        return expected
+
+
+class PollScheduler:
+    """Decide when to poll each feed.
+
+    Each feed learns its release cadence from the published dates of its
+    entries. It is polled every min_interval around the expected release time,
+    and the interval doubles (up to max_interval) while nothing new comes out.
+    Feeds without a clear cadence, e.g. aggregate feeds, just back off while
+    quiet and reset to min_interval when new entries come.
+
+    Example:
+        >>> scheduler = PollScheduler(60, 3600)
+        >>> for url in scheduler.due(urls):
+        >>>     entries = await fetch(url)
+        >>>     scheduler.record_poll(url, [e.published_date for e in entries])
+        >>> await asyncio.sleep(scheduler.seconds_until_next(urls))
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 300,
+        max_interval: float = 300,
+        window: float = 3600,
+        backoff: float = 2.0,
+        state_path: Optional[str] = None,
+    ):
+        """
+        Args:
+            min_interval (float): Poll interval around the expected releases
+            max_interval (float): Max interval of quiet feeds
+            window (float): How long before and after the expected release
+                time the feed is polled every min_interval
+            backoff (float): Factor of the interval after an empty poll
+            state_path (str, optional): Json file to persist the schedule
+        """
+        if min_interval > max_interval:
+            raise ValueError("min_interval should not be greater than max_interval")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.window = window
+        self.backoff = backoff
+        self.state_path = state_path
+        self.feeds: dict[str, FeedSchedule] = {}
+        self.total_polls = 0
+        # Whether a poll was recorded since the last save
+        self.dirty = False
+        if state_path:
+            self.load()
+
+    def _get_feed(self, url: str) -> FeedSchedule:
+        if url not in self.feeds:
+            self.feeds[url] = FeedSchedule(interval=self.min_interval)
+        return self.feeds[url]
+
+    def record_poll(
+        self, url: str, published_dates: Iterable[Optional[str]], now: float = None
+    ) -> float:
+        """Update the schedule of a feed after polling it
+
+        Returns:
+            float: The next poll time of the feed
+        """
+        now = time.time() if now is None else now
+        feed = self._get_feed(url)
+        self.total_polls += 1
+
+        latest = feed.publish_times[-1] if feed.publish_times else float("-inf")
+        timestamps = [parse_published_date(d) for d in published_dates]
+        new_times = sorted(t for t in timestamps if t is not None and t > latest)
+        feed.publish_times = (feed.publish_times + new_times)[-MAX_HISTORY:]
+
+        if new_times and feed.last_poll is not None:
+            interval = self.min_interval
+        else:
+            interval = min(feed.interval * self.backoff, self.max_interval)
+
+        expected = feed.expected_release(now, self.window)
+        if expected is not None:
+            if expected - self.window <= now:
+                # In the release window
+                interval = self.min_interval
+            else:
+                # Don't sleep past the start of the next window
+                interval = min(interval, expected - self.window - now)
+        interval = max(interval, self.min_interval)
+
+        feed.interval = interval
+        feed.last_poll = now
+        feed.next_poll = now + interval
+        self.dirty = True
+        return feed.next_poll
+
+    def start_poll(self, url: str, now: float = None):
+        """Mark a feed as being polled, so it isn't due again before record_poll"""
+        now = time.time() if now is None else now
+        feed = self._get_feed(url)
+        feed.next_poll = now + feed.interval
+
+    def next_poll_time(self, url: str) -> float:
+        return self._get_feed(url).next_poll
+
+    def due(self, urls: Iterable[str], now: float = None) -> list[str]:
+        """The feeds to poll now"""
+        now = time.time() if now is None else now
+        return [url for url in urls if self.next_poll_time(url) <= now]
+
+    def seconds_until_next(self, urls: Iterable[str], now: float = None) -> float:
+        now = time.time() if now is None else now
+        next_poll = min((self.next_poll_time(url) for url in urls), default=None)
+        if next_poll is None:
+            return self.max_interval
+        return max(0, next_poll - now)
+
+    def schedule(self) -> dict[str, datetime]:
+        """{url: next poll time} of every feed"""
+        return {
+            url: datetime.fromtimestamp(feed.next_poll)
+            for url, feed in self.feeds.items()
+        }
+
+    def load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.feeds = {
+                url: FeedSchedule.model_validate(feed) for url, feed in data.items()
+            }
+        except Exception as e:
+            logger.warning(f"Failed to load poll schedule, start from scratch: {e}")
+            self.feeds = {}
+
+    def _write(self, data: dict) -> bool:
+        dirpath = os.path.dirname(self.state_path)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.state_path)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to save poll schedule: {e}")
+            return False
+
+    def _dump(self) -> dict:
+        return {url: feed.model_dump() for url, feed in self.feeds.items()}
+
+    def save(self):
+        if not self.state_path:
+            return
+        self.dirty = False
+        if not self._write(self._dump()):
+            self.dirty = True
+
+    async def save_changes(self):
+        """Save the schedule if a poll was recorded since the last save, the
+        file is written in a thread"""
+        if not self.state_path or not self.dirty:
+            return
+        self.dirty = False
+        # Dumped on the loop, the feeds may change while the file is written
+        if not await asyncio.to_thread(self._write, self._dump()):
+            self.dirty = True
+
+    def __str__(self):
+        now = time.time()
+        return "\n".join(
+            f"{url}: next poll in {max(0, feed.next_poll - now):.0f}s "
+            f"(interval {feed.interval:.0f}s)"
+            for url, feed in self.feeds.items()
+        )
@@ -0,0 +1,187 @@
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from loguru import logger
+
+from alist_mikananirss.common.database import SubscribeDatabase
+from alist_mikananirss.websites.models import ResourceInfo, VideoQuality
+
+from ..utils import FixedSizeSet
+
+EpisodeKey = tuple[str, int, int]
+
+
+@dataclass
+class _Candidate:
+    resource: ResourceInfo
+    deadline: float
+
+
+class ReleaseSelector:
+    """Download one release per episode when several fansubs publish it.
+
+    The releases of an episode are held for `window` seconds, then only the one
+    with the best score is downloaded. A release that comes later is downloaded
+    only if it scores better than the downloaded one (an upgrade).
+
+    Score, compared in order:
+        1. fansub: earlier in `fansubs` is better, unlisted fansubs are the worst
+        2. quality: earlier in `qualities` is better
+        3. languages: the sum of the weights of the languages, earlier in
+           `languages` weighs more
+        4. version
+
+    The held releases and the rejected ones are saved in the database, so a
+    restart neither loses the held releases nor processes the rejected ones
+    again.
+    """
+
+    def __init__(
+        self,
+        db: SubscribeDatabase,
+        window: float = 1800,
+        fansubs: Optional[list[str]] = None,
+        qualities: Optional[list[VideoQuality]] = None,
+        languages: Optional[list[str]] = None,
+        on_reject: Optional[Callable[[ResourceInfo], None]] = None,
+        persist: bool = True,
+    ):
+        self.db = db
+        self.window = window
+        self.fansubs = [f.lower() for f in fansubs or []]
+        self.qualities = list(
+            qualities or [VideoQuality.p2160, VideoQuality.p1080, VideoQuality.p720]
+        )
+        self.languages = list(languages or ["简", "繁", "日"])
+        self.on_reject = on_reject
+        # Save the held and rejected releases in the database, off for dry runs
+        self.persist = persist
+
+        self.pending: dict[EpisodeKey, _Candidate] = {}
+        self._rejected = FixedSizeSet()
+        self._loaded = False
+
+    @staticmethod
+    def episode_key(resource: ResourceInfo) -> Optional[EpisodeKey]:
+        if (
+            resource.anime_name is None
+            or resource.season is None
+            or resource.episode is None
+        ):
+            return None
+        return (resource.anime_name, resource.season, resource.episode)
+
+    @staticmethod
+    def _rank(value, preferences: list) -> int:
+        """len(preferences) for the first one, 0 for the unlisted ones"""
+        try:
+            return len(preferences) - preferences.index(value)
+        except ValueError:
+            return 0
+
+    def score(self, resource: ResourceInfo) -> tuple:
+        fansub = resource.fansub.lower() if resource.fansub else None
+        languages = set(resource.languages or [])
+        return (
+            self._rank(fansub, self.fansubs),
+            self._rank(resource.quality, self.qualities),
+            sum(self._rank(lang, self.languages) for lang in languages),
+            resource.version,
+        )
+
+    async def _reject(self, resource: ResourceInfo, reason: str):
+        logger.info(f"Skip {resource.resource_title}: {reason}")
+        self._rejected.add(resource.resource_title)
+        if self.persist:
+            await self.db.insert_skipped_resource(resource, "rejected")
+        if self.on_reject:
+            self.on_reject(resource)
+
+    def is_rejected(self, resource_title: str) -> bool:
+        return resource_title in self._rejected
+
+    async def load(self) -> list[ResourceInfo]:
+        """Hold the releases saved by the last run again, once
+
+        Returns:
+            list[ResourceInfo]: The releases loaded
+        """
+        if self._loaded:
+            return []
+        self._loaded = True
+        loaded = []
+        for resource, deadline in await self.db.get_pending_releases():
+            key = self.episode_key(resource)
+            if key is None or key in self.pending:
+                continue
+            self.pending[key] = _Candidate(resource, deadline)
+            loaded.append(resource)
+        if loaded:
+            logger.info(f"Loaded {len(loaded)} releases waiting for selection")
+        return loaded
+
+    async def _hold(self, key: EpisodeKey, candidate: _Candidate):
+        self.pending[key] = candidate
+        if self.persist:
+            await self.db.save_pending_release(candidate.resource, candidate.deadline)
+
+    async def add(
+        self, resource: ResourceInfo, now: float = None
+    ) -> list[ResourceInfo]:
+        """Add a new release
+
+        Returns:
+            list[ResourceInfo]: The releases to download now
+        """
+        key = self.episode_key(resource)
+        if key is None:
+            return [resource]
+        now = time.time() if now is None else now
+        new_score = self.score(resource)
+
+        downloaded = await self.db.get_resources_by_episode(*key)
+        if downloaded:
+            best = max(downloaded, key=self.score)
+            if new_score > self.score(best):
+                logger.info(
+                    f"Upgrade {best.resource_title} to {resource.resource_title}"
+                )
+                return [resource]
+            await self._reject(resource, f"{best.resource_title} is already downloaded")
+            return []
+
+        if self.window <= 0:
+            return [resource]
+
+        candidate = self.pending.get(key)
+        if candidate is None:
+            await self._hold(key, _Candidate(resource, now + self.window))
+        elif new_score > self.score(candidate.resource):
+            await self._reject(
+                candidate.resource, f"{resource.resource_title} is better"
+            )
+            await self._hold(key, _Candidate(resource, candidate.deadline))
+        else:
+            await self._reject(
+                resource, f"{candidate.resource.resource_title} is better"
+            )
+        return []
+
+    async def pop_ready(self, now: float = None) -> list[ResourceInfo]:
+        """The winners whose selection window has passed"""
+        now = time.time() if now is None else now
+        ready_keys = [k for k, c in self.pending.items() if c.deadline <= now]
+        ready = []
+        for key in ready_keys:
+            ready.append(self.pending.pop(key).resource)
+            if self.persist:
+                await self.db.delete_pending_release(*key)
+        return ready
+
+    def seconds_until_ready(self, now: float = None) -> Optional[float]:
+        """Time until the next window closes, None if nothing is pending"""
+        if not self.pending:
+            return None
+        now = time.time() if now is None else now
+        return max(0, min(c.deadline for c in self.pending.values()) - now)
@@ -1,3 +1,6 @@
+import asyncio
+import os
+import re
 from dataclasses import dataclass
 from typing import Optional
 
@@ -16,6 +19,12 @@ class RemapFrom:
     anime_name: Optional[str] = None
     season: Optional[str] = None
     fansub: Optional[str] = None
+    # anime_name and fansub are regular expressions, which must fully match
+    regex: bool = False
+
+
+# The fields of ResourceInfo which are used to match the remapper
+MATCH_FIELDS = ("anime_name", "season", "fansub")
 
 
 @dataclass
@@ -43,17 +52,50 @@ class Remapper:
     def __init__(self, from_: RemapFrom, to_: RemapTo):
         self.from_ = from_
         self.to_ = to_
+        self._name_pattern = None
+        self._fansub_pattern = None
+        if from_.regex:
+            if from_.anime_name:
+                self._name_pattern = re.compile(from_.anime_name)
+            if from_.fansub:
+                self._fansub_pattern = re.compile(from_.fansub)
+
+    @property
+    def is_regex(self) -> bool:
+        return self._name_pattern is not None or self._fansub_pattern is not None
+
+    @property
+    def index_key(self) -> tuple[tuple[bool, ...], tuple]:
+        """The key of the remapper in the exact match index
+
+        Returns:
+            tuple[tuple[bool, ...], tuple]: (which fields are required, values of them)
+        """
+        mask = tuple(bool(getattr(self.from_, f)) for f in MATCH_FIELDS)
+        values = tuple(
+            getattr(self.from_, f) for f, used in zip(MATCH_FIELDS, mask) if used
+        )
+        return mask, values
 
     def match(self, resource_info: ResourceInfo) -> bool:
-        if (
-            (
-                self.from_.anime_name
-                and resource_info.anime_name != self.from_.anime_name
-            )
-            or (self.from_.season and resource_info.season != self.from_.season)
-            or (self.from_.fansub and resource_info.fansub != self.from_.fansub)
+        if self._name_pattern:
+            if resource_info.anime_name is None or not self._name_pattern.fullmatch(
+                resource_info.anime_name
+            ):
+                return False
+        elif (
+            self.from_.anime_name and resource_info.anime_name != self.from_.anime_name
         ):
             return False
+        if self._fansub_pattern:
+            if resource_info.fansub is None or not self._fansub_pattern.fullmatch(
+                resource_info.fansub
+            ):
+                return False
+        elif self.from_.fansub and resource_info.fansub != self.from_.fansub:
+            return False
+        if self.from_.season and resource_info.season != self.from_.season:
+            return False
         return True
 
     def remap(self, resource_info: ResourceInfo):
@@ -76,6 +118,93 @@ class Remapper:
             resource_info.episode += self.to_.episode_offset
 
 
+class RemapRuleSet:
+    """Remappers indexed by the exact (anime_name, season, fansub) values.
+
+    A remapper only requires the fields set in its 'from' section, so the
+    remappers are grouped by which fields are required, and each group is a
+    dict of the required values. Regex remappers are checked one by one.
+    The first added remapper wins, the same as scanning the list in order.
+    """
+
+    def __init__(self, remappers: list[Remapper] = None):
+        self._remappers: list[Remapper] = []
+        # {fields mask: {values: (order, remapper)}}
+        self._index: dict[tuple[bool, ...], dict[tuple, tuple[int, Remapper]]] = {}
+        self._regex_remappers: list[tuple[int, Remapper]] = []
+        for remapper in remappers or []:
+            self.add(remapper)
+
+    def __len__(self):
+        return len(self._remappers)
+
+    @property
+    def remappers(self) -> list[Remapper]:
+        return self._remappers
+
+    def add(self, remapper: Remapper):
+        order = len(self._remappers)
+        self._remappers.append(remapper)
+        if remapper.is_regex:
+            self._regex_remappers.append((order, remapper))
+            return
+        mask, values = remapper.index_key
+        # Keep the first one, the later ones with the same key never match first
+        self._index.setdefault(mask, {}).setdefault(values, (order, remapper))
+
+    def match(self, resource_info: ResourceInfo) -> Remapper | None:
+        best: tuple[int, Remapper] | None = None
+        for mask, group in self._index.items():
+            values = tuple(
+                getattr(resource_info, f) for f, used in zip(MATCH_FIELDS, mask) if used
+            )
+            try:
+                hit = group.get(values)
+            except TypeError:
+                # unhashable values never equal to the values from config
+                continue
+            if hit and (best is None or hit[0] < best[0]):
+                best = hit
+        for order, remapper in self._regex_remappers:
+            if best is not None and order > best[0]:
+                break
+            if remapper.match(resource_info):
+                best = (order, remapper)
+                break
+        return best[1] if best else None
+
+
+def parse_remap_cfg(cfg_path: str) -> list[Remapper]:
+    """Parse the remap configuration file
+
+    Args:
+        cfg_path (str): Path to the remap configuration file
+
+    Returns:
+        list[Remapper]: The remappers in the order of the file
+    """
+    with open(cfg_path, "r", encoding="utf-8") as f:
+        yaml_data = yaml.safe_load(f)
+    remapper_cfgs = (yaml_data or {}).get("remap") or []
+    remappers = []
+    for cfg in remapper_cfgs:
+        from_ = RemapFrom(
+            cfg["from"].get("anime_name", None),
+            cfg["from"].get("season", None),
+            cfg["from"].get("fansub", None),
+            bool(cfg["from"].get("regex", False)),
+        )
+        episode_offset = cfg["to"].get("episode_offset", None)
+        episode_offset = int(episode_offset) if episode_offset else None
+        to_ = RemapTo(
+            cfg["to"].get("anime_name", None),
+            cfg["to"].get("season", None),
+            episode_offset,
+        )
+        remappers.append(Remapper(from_, to_))
+    return remappers
+
+
 class RemapperManager(metaclass=Singleton):
     """A class for managing Remapper objects
 
@@ -87,57 +216,79 @@ class RemapperManager(metaclass=Singleton):
     """
 
     def __init__(self):
-        self._remappers = []
+        self._rule_set = RemapRuleSet()
+        self._cfg_mtime = None
 
     @classmethod
     def load_remappers_from_cfg(cls, cfg_path: str):
-        with open(cfg_path, "r", encoding="utf-8") as f:
-            yaml_data = yaml.safe_load(f)
-            remapper_cfgs = yaml_data.get("remap")
-            for cfg in remapper_cfgs:
-                from_ = RemapFrom(
-                    cfg["from"].get("anime_name", None),
-                    cfg["from"].get("season", None),
-                    cfg["from"].get("fansub", None),
-                )
-                episode_offset = cfg["to"].get("episode_offset", None)
-                episode_offset = int(episode_offset) if episode_offset else None
-                to_ = RemapTo(
-                    cfg["to"].get("anime_name", None),
-                    cfg["to"].get("season", None),
-                    episode_offset,
-                )
-                RemapperManager.add_remapper(from_, to_)
+        """Load the remappers from the file, replacing the current ones"""
+        instance = cls()
+        mtime = os.path.getmtime(cfg_path)
+        rule_set = RemapRuleSet(parse_remap_cfg(cfg_path))
+        # Swap the whole rule set at once, so match() never sees a partial one
+        instance._rule_set = rule_set
+        instance._cfg_mtime = mtime
+        logger.info(f"Loaded {len(rule_set)} remap rules from {cfg_path}")
+
+    @classmethod
+    def reload_cfg(cls, cfg_path: str) -> bool:
+        """Reload the remappers from the file, keep the current ones if failed
+
+        Returns:
+            bool: Whether the remappers are reloaded
+        """
+        try:
+            cls.load_remappers_from_cfg(cfg_path)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to reload {cfg_path}, keep the previous rules: {e}")
+            return False
+
+    @classmethod
+    async def watch_cfg(cls, cfg_path: str, interval: int = 10):
+        """Reload the remappers when the file is modified"""
+        instance = cls()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                mtime = os.path.getmtime(cfg_path)
+            except OSError:
+                continue
+            if mtime != instance._cfg_mtime:
+                if not cls.reload_cfg(cfg_path):
+                    # Don't retry until the file is modified again
+                    instance._cfg_mtime = mtime
 
     @classmethod
     def add_remapper(cls, from_: RemapFrom, to_: RemapTo) -> Remapper:
         instance = cls()
         remapper = Remapper(from_, to_)
-        instance._remappers.append(remapper)
+        instance._rule_set.add(remapper)
         return remapper
 
     @classmethod
     def remove_remapper(cls, remapper: Remapper):
         instance = cls()
-        if remapper in instance._remappers:
-            instance._remappers.remove(remapper)
+        remappers = instance._rule_set.remappers
+        if remapper in remappers:
+            instance._rule_set = RemapRuleSet(
+                [r for r in remappers if r is not remapper]
+            )
 
     @classmethod
     def clear_remappers(cls):
         instance = cls()
-        instance._remappers.clear()
+        instance._rule_set = RemapRuleSet()
 
     @classmethod
     def get_all_remappers(cls) -> list:
         instance = cls()
-        return instance._remappers
+        return instance._rule_set.remappers
 
     @classmethod
     def match(cls, resource_info: ResourceInfo) -> Remapper | None:
         instance = cls()
-        for remapper in instance._remappers:
-            if remapper.match(resource_info):
-                return remapper
+        return instance._rule_set.match(resource_info)
 
     @classmethod
     def remap(cls, remapper: Remapper, resource_info: ResourceInfo):
@@ -1,5 +1,7 @@
 import asyncio
+import functools
 import os
+from dataclasses import dataclass
 
 from loguru import logger
 
@@ -9,18 +11,44 @@ from alist_mikananirss.websites.models import ResourceInfo
 from ..utils import Singleton
 
 
+@dataclass
+class _PendingRename:
+    old_filepath: str
+    resource: ResourceInfo
+    done: asyncio.Future
+
+
 class AnimeRenamer(metaclass=Singleton):
     _lock = asyncio.Lock()
 
-    def __init__(self, alist: Alist, rename_format: str):
+    def __init__(self, alist: Alist, rename_format: str, batch_window: float = 0):
+        """
+        Args:
+            alist (Alist)
+            rename_format (str)
+            batch_window (float, optional): Seconds to collect the files of the
+                same dir and rename them in one request. 0 to rename each file
+                at once. Defaults to 0.
+        """
         self.alist_client = alist
         self.rename_format = rename_format
+        self.batch_window = batch_window
+        self._pending: dict[str, list[_PendingRename]] = {}
+        self._flush_tasks: dict[str, asyncio.Task] = {}
 
     @classmethod
-    def initialize(cls, alist: Alist, rename_format: str):
-        cls(alist, rename_format)
+    def initialize(cls, alist: Alist, rename_format: str, batch_window: float = 0):
+        cls(alist, rename_format, batch_window)
 
-    async def _build_new_name(self, old_filepath: str, resource: ResourceInfo):
+    async def _build_new_name(
+        self, old_filepath: str, resource: ResourceInfo, special_offset: int = 0
+    ):
+        """
+        Args:
+            special_offset (int, optional): For season 0, how many files of the
+                same batch come after this one, so they don't get the same
+                number. Defaults to 0.
+        """
         name = resource.anime_name
         season = resource.season
         episode = resource.episode
@@ -35,8 +63,8 @@ class AnimeRenamer(metaclass=Singleton):
 
         if season == 0:
             # 总集篇/OVA 则以顺序命名
-            file_list = await self.alist_client.list_dir(old_filedir, per_page=999)
-            episode = len(file_list)
+            file_list = await self.alist_client.list_dir_all(old_filedir)
+            episode = len(file_list) - special_offset
 
         new_filename = self.rename_format.format(
             name=name,
@@ -51,20 +79,18 @@ class AnimeRenamer(metaclass=Singleton):
         new_filename += f".{file_ext}"
         return new_filename
 
-    @classmethod
-    async def rename(cls, old_filepath: str, resource: ResourceInfo, max_retry=3):
-        if (
-            resource.anime_name is None
-            or resource.season is None
-            or resource.episode is None
-        ):
-            logger.error(f"rename failed due to resource info is invalid: {resource}")
-            return
-        instance = cls()
+    async def _rename_one(
+        self,
+        old_filepath: str,
+        resource: ResourceInfo,
+        max_retry: int = 3,
+        new_filename: str = None,
+    ):
         for i in range(max_retry):
             try:
-                new_filename = await instance._build_new_name(old_filepath, resource)
-                await instance.alist_client.rename(old_filepath, new_filename)
+                if new_filename is None:
+                    new_filename = await self._build_new_name(old_filepath, resource)
+                await self.alist_client.rename(old_filepath, new_filename)
                 logger.info(f"Rename {old_filepath} to {new_filename}")
                 break
             except Exception as e:
@@ -73,3 +99,120 @@ class AnimeRenamer(metaclass=Singleton):
                 else:
                     logger.error(f"Error when rename {old_filepath}: {e}")
                 await asyncio.sleep(5)
+
+    async def _rename_batch(
+        self, dirpath: str, items: list[_PendingRename], max_retry: int = 3
+    ):
+        """Rename the files of a dir in one request, fallback to rename them
+        one by one if failed."""
+        # New files came, the cached listing is outdated
+        self.alist_client.invalidate_dir_cache(dirpath)
+        if len(items) == 1:
+            await self._rename_one(items[0].old_filepath, items[0].resource, max_retry)
+            return
+        # The specials are numbered by the file count, give each one of the
+        # batch its own number
+        specials = [item for item in items if item.resource.season == 0]
+        special_offsets = {
+            item.old_filepath: len(specials) - 1 - i for i, item in enumerate(specials)
+        }
+        new_filenames: dict[str, str] = {}
+        rename_pairs = []
+        fallback_items = []
+        for item in items:
+            try:
+                new_filename = await self._build_new_name(
+                    item.old_filepath,
+                    item.resource,
+                    special_offsets.get(item.old_filepath, 0),
+                )
+            except Exception as e:
+                logger.warning(f"Failed to build name of {item.old_filepath}: {e}")
+                fallback_items.append(item)
+                continue
+            new_filenames[item.old_filepath] = new_filename
+            rename_pairs.append((os.path.basename(item.old_filepath), new_filename))
+        if rename_pairs:
+            try:
+                await self.alist_client.batch_rename(dirpath, rename_pairs)
+                for old_name, new_name in rename_pairs:
+                    logger.info(f"Rename {dirpath}/{old_name} to {new_name}")
+            except Exception as e:
+                logger.warning(
+                    f"Failed to batch rename {len(rename_pairs)} files in {dirpath}, "
+                    f"rename them one by one: {e}"
+                )
+                fallback_items = await self._not_renamed(dirpath, items)
+        for item in fallback_items:
+            await self._rename_one(
+                item.old_filepath,
+                item.resource,
+                max_retry,
+                new_filenames.get(item.old_filepath),
+            )
+
+    async def _not_renamed(
+        self, dirpath: str, items: list[_PendingRename]
+    ) -> list[_PendingRename]:
+        """The items whose file still has its old name, a failed batch rename
+        may have renamed some of them on the server"""
+        self.alist_client.invalidate_dir_cache(dirpath)
+        try:
+            filenames = set(await self.alist_client.list_dir_all(dirpath))
+        except Exception as e:
+            logger.warning(f"Failed to list {dirpath}, retry all the files: {e}")
+            return items
+        remaining = []
+        for item in items:
+            if os.path.basename(item.old_filepath) in filenames:
+                remaining.append(item)
+            else:
+                logger.info(f"{item.old_filepath} is already renamed")
+        return remaining
+
+    async def _flush_later(self, dirpath: str, max_retry: int):
+        items: list[_PendingRename] = []
+        try:
+            await asyncio.sleep(self.batch_window)
+            self._flush_tasks.pop(dirpath, None)
+            items = self._pending.pop(dirpath, [])
+            await self._rename_batch(dirpath, items, max_retry)
+        finally:
+            for item in items:
+                if not item.done.done():
+                    item.done.set_result(None)
+
+    def _on_flush_done(self, dirpath: str, task: asyncio.Task):
+        """Cancel the waiting renames if the flush task was cancelled before
+        taking them, so the callers of rename() don't wait forever"""
+        if not task.cancelled() or self._flush_tasks.get(dirpath) is not task:
+            return
+        self._flush_tasks.pop(dirpath)
+        for item in self._pending.pop(dirpath, []):
+            item.done.cancel()
+
+    @classmethod
+    async def rename(cls, old_filepath: str, resource: ResourceInfo, max_retry=3):
+        if (
+            resource.anime_name is None
+            or resource.season is None
+            or resource.episode is None
+        ):
+            logger.error(f"rename failed due to resource info is invalid: {resource}")
+            return
+        instance = cls()
+        if instance.batch_window <= 0:
+            instance.alist_client.invalidate_dir_cache(os.path.dirname(old_filepath))
+            await instance._rename_one(old_filepath, resource, max_retry)
+            return
+        # Wait for the other files of the same dir, then rename them together
+        dirpath = os.path.dirname(old_filepath)
+        item = _PendingRename(
+            old_filepath, resource, asyncio.get_running_loop().create_future()
+        )
+        instance._pending.setdefault(dirpath, []).append(item)
+        if dirpath not in instance._flush_tasks:
+            task = asyncio.create_task(instance._flush_later(dirpath, max_retry))
+            task.add_done_callback(functools.partial(instance._on_flush_done, dirpath))
+            instance._flush_tasks[dirpath] = task
+        await item.done
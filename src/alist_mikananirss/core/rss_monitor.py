@@ -1,17 +1,86 @@
 import asyncio
+import math
+import time
+import weakref
+from datetime import datetime
+from typing import Optional
 
 from loguru import logger
+from pydantic import ValidationError
 
 from alist_mikananirss import SubscribeDatabase
+from alist_mikananirss.common.config.basic import PipelineConfig, SubscriptionConfig
+from alist_mikananirss.utils.metrics import labels, metrics
+from alist_mikananirss.utils.tracing import Trace, span, trace_log, use_trace
 from alist_mikananirss.websites import Website, WebsiteFactory
-from alist_mikananirss.websites.models import ResourceInfo
+from alist_mikananirss.websites.models import FeedEntry, ResourceInfo
 
 from .download_manager import DownloadManager
-from .filter import RegexFilter
+from .filter import RegexFilter, SubscriptionFilter
+from .pipeline import BatchStage, Pipeline, Stage
+from .poll_scheduler import PollScheduler
+from .release_selector import ReleaseSelector
 from .remapper import (
     RemapperManager,
 )
 
+# The pipeline.* options of the config
+DEFAULT_PIPELINE_OPTIONS = PipelineConfig().model_dump()
+
+RSS_POLLS = metrics.counter("rss_polls", "Rss feeds polled")
+RSS_POLL_SECONDS = metrics.histogram(
+    "rss_poll_seconds", "Time to collect the new resources of the feeds in one go"
+)
+RSS_NEW_RESOURCES = metrics.counter("rss_new_resources", "New resources found")
+RSS_EXTRACT_ERRORS = metrics.counter(
+    "rss_extract_errors", "Resources passed because their info failed to extract"
+)
+
+# The monitor whose pipeline was started last, read by the metric callbacks.
+# A weak reference, the monitors built only to manage the subscriptions are
+# not kept alive by the metrics.
+_current_monitor: Optional[weakref.ReferenceType] = None
+
+
+def _current() -> Optional["RssMonitor"]:
+    return _current_monitor() if _current_monitor is not None else None
+
+
+def _stage_stat(key: str):
+    def collect():
+        monitor = _current()
+        if monitor is None or monitor.pipeline is None:
+            return {}
+        return {
+            labels(stage=stat["stage"]): stat[key] for stat in monitor.pipeline.stats()
+        }
+
+    return collect
+
+
+def _inflight_count() -> int:
+    monitor = _current()
+    return len(monitor._inflight_titles) if monitor is not None else 0
+
+
+metrics.gauge(
+    "pipeline_queue_size", "Items waiting in a stage", _stage_stat("queue_size")
+)
+metrics.counter(
+    "pipeline_processed", "Items handled by a stage", _stage_stat("processed")
+)
+metrics.counter("pipeline_failed", "Items failed in a stage", _stage_stat("failed"))
+metrics.gauge(
+    "pipeline_stage_max_seconds",
+    "Longest time of a stage to handle an item",
+    _stage_stat("max_latency"),
+)
+metrics.gauge(
+    "rss_inflight_resources",
+    "Resources being extracted or waiting for submission",
+    _inflight_count,
+)
+
 
 class RssMonitor:
     def __init__(
@@ -20,76 +89,465 @@ class RssMonitor:
         filter: RegexFilter,
         db: SubscribeDatabase,
         use_extractor: bool = False,
+        subscription_filters: dict[str, SubscriptionFilter] = None,
     ) -> None:
-        """The rss feed manager"""
-        self.subscribe_urls = subscribe_urls
+        """The rss feed manager
+
+        Args:
+            subscribe_urls (list[str]): RSS urls to monitor
+            filter (RegexFilter): The global filter
+            db (SubscribeDatabase)
+            use_extractor (bool): Whether to extract resource info via extractor
+            subscription_filters (dict[str, SubscriptionFilter], optional):
+                {rss_url: filter} rules of single subscriptions
+        """
+        self.subscribe_urls = list(subscribe_urls)
         self.websites = [
             WebsiteFactory.get_website_parser(url) for url in subscribe_urls
         ]
         self.filter = filter
+        self.subscription_filters = subscription_filters or {}
         self.db = db
         self.use_extractor = use_extractor
+        # Urls of the subscriptions added at runtime, saved in the database
+        self._runtime_urls: set[str] = set()
 
         self.interval_time = 300
+        self.scheduler: Optional[PollScheduler] = None
+        self.selector: Optional[ReleaseSelector] = None
+        self._selection_task: Optional[asyncio.Task] = None
+
+        self.pipeline_options = dict(DEFAULT_PIPELINE_OPTIONS)
+        self.pipeline: Optional[Pipeline] = None
+        # Titles between the dedupe stage and the submit stage
+        self._inflight_titles: set[str] = set()
+        # Set by run_once: the resources reaching the submit stage, and
+        # whether to only collect them instead of submitting
+        self._submitted: Optional[list[ResourceInfo]] = None
+        self._dry_run = False
 
     def set_interval_time(self, interval_time: int):
         self.interval_time = interval_time
 
+    def set_poll_scheduler(self, scheduler: PollScheduler):
+        """Poll the feeds adaptively instead of every interval_time"""
+        self.scheduler = scheduler
+
+    def set_release_selector(self, selector: ReleaseSelector):
+        """Download only the best release of each episode"""
+        self.selector = selector
+        selector.on_reject = self._on_reject
+
+    def _on_reject(self, resource: ResourceInfo):
+        self._inflight_titles.discard(resource.resource_title)
+        if resource.trace:
+            resource.trace.finish("rejected")
+
+    async def _load_selector(self):
+        """Hold the releases left waiting for selection by the last run"""
+        if self.selector is None:
+            return
+        for resource_info in await self.selector.load():
+            self._inflight_titles.add(resource_info.resource_title)
+
+    def _get_scheduler(self) -> PollScheduler:
+        if self.scheduler is None:
+            # Fixed interval
+            self.scheduler = PollScheduler(self.interval_time, self.interval_time)
+        return self.scheduler
+
+    def next_poll_times(self) -> dict[str, datetime]:
+        """{rss_url: next poll time} of every feed"""
+        return self._get_scheduler().schedule()
+
+    def set_pipeline_options(self, **options):
+        """Set the worker counts and queue sizes of the pipeline, see DEFAULT_PIPELINE_OPTIONS"""
+        if self.pipeline is not None and self.pipeline.running:
+            raise RuntimeError("Can't change the options of a running pipeline")
+        unknown = set(options) - set(DEFAULT_PIPELINE_OPTIONS)
+        if unknown:
+            raise ValueError(f"Unknown pipeline options: {', '.join(unknown)}")
+        self.pipeline_options.update(options)
+        self.pipeline = None
+
+    def _add_website(self, url: str, sub_filter: SubscriptionFilter) -> Website:
+        website = WebsiteFactory.get_website_parser(url)
+        self.subscribe_urls.append(url)
+        self.websites.append(website)
+        self.subscription_filters[url] = sub_filter
+        return website
+
+    def _remove_website(self, url: str):
+        # The entries of the feed already in the pipeline are still processed
+        self.subscribe_urls.remove(url)
+        self.websites = [w for w in self.websites if w.rss_url != url]
+        self.subscription_filters.pop(url, None)
+        if self.scheduler is not None:
+            self.scheduler.feeds.pop(url, None)
+
+    def list_subscriptions(self) -> list[tuple[str, bool]]:
+        """[(rss_url, added at runtime)] of all the subscriptions"""
+        return [(url, url in self._runtime_urls) for url in self.subscribe_urls]
+
+    async def load_subscriptions(self):
+        """Sync the subscriptions added at runtime with the database, where the
+        CLI may change them from another process
+        """
+        saved = dict(await self.db.get_subscriptions())
+        for url in self._runtime_urls - saved.keys():
+            self._remove_website(url)
+            self._runtime_urls.discard(url)
+            logger.info(f"Unsubscribed {url}")
+        for url, rules in saved.items():
+            if url in self.subscribe_urls:
+                continue
+            try:
+                sub = SubscriptionConfig(url=url, **rules)
+            except ValidationError as e:
+                logger.error(f"Invalid subscription {url} in the database: {e}")
+                continue
+            self._add_website(url, SubscriptionFilter.from_config(sub))
+            self._runtime_urls.add(url)
+            logger.info(f"Subscribed {url}")
+
+    async def add_subscription(self, sub: SubscriptionConfig) -> Website:
+        """Subscribe to a feed without restarting, saved in the database
+
+        The feed is polled at once if the monitor is running.
+        """
+        if sub.url in self.subscribe_urls:
+            raise ValueError(f"Already subscribed: {sub.url}")
+        rules = sub.model_dump(mode="json", exclude={"url"}, exclude_defaults=True)
+        # Added before saving, so a load_subscriptions running meanwhile sees
+        # the url and doesn't add the website again
+        website = self._add_website(sub.url, SubscriptionFilter.from_config(sub))
+        try:
+            inserted = await self.db.insert_subscription(sub.url, rules)
+        except BaseException:
+            self._remove_website(sub.url)
+            raise
+        if not inserted:
+            self._remove_website(sub.url)
+            raise ValueError(f"Already subscribed: {sub.url}")
+        self._runtime_urls.add(sub.url)
+        logger.info(f"Subscribed {sub.url}")
+        if self.pipeline is not None and self.pipeline.running:
+            self._get_scheduler().start_poll(sub.url)
+            await self.poll([website])
+        return website
+
+    async def remove_subscription(self, url: str):
+        """Unsubscribe from a feed added at runtime"""
+        if url not in self._runtime_urls:
+            if url in self.subscribe_urls:
+                raise ValueError(f"{url} is subscribed in the config file")
+            raise ValueError(f"Not subscribed: {url}")
+        await self.db.delete_subscription(url)
+        self._remove_website(url)
+        self._runtime_urls.discard(url)
+        logger.info(f"Unsubscribed {url}")
+
+    def _filter_entries(
+        self, website: Website, feed_entries: list[FeedEntry], m_filter: RegexFilter
+    ) -> list[FeedEntry]:
+        sub_filter = self.subscription_filters.get(website.rss_url)
+        if sub_filter:
+            return sub_filter.filt_entries(feed_entries, m_filter)
+        matched_indices = m_filter.filt_list(
+            [entry.resource_title for entry in feed_entries]
+        )
+        return [feed_entries[i] for i in matched_indices]
+
+    @staticmethod
+    async def _fetch_entries(website: Website) -> list[FeedEntry]:
+        """Get the feed entries, each with a new trace starting at the fetch if
+        tracing is enabled"""
+        start, start_perf = time.time(), time.perf_counter()
+        feed_entries = await website.get_feed_entries()
+        duration = time.perf_counter() - start_perf
+        RSS_POLLS.inc()
+        if not trace_log.enabled:
+            return feed_entries
+        for entry in feed_entries:
+            entry.trace = Trace(entry.resource_title, start)
+            entry.trace.add_span("fetch", start, duration)
+        return feed_entries
+
+    async def _extract(self, website: Website, entry: FeedEntry) -> ResourceInfo:
+        """Extract the resource info within the trace of the entry"""
+        trace = entry.trace
+        with use_trace(trace):
+            if trace is None:
+                return await website.extract_resource_info(entry, self.use_extractor)
+            trace.begin("extract")
+            try:
+                resource_info = await website.extract_resource_info(
+                    entry, self.use_extractor
+                )
+            except Exception as e:
+                trace.finish("extract_failed", repr(e))
+                raise
+            trace.end("extract")
+        resource_info.trace = trace
+        return resource_info
+
+    @staticmethod
+    def _log_new_resource(resource_info: ResourceInfo):
+        # One line for each resource, the full info only when debugging
+        logger.info("Find new resource: {}", resource_info.brief())
+        logger.debug("Resource info:\n{}", resource_info)
+
+    @staticmethod
+    def _remap(resource_info: ResourceInfo):
+        remapper = RemapperManager.match(resource_info)
+        if remapper:
+            remapper.remap(resource_info)
+
     async def get_new_resources(
         self,
         m_websites: list[Website],
         m_filter: RegexFilter,
     ) -> list[ResourceInfo]:
         """Parse all rss url and get the filtered, unique resource info list"""
+        # Shared by the entries, a semaphore per entry would not bound anything
+        semaphore = asyncio.Semaphore(self.pipeline_options["extract_workers"])
 
         async def process_entry(self, website: Website, entry):
             """Parse all rss url and get the filtered, unique resource info list"""
-            async with asyncio.Semaphore(8):
+            async with semaphore:
                 try:
-                    resource_info = await website.extract_resource_info(
-                        entry, self.use_extractor
-                    )
+                    resource_info = await self._extract(website, entry)
                 except Exception as e:
                     logger.error(f"Pass {entry.resource_title} because of error: {e}")
+                    RSS_EXTRACT_ERRORS.inc()
                     return None
-                remapper = RemapperManager.match(resource_info)
-                if remapper:
-                    remapper.remap(resource_info)
+                self._remap(resource_info)
                 return resource_info
 
         new_resources_set: set[ResourceInfo] = set()
 
+        start = time.perf_counter()
         for website in m_websites:
-            feed_entries = await website.get_feed_entries()
-            feed_entries_filted = filter(
-                lambda entry: m_filter.filt_single(entry.resource_title),
-                feed_entries,
-            )
+            # Stages of the current trace, e.g. of a BotAssistant job
+            with span("fetch"):
+                feed_entries = await self._fetch_entries(website)
+            feed_entries_filted = self._filter_entries(website, feed_entries, m_filter)
             tasks = []
             for entry in feed_entries_filted:
-                if await self.db.is_resource_title_exist(entry.resource_title):
+                if await self._is_known(entry.resource_title):
                     continue
                 task = asyncio.create_task(process_entry(self, website, entry))
                 tasks.append(task)
-            results = await asyncio.gather(*tasks)
+            with span("extract"):
+                results = await asyncio.gather(*tasks)
             for resource_info in results:
                 if not resource_info:
                     continue
                 new_resources_set.add(resource_info)
-                logger.info(f"Find new resource: {resource_info}")
+                self._log_new_resource(resource_info)
 
         new_resources = list(new_resources_set)
+        RSS_POLL_SECONDS.observe(time.perf_counter() - start)
+        RSS_NEW_RESOURCES.inc(len(new_resources))
         return new_resources
 
-    async def run(self):
+    async def _fetch_stage(self, website: Website):
+        feed_entries = await self._fetch_entries(website)
+        self._get_scheduler().record_poll(
+            website.rss_url, [entry.published_date for entry in feed_entries]
+        )
+        return [(website, feed_entries)]
+
+    async def _filter_stage(self, item: tuple[Website, list[FeedEntry]]):
+        website, feed_entries = item
+        entries = self._filter_entries(website, feed_entries, self.filter)
+        return [(website, entry) for entry in entries]
+
+    async def _is_known(self, title: str) -> bool:
+        """Whether the resource is downloaded or skipped already"""
+        if await self.db.is_resource_title_exist(title):
+            return True
+        return await self.db.is_resource_skipped(title)
+
+    async def _dedupe_stage(self, item: tuple[Website, FeedEntry]):
+        _, entry = item
+        title = entry.resource_title
+        if title in self._inflight_titles:
+            return []
+        if self.selector and self.selector.is_rejected(title):
+            return []
+        if await self._is_known(title):
+            return []
+        self._inflight_titles.add(title)
+        return [item]
+
+    async def _extract_stage(self, item: tuple[Website, FeedEntry]):
+        website, entry = item
+        try:
+            resource_info = await self._extract(website, entry)
+        except Exception as e:
+            logger.error(f"Pass {entry.resource_title} because of error: {e}")
+            RSS_EXTRACT_ERRORS.inc()
+            self._inflight_titles.discard(entry.resource_title)
+            return []
+        return [resource_info]
+
+    async def _remap_stage(self, resource_info: ResourceInfo):
+        self._remap(resource_info)
+        self._log_new_resource(resource_info)
+        RSS_NEW_RESOURCES.inc()
+        return [resource_info]
+
+    async def _select_stage(self, resource_info: ResourceInfo):
+        if self.selector is None:
+            return [resource_info]
+        if resource_info.trace:
+            resource_info.trace.begin("select")
+        selected = await self.selector.add(resource_info)
+        for resource in selected:
+            if resource.trace:
+                resource.trace.end("select")
+        return selected
+
+    async def _submit_selected(self):
+        """Submit the winners of the release selection when their window closes"""
         while 1:
-            logger.info("Start update checking")
-            new_resources = await self.get_new_resources(self.websites, self.filter)
-            if not new_resources:
-                logger.info("No new resources")
-            else:
-                await DownloadManager.add_download_tasks(new_resources)
-            await asyncio.sleep(self.interval_time)
+            delay = self.selector.seconds_until_ready()
+            await asyncio.sleep(min(delay if delay is not None else 60, 60))
+            for resource_info in await self.selector.pop_ready():
+                logger.info(f"Select {resource_info.resource_title}")
+                if resource_info.trace:
+                    resource_info.trace.end("select")
+                await self.pipeline.put(resource_info, stage="submit")
+
+    async def _submit_stage(self, resources: list[ResourceInfo]):
+        if self._submitted is not None:
+            self._submitted.extend(resources)
+        try:
+            if not self._dry_run:
+                await DownloadManager.add_download_tasks(resources)
+        finally:
+            for resource in resources:
+                self._inflight_titles.discard(resource.resource_title)
+        return []
+
+    def _build_pipeline(self) -> Pipeline:
+        opts = self.pipeline_options
+        size = opts["queue_size"]
+        return Pipeline(
+            [
+                Stage("fetch", self._fetch_stage, opts["fetch_workers"], size),
+                Stage("filter", self._filter_stage, 1, size),
+                Stage("dedupe", self._dedupe_stage, 1, size),
+                Stage("extract", self._extract_stage, opts["extract_workers"], size),
+                Stage("remap", self._remap_stage, 1, size),
+                Stage("select", self._select_stage, 1, size),
+                BatchStage(
+                    "submit",
+                    self._submit_stage,
+                    1,
+                    size,
+                    batch_size=opts["submit_batch_size"],
+                ),
+            ]
+        )
+
+    def start_pipeline(self) -> Pipeline:
+        global _current_monitor
+        _current_monitor = weakref.ref(self)
+        if self.pipeline is None:
+            self.pipeline = self._build_pipeline()
+        self.pipeline.start()
+        if self.selector and self._selection_task is None:
+            self._selection_task = asyncio.create_task(self._submit_selected())
+        return self.pipeline
+
+    async def stop_pipeline(self):
+        if self._selection_task is not None:
+            self._selection_task.cancel()
+            await asyncio.gather(self._selection_task, return_exceptions=True)
+            self._selection_task = None
+        if self.pipeline is not None:
+            await self.pipeline.stop()
+
+    async def poll(self, websites: list[Website] = None):
+        """Feed the websites into the pipeline, without waiting for them to be processed"""
+        pipeline = self.start_pipeline()
+        for website in self.websites if websites is None else websites:
+            await pipeline.put(website)
+
+    async def run_once(
+        self, websites: list[Website] = None, dry_run: bool = False
+    ) -> list[ResourceInfo]:
+        """Poll the feeds once and wait until their new resources are submitted
+
+        The releases held by the release selector are submitted at the end,
+        without waiting for their window.
+
+        Args:
+            websites (list[Website], optional): The feeds to poll, all the
+                subscriptions by default
+            dry_run (bool): Only collect the resources which would be
+                submitted, nothing is downloaded
+
+        Returns:
+            list[ResourceInfo]: The resources submitted, or to submit with dry_run
+        """
+        if self.pipeline is not None and self.pipeline.running:
+            raise RuntimeError("Can't poll once while the pipeline is running")
+        self._submitted = []
+        self._dry_run = dry_run
+        if self.selector:
+            # A dry run leaves the database as it is
+            persist = self.selector.persist
+            self.selector.persist = not dry_run
+        try:
+            await self._load_selector()
+            await self.poll(websites)
+            await self.pipeline.join()
+            if self.selector:
+                for resource_info in await self.selector.pop_ready(now=math.inf):
+                    if resource_info.trace:
+                        resource_info.trace.end("select")
+                    await self.pipeline.put(resource_info, stage="submit")
+                await self.pipeline.join()
+            submitted = self._submitted
+        finally:
+            await self.stop_pipeline()
+            self._submitted = None
+            self._dry_run = False
+            if self.selector:
+                self.selector.persist = persist
+        if dry_run:
+            for resource_info in submitted:
+                if resource_info.trace:
+                    resource_info.trace.finish("dry_run")
+        return submitted
+
+    async def run(self):
+        scheduler = self._get_scheduler()
+        try:
+            await self._load_selector()
+            while 1:
+                try:
+                    await self.load_subscriptions()
+                except Exception as e:
+                    logger.error(f"Failed to load the subscriptions: {e}")
+                urls = [website.rss_url for website in self.websites]
+                due_urls = set(scheduler.due(urls))
+                if due_urls:
+                    logger.info(f"Start update checking of {len(due_urls)} feeds")
+                    websites = [w for w in self.websites if w.rss_url in due_urls]
+                    for website in websites:
+                        scheduler.start_poll(website.rss_url)
+                    await self.poll(websites)
+                    logger.debug("Pipeline status: {}", self.pipeline)
+                await scheduler.save_changes()
+                await asyncio.sleep(scheduler.seconds_until_next(urls))
+        finally:
+            await self.stop_pipeline()
+            if scheduler.dirty:
+                scheduler.save()
 
     async def run_once_with_url(self, url: str):
         logger.info(f"Start update checking for {url}")
@@ -98,5 +556,6 @@ class RssMonitor:
         if not new_resources:
             logger.info("No new resources")
         else:
-            await DownloadManager.add_download_tasks(new_resources)
+            with span("submit"):
+                await DownloadManager.add_download_tasks(new_resources)
         return new_resources
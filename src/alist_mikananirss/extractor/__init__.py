@@ -4,5 +4,11 @@ from .base import ExtractorBase
 from .extractor import Extractor
 from .llm import create_llm_provider
 from .llm_extractor import LLMExtractor
-from .models import AnimeNameExtractResult, ResourceTitleExtractResult, VideoQuality
+from .models import (
+    AnimeNameExtractResult,
+    ResourceTitleExtractResult,
+    SeriesResolution,
+    VideoQuality,
+)
 from .regex import RegexExtractor
+from .series_memo import SeriesMemo, build_series_key
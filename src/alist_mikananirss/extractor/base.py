@@ -1,7 +1,13 @@
+from typing import Optional
+
 from .models import AnimeNameExtractResult, ResourceTitleExtractResult
+from .series_memo import SeriesMemo
 
 
 class ExtractorBase:
+    # Series resolution table, None if the extractor doesn't resolve series
+    series_memo: Optional[SeriesMemo] = None
+
     def __init__(self):
         # 模板类，初始化为空
         pass
@@ -18,12 +24,18 @@ class ExtractorBase:
         raise NotImplementedError
 
     async def analyse_resource_title(
-        self, resource_title: str, use_tmdb: bool = True
+        self,
+        resource_title: str,
+        use_tmdb: bool = True,
+        series_key: Optional[str] = None,
     ) -> ResourceTitleExtractResult:
         """Analyse the resource title to get resource info.
 
         Args:
             resource_title (str)
+            use_tmdb (bool): Whether to get the anime name from TMDB
+            series_key (str, optional): The series identity used to reuse the
+                TMDB result across episodes.
 
         Returns:
             ResourceTitleExtractResult: The extracted info in resource title.
@@ -1,10 +1,22 @@
+from typing import Optional
+
 from async_lru import alru_cache
 
 from ..utils import Singleton
+from ..utils.metrics import metrics
 from .base import ExtractorBase
-from .models import AnimeNameExtractResult, ResourceTitleExtractResult
+from .models import (
+    AnimeNameExtractResult,
+    ResourceTitleExtractResult,
+    SeriesResolution,
+)
 from .regex import RegexExtractor
 
+EXTRACT_SECONDS = metrics.histogram(
+    "extractor_resource_title_seconds",
+    "Time to extract the info of a resource title, cache hits excluded",
+)
+
 
 class Extractor(metaclass=Singleton):
     def __init__(self, extractor: ExtractorBase = None):
@@ -28,10 +40,13 @@ class Extractor(metaclass=Singleton):
 
     @alru_cache(maxsize=128)
     async def _analyse_resource_title(
-        self, resource_name: str, use_tmdb: bool = True
+        self, resource_name: str, use_tmdb: bool = True, series_key: str = None
     ) -> ResourceTitleExtractResult:
         """Analyse the resource title."""
-        return await self._extractor.analyse_resource_title(resource_name, use_tmdb)
+        with EXTRACT_SECONDS.time():
+            return await self._extractor.analyse_resource_title(
+                resource_name, use_tmdb, series_key
+            )
 
     @classmethod
     async def analyse_anime_name(cls, anime_name: str) -> AnimeNameExtractResult:
@@ -43,9 +58,50 @@ class Extractor(metaclass=Singleton):
 
     @classmethod
     async def analyse_resource_title(
-        cls, resource_name: str, use_tmdb: bool = True
+        cls, resource_name: str, use_tmdb: bool = True, series_key: str = None
     ) -> ResourceTitleExtractResult:
         instance = cls()
         if instance._extractor is None:
             raise RuntimeError("Extractor is not initialized")
-        return await instance._analyse_resource_title(resource_name, use_tmdb)
+        return await instance._analyse_resource_title(
+            resource_name, use_tmdb, series_key
+        )
+
+    @classmethod
+    def override_series(
+        cls,
+        series_key: str,
+        anime_name: str,
+        season: Optional[int] = None,
+        tvid: Optional[int] = None,
+    ) -> SeriesResolution:
+        """Manually set the anime name/season of a series.
+
+        Args:
+            series_key (str): The series identity, see `build_series_key`
+            anime_name (str): The anime name to use for all episodes of the series
+            season (int, optional): The season to use for all episodes of the series
+            tvid (int, optional): The tmdb id of the anime
+        """
+        instance = cls()
+        if instance._extractor is None or instance._extractor.series_memo is None:
+            raise RuntimeError("Extractor does not support series resolution")
+        resolution = instance._extractor.series_memo.override(
+            series_key, anime_name, season, tvid
+        )
+        # The cached results were built with the old resolution
+        instance._analyse_resource_title.cache_clear()
+        return resolution
+
+    @classmethod
+    def invalidate_series(cls, series_key: Optional[str] = None):
+        """Forget the resolution of a series, or of all series if no key is given."""
+        instance = cls()
+        if instance._extractor is None or instance._extractor.series_memo is None:
+            return
+        instance._extractor.series_memo.invalidate(series_key)
+        instance._analyse_resource_title.cache_clear()
+
+
+metrics.track_alru_cache("extractor_anime_name", Extractor._analyse_anime_name)
+metrics.track_alru_cache("extractor_resource_title", Extractor._analyse_resource_title)
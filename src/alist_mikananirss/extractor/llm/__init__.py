@@ -1,4 +1,5 @@
 from enum import StrEnum
+from typing import Optional
 
 from .base import LLMProvider
 
@@ -9,21 +10,41 @@ class LLMProviderType(StrEnum):
     OPENAI = "openai"
     DEEPSEEK = "deepseek"
     GOOGLE = "google"
+    REPLAY = "replay"
 
 
-def create_llm_provider(provider_type: LLMProviderType, **kwargs) -> LLMProvider:
-    """Create an LLM provider instance based on the specified type"""
+def create_llm_provider(
+    provider_type: LLMProviderType, record_path: Optional[str] = None, **kwargs
+) -> LLMProvider:
+    """Create an LLM provider instance based on the specified type
+
+    Args:
+        record_path: For the network providers, record the responses to this
+            jsonl file. For the replay provider, the file to replay.
+    """
     if provider_type == LLMProviderType.OPENAI:
         from .openai import OpenAIProvider
 
-        return OpenAIProvider(**kwargs)
+        provider = OpenAIProvider(**kwargs)
     elif provider_type == LLMProviderType.DEEPSEEK:
         from .deepseek import DeepSeekProvider
 
-        return DeepSeekProvider(**kwargs)
+        provider = DeepSeekProvider(**kwargs)
     elif provider_type == LLMProviderType.GOOGLE:
         from .google import GoogleProvider
 
-        return GoogleProvider(**kwargs)
+        provider = GoogleProvider(**kwargs)
+    elif provider_type == LLMProviderType.REPLAY:
+        from .replay import ReplayProvider
+
+        if not record_path:
+            raise ValueError("record_path is required by the replay provider")
+        return ReplayProvider(record_path, **kwargs)
     else:
         raise ValueError(f"Unsupported provider type: {provider_type}")
+
+    if record_path:
+        from .replay import RecordingProvider
+
+        provider = RecordingProvider(provider, record_path)
+    return provider
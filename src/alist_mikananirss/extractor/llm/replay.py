@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+from typing import Any, Dict, List, Optional, Type, TypeVar
+
+from loguru import logger
+from pydantic import BaseModel
+
+from .base import LLMProvider
+
+T = TypeVar("T")
+
+
+def messages_key(
+    messages: List[Dict[str, str]], response_format: Optional[type] = None
+) -> str:
+    """Hash of the messages (and the schema name), the key of a recorded response"""
+    payload = {
+        "messages": messages,
+        "schema": response_format.__name__ if response_format else None,
+    }
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _dump(response: Any) -> Any:
+    if isinstance(response, BaseModel):
+        return response.model_dump(mode="json")
+    return response
+
+
+class ReplayProvider(LLMProvider):
+    """Serve the responses recorded by RecordingProvider, without any api call.
+
+    Each line of the record file is a json object:
+    {"key": messages hash, "messages": [...], "response": {...}}
+
+    Args:
+        record_path: The jsonl file of the recorded responses
+        latency: Simulated latency of each call, in seconds
+        latency_jitter: A random 0~latency_jitter seconds is added to latency
+        error_rate: The ratio of calls raising a simulated error
+        seed: Random seed of the latency jitter and the errors
+    """
+
+    def __init__(
+        self,
+        record_path: str,
+        latency: float = 0,
+        latency_jitter: float = 0,
+        error_rate: float = 0,
+        seed: Optional[int] = None,
+    ):
+        self.record_path = record_path
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.records: Dict[str, Any] = {}
+        self.calls = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.record_path):
+            raise ValueError(f"LLM record file not found: {self.record_path}")
+        self.records.clear()
+        with open(self.record_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self.records[record["key"]] = record["response"]
+        logger.debug(
+            f"Loaded {len(self.records)} LLM responses from {self.record_path}"
+        )
+
+    async def _replay(self, key: str) -> Any:
+        self.calls += 1
+        delay = self.latency
+        if self.latency_jitter > 0:
+            delay += self.random.uniform(0, self.latency_jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.error_rate > 0 and self.random.random() < self.error_rate:
+            raise ConnectionError("Simulated LLM provider error")
+        if key not in self.records:
+            self.misses += 1
+            raise ValueError(f"No recorded LLM response for messages {key[:12]}")
+        return self.records[key]
+
+    async def parse_with_schema(
+        self, messages: List[Dict[str, str]], response_format: Type[T]
+    ) -> Optional[T]:
+        response = await self._replay(messages_key(messages, response_format))
+        if response is None:
+            return None
+        return response_format.model_validate(response)
+
+    async def parse_as_json(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        return await self._replay(messages_key(messages))
+
+
+class RecordingProvider(LLMProvider):
+    """Pass the calls to a real provider, and append its responses to a jsonl
+    file which ReplayProvider can replay
+
+    A response already in the file is not written again.
+    """
+
+    def __init__(self, provider: LLMProvider, record_path: str):
+        self.provider = provider
+        self.record_path = record_path
+        self._recorded: set[str] = set()
+        if os.path.exists(record_path):
+            with open(record_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._recorded.add(json.loads(line)["key"])
+        elif os.path.dirname(record_path):
+            os.makedirs(os.path.dirname(record_path), exist_ok=True)
+
+    def _record(self, key: str, messages: List[Dict[str, str]], response: Any):
+        if key in self._recorded:
+            return
+        record = {"key": key, "messages": messages, "response": _dump(response)}
+        with open(self.record_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._recorded.add(key)
+
+    async def parse_with_schema(
+        self, messages: List[Dict[str, str]], response_format: Type[T]
+    ) -> Optional[T]:
+        response = await self.provider.parse_with_schema(messages, response_format)
+        self._record(messages_key(messages, response_format), messages, response)
+        return response
+
+    async def parse_as_json(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        response = await self.provider.parse_as_json(messages)
+        self._record(messages_key(messages), messages, response)
+        return response
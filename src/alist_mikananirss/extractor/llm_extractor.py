@@ -2,23 +2,33 @@ from typing import Dict, List, Optional, Type
 
 from loguru import logger
 
+from ..utils.metrics import metrics
 from ..utils.tmdb import TMDBClient
+from ..utils.tracing import span
 from .base import ExtractorBase
 from .llm import LLMProvider
 from .llm.prompt import PromptType, load_prompt
 from .models import (
     AnimeNameExtractResult,
     ResourceTitleExtractResult,
+    SeriesResolution,
     TMDBSearchParam,
     TMDBTvInfo,
 )
+from .series_memo import SeriesMemo, build_series_key
+
+LLM_CALL_SECONDS = metrics.histogram("llm_call_seconds", "Latency of the LLM calls")
+LLM_CALL_ERRORS = metrics.counter("llm_call_errors", "Failed LLM calls")
 
 
 class LLMExtractor(ExtractorBase):
     """Generic extractor that works with any LLM provider"""
 
     def __init__(
-        self, llm_provider: LLMProvider, parse_mode: PromptType = PromptType.JSON_OBJECT
+        self,
+        llm_provider: LLMProvider,
+        parse_mode: PromptType = PromptType.JSON_OBJECT,
+        series_memo: Optional[SeriesMemo] = None,
     ):
         """
         Initialize the extractor
@@ -26,18 +36,26 @@ class LLMExtractor(ExtractorBase):
         Args:
             llm_provider: The LLM provider to use
             parse_mode: The parsing mode ('json_object' or 'json_schema')
+            series_memo: The series resolution table, a new one if not given
         """
         self.llm = llm_provider
         self.parse_mode = parse_mode
         self.tmdb_client = TMDBClient()
+        self.series_memo = series_memo if series_memo is not None else SeriesMemo()
 
     async def _parse(self, messages: List[Dict[str, str]], response_type: Type):
         """Parse the response based on the selected mode"""
-        if self.parse_mode == PromptType.JSON_SCHEMA:
-            return await self.llm.parse_with_schema(messages, response_type)
-        else:  # json_object mode
-            json_result = await self.llm.parse_as_json(messages)
-            return response_type(**json_result)
+        labels = {"provider": type(self.llm).__name__, "schema": response_type.__name__}
+        try:
+            with LLM_CALL_SECONDS.time(**labels), span("llm"):
+                if self.parse_mode == PromptType.JSON_SCHEMA:
+                    return await self.llm.parse_with_schema(messages, response_type)
+                else:  # json_object mode
+                    json_result = await self.llm.parse_as_json(messages)
+                    return response_type(**json_result)
+        except Exception:
+            LLM_CALL_ERRORS.inc(**labels)
+            raise
 
     async def analyse_anime_name(self, anime_name: str) -> AnimeNameExtractResult:
         """Analyse the anime name to extract series and season info"""
@@ -136,8 +154,47 @@ class LLMExtractor(ExtractorBase):
             logger.error(f"Error searching in TMDB: {e}")
             return None
 
+    async def resolve_series(
+        self, resource_title: str, series_key: Optional[str] = None
+    ) -> Optional[SeriesResolution]:
+        """Resolve the series of the resource title via TMDB, once per series.
+
+        Args:
+            resource_title (str)
+            series_key (str, optional): The series identity. Built from the
+                resource title (fansub + title stem) if not given.
+
+        Returns:
+            Optional[SeriesResolution]: None if the series can't be resolved.
+        """
+        series_key = series_key or build_series_key(resource_title)
+        if series_key is None:
+            tmdb_info = await self.search_name_in_tmdb(resource_title)
+            if tmdb_info is None:
+                return None
+            return SeriesResolution(
+                anime_name=tmdb_info.anime_name, tvid=tmdb_info.tvid
+            )
+
+        async with self.series_memo.lock(series_key):
+            resolution = self.series_memo.get(series_key)
+            if resolution is not None:
+                logger.debug(f"Series memo hit: {series_key} -> {resolution}")
+                return resolution
+            tmdb_info = await self.search_name_in_tmdb(resource_title)
+            if tmdb_info is None:
+                return None
+            resolution = SeriesResolution(
+                anime_name=tmdb_info.anime_name, tvid=tmdb_info.tvid
+            )
+            self.series_memo.set(series_key, resolution)
+            return resolution
+
     async def analyse_resource_title(
-        self, resource_title: str, use_tmdb: bool = True
+        self,
+        resource_title: str,
+        use_tmdb: bool = True,
+        series_key: Optional[str] = None,
     ) -> ResourceTitleExtractResult:
         """Analyse the resource title to extract all info"""
         system_prompt = load_prompt(self.parse_mode, "resource_title")
@@ -154,10 +211,12 @@ class LLMExtractor(ExtractorBase):
 
             # Get anime name from TMDB if enabled
             if use_tmdb:
-                tmdb_info = await self.search_name_in_tmdb(resource_title)
-                result.anime_name = (
-                    tmdb_info.anime_name if tmdb_info else result.anime_name
-                )
+                resolution = await self.resolve_series(resource_title, series_key)
+                if resolution:
+                    result.anime_name = resolution.anime_name
+                    # Keep special episodes(season 0) detected in this title
+                    if resolution.season is not None and result.season != 0:
+                        result.season = resolution.season
 
             logger.debug(f"Analyse resource title: {resource_title} -> {result}")
             return result
@@ -20,6 +20,15 @@ class TMDBTvInfo(BaseModel):
     tvid: int = Field(..., description="The tmdb id of the anime")
 
 
+class SeriesResolution(BaseModel):
+    anime_name: str = Field(..., description="The canonical name of the anime")
+    season: Optional[int] = Field(None, description="The season of the anime")
+    tvid: Optional[int] = Field(None, description="The tmdb id of the anime")
+    pinned: bool = Field(
+        False, description="Manual override, never replaced by automatic resolution"
+    )
+
+
 class ResourceTitleExtractResult(BaseModel):
     anime_name: str = Field(..., description="The name of the anime")
     season: int = Field(
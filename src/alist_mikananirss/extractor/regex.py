@@ -1,5 +1,6 @@
 import re
 from functools import lru_cache
+from typing import Optional
 
 from loguru import logger
 
@@ -71,7 +72,10 @@ class RegexExtractor(ExtractorBase):
         return info
 
     async def analyse_resource_title(
-        self, resource_title: str, use_tmdb: bool = True
+        self,
+        resource_title: str,
+        use_tmdb: bool = True,
+        series_key: Optional[str] = None,
     ) -> ResourceTitleExtractResult:
         clean_name = re.sub(r"[\[\]【】()（）]", " ", resource_title)
         match = self.episode_pattern.search(clean_name)
@@ -0,0 +1,112 @@
+import asyncio
+import re
+import unicodedata
+from typing import Optional
+
+from loguru import logger
+
+from .models import SeriesResolution
+
+# Episode markers, ordered by how reliable they are. Only the first kind that
+# matches is used, so "100 个女朋友 - 24" is cut at " - 24" and not at " 100 ".
+EPISODE_MARKER_PATTERNS = [
+    re.compile(r"\s-\s\d{1,4}(?:\.\d)?(?:v\d)?(?=[\s\[(]|$)"),
+    re.compile(r"\[\d{1,4}(?:\.\d)?(?:v\d)?(?:\s*end)?\]"),
+    re.compile(r"第\s*\d{1,4}(?:\.\d)?\s*[话話集]"),
+    re.compile(r"\b(?:s\d{1,2})?e(?:p)?\d{1,4}(?:v\d)?\b"),
+]
+STAR_TAG_PATTERN = re.compile(r"★[^★]*★")
+PUNCT_PATTERN = re.compile(r"[\[\]()（）【】_/\\|:：~～\-]+")
+SPACE_PATTERN = re.compile(r"\s+")
+
+
+def build_series_key(resource_title: str) -> Optional[str]:
+    """Build a normalized series identity from a resource title.
+
+    The key is the part of the title before the episode number, which contains
+    the fansub and the anime name (including the season if any), e.g.
+    "[ANi] 葬送的芙莉莲 - 05 [1080P][Baha]" -> "ani 葬送的芙莉莲".
+
+    Args:
+        resource_title (str)
+
+    Returns:
+        Optional[str]: The series key, None if no episode number can be found.
+    """
+    title = unicodedata.normalize("NFKC", resource_title).lower()
+    title = STAR_TAG_PATTERN.sub(" ", title)
+    for pattern in EPISODE_MARKER_PATTERNS:
+        match = pattern.search(title)
+        if match:
+            stem = title[: match.start()]
+            break
+    else:
+        return None
+    stem = PUNCT_PATTERN.sub(" ", stem)
+    stem = SPACE_PATTERN.sub(" ", stem).strip()
+    return stem or None
+
+
+class SeriesMemo:
+    """Series resolution table, so that the anime name/season of a series is
+    resolved once instead of once per episode.
+
+    Example:
+        >>> key = build_series_key(resource_title)
+        >>> async with memo.lock(key):
+        >>>     resolution = memo.get(key)
+        >>>     if resolution is None:
+        >>>         memo.set(key, await resolve(resource_title))
+    """
+
+    def __init__(self):
+        self._table: dict[str, SeriesResolution] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def __len__(self):
+        return len(self._table)
+
+    def __contains__(self, series_key: str):
+        return series_key in self._table
+
+    def lock(self, series_key: str) -> asyncio.Lock:
+        """Lock of a series, used to avoid resolving the same series concurrently."""
+        if series_key not in self._locks:
+            self._locks[series_key] = asyncio.Lock()
+        return self._locks[series_key]
+
+    def get(self, series_key: str) -> Optional[SeriesResolution]:
+        return self._table.get(series_key)
+
+    def set(self, series_key: str, resolution: SeriesResolution):
+        """Store an automatic resolution, manual overrides are kept."""
+        old = self._table.get(series_key)
+        if old and old.pinned:
+            return
+        self._table[series_key] = resolution
+
+    def override(
+        self,
+        series_key: str,
+        anime_name: str,
+        season: Optional[int] = None,
+        tvid: Optional[int] = None,
+    ) -> SeriesResolution:
+        """Manually set the resolution of a series."""
+        resolution = SeriesResolution(
+            anime_name=anime_name, season=season, tvid=tvid, pinned=True
+        )
+        self._table[series_key] = resolution
+        logger.info(f"Override series resolution: {series_key} -> {resolution}")
+        return resolution
+
+    def invalidate(self, series_key: Optional[str] = None):
+        """Drop the resolution of a series, or of all series if no key is given."""
+        if series_key is None:
+            self._table.clear()
+        else:
+            self._table.pop(series_key, None)
+        logger.info(f"Invalidate series resolution: {series_key or 'all'}")
+
+    def items(self) -> list[tuple[str, SeriesResolution]]:
+        return list(self._table.items())
@@ -1,40 +1,60 @@
 import argparse
 import asyncio
+import atexit
 import os
 import sys
+import time
 
 from loguru import logger
 
 from alist_mikananirss import (
     AnimeRenamer,
     AppConfig,
-    BotAssistant,
     ConfigManager,
     DownloadManager,
     NotificationSender,
+    PollScheduler,
     RegexFilter,
+    ReleaseSelector,
     RemapperManager,
     RssMonitor,
     SubscribeDatabase,
+    SubscriptionFilter,
 )
-from alist_mikananirss.alist import Alist
-from alist_mikananirss.bot import BotFactory, NotificationBot
+from alist_mikananirss.alist import Alist, AlistClientPolicy
+from alist_mikananirss.bot import BotFactory, NotificationBot, close_session
+from alist_mikananirss.common.config.basic import SubscriptionConfig
 from alist_mikananirss.extractor import Extractor, LLMExtractor, create_llm_provider
+from alist_mikananirss.utils.log import BackgroundLogWriter
+from alist_mikananirss.utils.metrics import MetricsServer
+from alist_mikananirss.utils.tracing import (
+    format_summary,
+    read_traces,
+    summarize,
+    trace_log,
+)
 
 
 def init_logging(cfg: AppConfig):
     log_level = cfg.dev.log_level
     logger.remove()
+    add_sink = logger.add
+    if cfg.dev.log_enqueue:
+        # The sinks are written by a background thread, so a slow disk or
+        # terminal doesn't stall the event loop
+        log_writer = BackgroundLogWriter()
+        atexit.register(log_writer.stop)
+        add_sink = log_writer.add
 
     # 确保日志目录存在
     os.makedirs("log", exist_ok=True)
 
     # 使用loguru的动态日期格式化功能
     log_filename = "log/alist_mikanrss_{time:YYYY-MM-DD}.log"
-    logger.add(
+    add_sink(
         log_filename, rotation="00:00", retention="7 days", level=log_level, mode="a"
     )
-    logger.add(sys.stderr, level=log_level)
+    add_sink(sys.stderr, level=log_level)
 
 
 def init_proxies(cfg: AppConfig):
@@ -47,7 +67,7 @@ def init_proxies(cfg: AppConfig):
         os.environ["HTTPS_PROXY"] = proxies["https"]
 
 
-def init_notification(cfg: AppConfig):
+def init_notification(cfg: AppConfig, db: SubscribeDatabase = None):
     notification_bots = []
     if not cfg.notification.enable:
         return
@@ -68,19 +88,90 @@ def init_notification(cfg: AppConfig):
         cfg.notification.enable = False
         return
 
-    NotificationSender.initialize(notification_bots, cfg.notification.interval_time)
+    NotificationSender.initialize(notification_bots, cfg.notification.interval_time, db)
 
 
-async def run():
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Alist Mikanani RSS")
     parser.add_argument(
         "--config",
         default="config.yaml",
         help="Path to the configuration file",
     )
+    subparsers = parser.add_subparsers(dest="command")
+    traces_parser = subparsers.add_parser(
+        "traces", help="Summarise the stage timings of the traced resources"
+    )
+    traces_parser.add_argument(
+        "--path", help="The trace log, dev.tracing.path of the config by default"
+    )
+    traces_parser.add_argument(
+        "--since", type=float, help="Only the resources of the last N hours"
+    )
+    for name, help_text in (
+        ("once", "Poll the subscriptions once and exit"),
+        ("backfill", "Download the whole history of the given rss feeds"),
+    ):
+        once_parser = subparsers.add_parser(name, help=help_text)
+        if name == "backfill":
+            once_parser.add_argument("urls", nargs="+", help="The rss urls")
+            once_parser.add_argument(
+                "--extract-workers",
+                type=int,
+                help="Resources extracted at the same time, "
+                "common.pipeline.extract_workers of the config by default",
+            )
+            once_parser.add_argument(
+                "--batch-size",
+                type=int,
+                help="Resources submitted to Alist in one request, "
+                "common.pipeline.submit_batch_size of the config by default",
+            )
+        once_parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only print the resources which would be downloaded",
+        )
+        once_parser.add_argument(
+            "--wait",
+            action="store_true",
+            help="Wait for the downloads to finish, be renamed and notified",
+        )
+    subs_parser = subparsers.add_parser(
+        "subscriptions",
+        help="Manage the subscriptions added at runtime, "
+        "a running instance picks up the changes at its next poll",
+    )
+    subs_actions = subs_parser.add_subparsers(dest="action", required=True)
+    subs_actions.add_parser("list", help="List all the subscriptions")
+    add_parser = subs_actions.add_parser("add", help="Subscribe to a rss url")
+    add_parser.add_argument("url")
+    add_parser.add_argument(
+        "--filters", nargs="*", help="Replace the global filters for this feed"
+    )
+    add_parser.add_argument("--fansub-include", nargs="+", default=[])
+    add_parser.add_argument("--fansub-exclude", nargs="+", default=[])
+    add_parser.add_argument("--qualities", nargs="+", default=[])
+    remove_parser = subs_actions.add_parser(
+        "remove", help="Unsubscribe from a rss url added at runtime"
+    )
+    remove_parser.add_argument("url")
+    return parser
+
+
+def show_traces(args: argparse.Namespace):
+    path = args.path
+    backup_count = 3
+    if path is None:
+        tracing_cfg = ConfigManager().load_config(args.config).dev.tracing
+        path = tracing_cfg.path
+        backup_count = tracing_cfg.backup_count
+    since = time.time() - args.since * 3600 if args.since else None
+    print(format_summary(summarize(read_traces(path, backup_count), since)))
 
-    args = parser.parse_args()
 
+def load_config(args: argparse.Namespace) -> AppConfig:
+    """Load the config, and set up logging, proxies and tracing from it"""
     cfg_manager = ConfigManager()
     cfg = cfg_manager.load_config(args.config)
     # logger
@@ -92,14 +183,34 @@ async def run():
     # proxy
     init_proxies(cfg)
 
+    # tracing
+    tracing_cfg = cfg.dev.tracing
+    if tracing_cfg.enable:
+        trace_log.configure(
+            tracing_cfg.path, tracing_cfg.max_bytes, tracing_cfg.backup_count
+        )
+        atexit.register(trace_log.stop)
+    return cfg
+
+
+async def init_app(
+    cfg: AppConfig, check_alist: bool = True
+) -> tuple[SubscribeDatabase, Alist]:
+    """Set up the database, the Alist client and the singletons of the pipeline"""
     # database
     db = await SubscribeDatabase.create()
 
     # alist
-    alist_client = Alist(cfg.alist.base_url, cfg.alist.token, cfg.alist.downloader)
-    alist_ver = await alist_client.get_alist_ver()
-    if alist_ver < "3.42.0":
-        raise ValueError(f"Unsupported Alist version: {alist_ver}")
+    alist_client = Alist(
+        cfg.alist.base_url,
+        cfg.alist.token,
+        cfg.alist.downloader,
+        policy=AlistClientPolicy(**cfg.alist.client.model_dump()),
+    )
+    if check_alist:
+        alist_ver = await alist_client.get_alist_ver()
+        if alist_ver < "3.42.0":
+            raise ValueError(f"Unsupported Alist version: {alist_ver}")
 
     # download manager
     DownloadManager.initialize(
@@ -108,6 +219,7 @@ async def run():
         use_renamer=cfg.rename.enable,
         need_notification=cfg.notification.enable,
         db=db,
+        dedupe_by_info_hash=cfg.common.dedupe_by_info_hash,
     )
 
     # extractor
@@ -126,14 +238,24 @@ async def run():
             raise
         Extractor.initialize(extractor)
 
-        AnimeRenamer.initialize(alist_client, cfg.rename.rename_format)
+        AnimeRenamer.initialize(
+            alist_client, cfg.rename.rename_format, cfg.rename.batch_window
+        )
 
     # remapper
     if cfg.rename.remap.enable:
         cfg_path = cfg.rename.remap.cfg_path
         RemapperManager.load_remappers_from_cfg(cfg_path)
+    return db, alist_client
+
 
-    # rss monitor
+def build_rss_monitor(
+    cfg: AppConfig, db: SubscribeDatabase, urls: list[str] = None
+) -> RssMonitor:
+    """The RssMonitor of the subscriptions, or of the given rss urls
+
+    The rules of a subscription also apply to its url given in urls.
+    """
     regex_filter = RegexFilter()
     filters_name = cfg.mikan.filters
     regex_pattern = cfg.mikan.regex_pattern
@@ -141,38 +263,171 @@ async def run():
     for name in filters_name:
         regex_filter.add_pattern(name)
 
-    subscribe_url = cfg.mikan.subscribe_url
+    subscribe_url = [sub.url for sub in cfg.mikan.subscriptions]
+    subscription_filters = {
+        sub.url: SubscriptionFilter.from_config(sub) for sub in cfg.mikan.subscriptions
+    }
     rss_monitor = RssMonitor(
-        subscribe_urls=subscribe_url,
+        subscribe_urls=subscribe_url if urls is None else urls,
         db=db,
         filter=regex_filter,
         use_extractor=cfg.rename.enable,
+        subscription_filters=subscription_filters,
     )
     rss_monitor.set_interval_time(cfg.common.interval_time)
+    rss_monitor.set_pipeline_options(**cfg.common.pipeline.model_dump())
+    selection_cfg = cfg.mikan.selection
+    if selection_cfg.enable:
+        rss_monitor.set_release_selector(
+            ReleaseSelector(
+                db,
+                window=selection_cfg.window,
+                fansubs=selection_cfg.fansubs,
+                qualities=selection_cfg.qualities,
+                languages=selection_cfg.languages,
+            )
+        )
+    polling_cfg = cfg.common.adaptive_polling
+    if polling_cfg.enable:
+        rss_monitor.set_poll_scheduler(
+            PollScheduler(
+                min_interval=polling_cfg.min_interval,
+                max_interval=polling_cfg.max_interval,
+                window=polling_cfg.window,
+                state_path=polling_cfg.state_path,
+            )
+        )
+    return rss_monitor
+
+
+async def manage_subscriptions(args: argparse.Namespace):
+    cfg = ConfigManager().load_config(args.config)
+    db = await SubscribeDatabase.create()
+    try:
+        rss_monitor = build_rss_monitor(cfg, db)
+        await rss_monitor.load_subscriptions()
+        if args.action == "add":
+            await rss_monitor.add_subscription(
+                SubscriptionConfig(
+                    url=args.url,
+                    filters=args.filters,
+                    fansub_include=args.fansub_include,
+                    fansub_exclude=args.fansub_exclude,
+                    qualities=args.qualities,
+                )
+            )
+        elif args.action == "remove":
+            await rss_monitor.remove_subscription(args.url)
+        for url, runtime in rss_monitor.list_subscriptions():
+            print(url if runtime else f"{url} (config)")
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+    finally:
+        await db.close()
+
+
+async def run(args: argparse.Namespace = None):
+    if args is None:
+        args = build_parser().parse_args()
+
+    cfg = load_config(args)
+    db, alist_client = await init_app(cfg)
+    rss_monitor = build_rss_monitor(cfg, db)
 
     tasks = []
     tasks.append(rss_monitor.run())
     # notification
     if cfg.notification.enable:
-        init_notification(cfg)
+        init_notification(cfg, db)
         tasks.append(NotificationSender.run())
+    # remap file hot reload
+    if cfg.rename.remap.enable and cfg.rename.remap.hot_reload:
+        tasks.append(
+            RemapperManager.watch_cfg(
+                cfg.rename.remap.cfg_path, cfg.rename.remap.reload_interval
+            )
+        )
 
     # Initialize bot assistant
     if cfg.bot_assistant.enable:
         # Only telegram bot is supported now
         if cfg.bot_assistant.bots[0].bot_type == "telegram":
-            bot_assistant = BotAssistant(cfg.bot_assistant.bots[0].token, rss_monitor)
+            from alist_mikananirss.core.bot_assistant import BotAssistant
+
+            bot_assistant = BotAssistant(
+                cfg.bot_assistant.bots[0].token,
+                rss_monitor,
+                job_workers=cfg.bot_assistant.job_workers,
+                job_queue_size=cfg.bot_assistant.job_queue_size,
+            )
             tasks.append(bot_assistant.run())
 
+    # metrics endpoint
+    metrics_server = None
+    if cfg.dev.metrics.enable:
+        metrics_server = MetricsServer()
+        await metrics_server.start(cfg.dev.metrics.host, cfg.dev.metrics.port)
+
     try:
         await asyncio.gather(*tasks)
     finally:
         # cleanup after program exit
         await db.close()
         await alist_client.close()
+        await close_session()
+        if metrics_server:
+            await metrics_server.close()
         if cfg.bot_assistant.enable:
             await bot_assistant.stop()
 
 
+async def run_once(args: argparse.Namespace):
+    """The once and backfill commands: poll the feeds once, then exit"""
+    cfg = load_config(args)
+    # A dry run doesn't talk to Alist, only reports what would be downloaded
+    db, alist_client = await init_app(cfg, check_alist=not args.dry_run)
+    urls = args.urls if args.command == "backfill" else None
+    rss_monitor = build_rss_monitor(cfg, db, urls)
+    if urls is None:
+        await rss_monitor.load_subscriptions()
+    if args.command == "backfill":
+        options = {}
+        if args.extract_workers:
+            options["extract_workers"] = args.extract_workers
+        if args.batch_size:
+            options["submit_batch_size"] = args.batch_size
+        rss_monitor.set_pipeline_options(**options)
+    if cfg.notification.enable and not args.dry_run:
+        init_notification(cfg, db)
+
+    try:
+        resources = await rss_monitor.run_once(dry_run=args.dry_run)
+        download_manager = DownloadManager()
+        for resource in resources:
+            path = DownloadManager.download_path(resource)
+            print(f"{resource.brief()} -> {path}")
+        verb = "Would download" if args.dry_run else "Submitted"
+        print(f"{verb} {len(resources)} resources")
+        if args.wait and not args.dry_run:
+            # Downloads, transfers and renames
+            await download_manager.task_monitor.wait_finished()
+            if cfg.notification.enable:
+                await NotificationSender.flush()
+    finally:
+        await db.close()
+        await alist_client.close()
+        await close_session()
+
+
 def main():
-    asyncio.run(run())
+    args = build_parser().parse_args()
+    if args.command == "traces":
+        show_traces(args)
+        return
+    if args.command in ("once", "backfill"):
+        asyncio.run(run_once(args))
+        return
+    if args.command == "subscriptions":
+        asyncio.run(manage_subscriptions(args))
+        return
+    asyncio.run(run(args))
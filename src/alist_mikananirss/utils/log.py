@@ -0,0 +1,135 @@
+import copy
+import queue
+import threading
+import time
+from typing import Hashable, Optional
+
+from loguru import logger
+
+
+class LogThrottle:
+    """Let a log line of the same key through at most once per interval.
+
+    For the lines logged on every poll, e.g. per task per second in the
+    TaskMonitor. The suppressed count is returned with the next allowed line.
+
+    Example:
+        >>> throttle = LogThrottle(60)
+        >>> allowed, suppressed = throttle.allow(task.tid)
+        >>> if allowed:
+        >>>     logger.warning(f"Task {task.tid} not found ({suppressed} suppressed)")
+    """
+
+    def __init__(self, interval: float, maxsize: int = 10000):
+        self.interval = interval
+        self.maxsize = maxsize
+        # key -> (last allowed time, suppressed since then)
+        self._state: dict[Hashable, tuple[float, int]] = {}
+
+    def allow(
+        self, key: Hashable = None, now: Optional[float] = None
+    ) -> tuple[bool, int]:
+        """
+        Returns:
+            tuple[bool, int]: Whether to log now, and how many lines of the key
+                were suppressed since the last one logged
+        """
+        now = time.monotonic() if now is None else now
+        state = self._state.get(key)
+        if state is not None and now - state[0] < self.interval:
+            self._state[key] = (state[0], state[1] + 1)
+            return False, 0
+        if state is None and len(self._state) >= self.maxsize:
+            # Forget the oldest key
+            del self._state[next(iter(self._state))]
+        self._state[key] = (now, 0)
+        return True, state[1] if state else 0
+
+    def forget(self, key: Hashable = None):
+        self._state.pop(key, None)
+
+
+class BackgroundLogWriter:
+    """Write the logs of loguru sinks in a background thread.
+
+    The log lines are formatted in the calling thread and put on a queue, a
+    daemon thread writes them to the real sinks. Unlike loguru's enqueue=True,
+    which pickles every record through a multiprocessing pipe and blocks the
+    caller once the pipe is full, a slow disk or terminal never stalls the
+    event loop: lines beyond maxsize are dropped and counted instead.
+
+    Must be created when the logger has no handlers, since the real sinks
+    live in a copy of the logger and handlers can't be copied.
+
+    Example:
+        >>> logger.remove()
+        >>> writer = BackgroundLogWriter()
+        >>> writer.add(sys.stderr, level="INFO")
+        >>> ...
+        >>> writer.stop()
+    """
+
+    def __init__(self, maxsize: int = 100000):
+        self._writer = copy.deepcopy(logger)
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._handler_ids: list[int] = []
+        self.dropped = 0
+
+    def add(self, sink, level="DEBUG", colorize: Optional[bool] = None, **kwargs):
+        """Add a sink like logger.add, written by the background thread
+
+        The format and filter kwargs apply to the logger, the others to the
+        real sink (rotation, retention, mode...).
+        """
+        target = f"sink{len(self._handler_ids)}"
+        self._writer.add(
+            sink,
+            format="{message}",
+            colorize=False,
+            filter=lambda record: record["extra"].get("_log_target") == target,
+            **{k: v for k, v in kwargs.items() if k not in ("format", "filter")},
+        )
+        front_kwargs = {k: kwargs[k] for k in ("format", "filter") if k in kwargs}
+        if colorize is None:
+            colorize = hasattr(sink, "isatty") and sink.isatty()
+        handler_id = logger.add(
+            lambda message: self._put(target, message),
+            level=level,
+            colorize=colorize,
+            **front_kwargs,
+        )
+        self._handler_ids.append(handler_id)
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="log-writer", daemon=True
+            )
+            self._thread.start()
+        return handler_id
+
+    def _put(self, target: str, message):
+        try:
+            self._queue.put_nowait((target, message.record["level"].name, str(message)))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            target, level, text = item
+            self._writer.opt(raw=True).bind(_log_target=target).log(level, text)
+
+    def stop(self, timeout: float = 5):
+        """Remove the sinks from the logger and write the queued lines"""
+        if self.dropped:
+            logger.warning(f"{self.dropped} log lines dropped, the sinks were too slow")
+        for handler_id in self._handler_ids:
+            logger.remove(handler_id)
+        self._handler_ids.clear()
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+        self._writer.remove()
@@ -0,0 +1,286 @@
+"""In-process metrics, exposed in the Prometheus text format.
+
+The metrics are module level objects registered in the global `metrics`
+registry, so instrumenting a module costs one dict lookup per update:
+
+    >>> FETCH_SECONDS = metrics.histogram("feed_fetch_seconds", "Feed fetch time")
+    >>> FETCH_SECONDS.observe(0.3, site="mikan")
+
+Values only known by an object at runtime (queue sizes, cache stats) are
+read from a callback when the metrics are collected.
+"""
+
+import bisect
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Union
+
+from aiohttp import web
+from loguru import logger
+
+LabelKey = tuple[tuple[str, str], ...]
+# A callback returns a value, or {labels(...): value}
+Callback = Callable[[], Union[float, dict[LabelKey, float]]]
+# () -> (hits, misses, size)
+CacheInfoCallback = Callable[[], tuple[int, int, int]]
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+
+def _label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def labels(**kwargs) -> LabelKey:
+    """Label key of a gauge callback result"""
+    return _label_key(kwargs)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: LabelKey, extra: Optional[tuple] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        """(name suffix, formatted labels, value)"""
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, label_str, value in self.samples():
+            lines.append(f"{self.name}{suffix}{label_str} {_format_value(value)}")
+        return lines
+
+
+class _ValueMetric(Metric):
+    """A metric of one value per label set, or read from a callback"""
+
+    suffix = ""
+
+    def __init__(self, name: str, help: str, callback: Optional[Callback] = None):
+        super().__init__(name, help)
+        self.callback = callback
+        self.values: dict[LabelKey, float] = {}
+
+    def get(self, **labels) -> float:
+        return self._collect().get(_label_key(labels), 0)
+
+    def _collect(self) -> dict[LabelKey, float]:
+        if self.callback is None:
+            return self.values
+        try:
+            result = self.callback()
+        except Exception as e:
+            logger.warning(f"Failed to collect metric {self.name}: {e}")
+            return {}
+        return result if isinstance(result, dict) else {(): result}
+
+    def samples(self):
+        for key, value in self._collect().items():
+            yield self.suffix, _format_labels(key), value
+
+
+class Counter(_ValueMetric):
+    type = "counter"
+    suffix = "_total"
+
+    def inc(self, value: float = 1, **labels):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+
+class Gauge(_ValueMetric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[_label_key(labels)] = value
+
+
+class _HistogramValue:
+    def __init__(self, buckets: tuple):
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        buckets = tuple(sorted(buckets))
+        if buckets[-1] != float("inf"):
+            buckets += (float("inf"),)
+        self.buckets = buckets
+        self.values: dict[LabelKey, _HistogramValue] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        hist = self.values.get(key)
+        if hist is None:
+            hist = self.values[key] = _HistogramValue(self.buckets)
+        hist.counts[bisect.bisect_left(self.buckets, value)] += 1
+        hist.count += 1
+        hist.sum += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the time spent in the with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        hist = self.values.get(_label_key(labels))
+        return hist.count if hist else 0
+
+    def quantile(self, q: float, **labels) -> float:
+        """Upper bound of the bucket containing the q-quantile"""
+        hist = self.values.get(_label_key(labels))
+        if hist is None or hist.count == 0:
+            return 0
+        rank = q * hist.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, hist.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def samples(self):
+        for key, hist in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, hist.counts):
+                cumulative += count
+                label_str = _format_labels(key, ("le", _format_value(bound)))
+                yield "_bucket", label_str, cumulative
+            yield "_sum", _format_labels(key), hist.sum
+            yield "_count", _format_labels(key), hist.count
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._caches: dict[str, CacheInfoCallback] = {}
+
+    def _register(self, metric_type: type, name: str, *args) -> Metric:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = metric_type(name, *args)
+        elif not isinstance(metric, metric_type):
+            raise ValueError(f"Metric {name} is already a {metric.type}")
+        return metric
+
+    def _with_callback(self, metric_type: type, name: str, help: str, callback):
+        metric = self._register(metric_type, name, help)
+        # A new callback replaces the old one, so the metric follows the
+        # latest instance of a re-initialized singleton
+        if callback is not None:
+            metric.callback = callback
+        return metric
+
+    def counter(
+        self, name: str, help: str, callback: Optional[Callback] = None
+    ) -> Counter:
+        return self._with_callback(Counter, name, help, callback)
+
+    def histogram(
+        self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram, name, help, buckets)
+
+    def gauge(self, name: str, help: str, callback: Optional[Callback] = None) -> Gauge:
+        return self._with_callback(Gauge, name, help, callback)
+
+    def track_cache(self, cache: str, info: CacheInfoCallback):
+        """Export the hits, misses and size of a cache"""
+        self._caches[cache] = info
+
+        def collect(index: int):
+            values = {}
+            for name, cache_info in self._caches.items():
+                values[labels(cache=name)] = cache_info()[index]
+            return values
+
+        self.counter("cache_hits", "Cache hits", lambda: collect(0))
+        self.counter("cache_misses", "Cache misses", lambda: collect(1))
+        self.gauge("cache_size", "Entries in the cache", lambda: collect(2))
+
+    def track_alru_cache(self, cache: str, fn):
+        """Export the cache_info of an alru_cache/lru_cache function"""
+
+        def info():
+            cache_info = fn.cache_info()
+            return cache_info.hits, cache_info.misses, cache_info.currsize
+
+        self.track_cache(cache, info)
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class MetricsServer:
+    """Serve the metrics of a registry on GET /metrics"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4"
+
+    def __init__(self, registry: MetricsRegistry = metrics):
+        self.registry = registry
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url: Optional[str] = None
+
+    async def _metrics(self, request: web.Request):
+        return web.Response(
+            body=self.registry.render().encode("utf-8"),
+            headers={"Content-Type": f"{self.CONTENT_TYPE}; charset=utf-8"},
+        )
+
+    async def start(self, host: str = "127.0.0.1", port: int = 9108) -> str:
+        app = web.Application()
+        app.router.add_get("/metrics", self._metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}/"
+        logger.info(f"Metrics are served on {self.base_url}metrics")
+        return self.base_url
+
+    async def close(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,51 @@
+import asyncio
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """A token bucket rate limiter for coroutines.
+
+    Up to capacity calls go through at once, then one every 1/rate seconds.
+
+    Example:
+        >>> bucket = TokenBucket(rate=1, capacity=3)
+        >>> await bucket.acquire()
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        """
+        Args:
+            rate (float): Tokens added per second
+            capacity (int): Tokens kept at most, the burst size
+        """
+        if rate <= 0:
+            raise ValueError(f"Invalid rate: {rate}")
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def try_acquire(self, now: Optional[float] = None) -> bool:
+        """Take a token if there is one, without waiting"""
+        self._refill(time.monotonic() if now is None else now)
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        """Wait for a token and take it, the waiters are served in order"""
+        # Created lazily, the bucket may be built outside of the event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while not self.try_acquire():
+                await asyncio.sleep((1 - self._tokens) / self.rate)
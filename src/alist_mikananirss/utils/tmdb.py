@@ -1,6 +1,8 @@
 import aiohttp
 from async_lru import alru_cache
 
+from .metrics import metrics
+
 
 class TMDBClient:
     def __init__(
@@ -32,3 +34,6 @@ class TMDBClient:
                     if result["popularity"] > 0:
                         results.append(tmp)
                 return results
+
+
+metrics.track_alru_cache("tmdb_search", TMDBClient.search_tv)
@@ -0,0 +1,146 @@
+import asyncio
+import base64
+import hashlib
+import re
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlparse
+
+import aiohttp
+from loguru import logger
+
+BTIH_PATTERN = re.compile(r"^urn:btih:([0-9a-fA-F]{40}|[A-Za-z2-7]{32})$")
+# Some sites name the torrent file by its info-hash, e.g. Mikan:
+# https://mikanani.me/Download/20240717/<info-hash>.torrent
+HASH_FILENAME_PATTERN = re.compile(r"/([0-9a-fA-F]{40})\.torrent$")
+
+
+class BencodeError(ValueError):
+    pass
+
+
+def _decode(data: bytes, pos: int) -> tuple[Any, int]:
+    token = data[pos : pos + 1]
+    if token == b"i":
+        end = data.index(b"e", pos)
+        return int(data[pos + 1 : end]), end + 1
+    if token == b"l":
+        pos += 1
+        items = []
+        while data[pos : pos + 1] != b"e":
+            item, pos = _decode(data, pos)
+            items.append(item)
+        return items, pos + 1
+    if token == b"d":
+        pos += 1
+        items = {}
+        while data[pos : pos + 1] != b"e":
+            key, pos = _decode(data, pos)
+            items[key], pos = _decode(data, pos)
+        return items, pos + 1
+    if token.isdigit():
+        colon = data.index(b":", pos)
+        length = int(data[pos:colon])
+        start = colon + 1
+        if start + length > len(data):
+            raise BencodeError("String out of range")
+        return data[start : start + length], start + length
+    raise BencodeError(f"Invalid token {token!r} at {pos}")
+
+
+def bdecode(data: bytes) -> Any:
+    """Decode bencoded data, strings are kept as bytes"""
+    try:
+        value, end = _decode(data, 0)
+    except (IndexError, ValueError) as e:
+        raise BencodeError(f"Invalid bencoded data: {e}") from e
+    if end != len(data):
+        raise BencodeError("Trailing data after bencoded value")
+    return value
+
+
+def info_hash_from_torrent(data: bytes) -> str:
+    """The info-hash (v1) of a .torrent file: sha1 of the bencoded info dict"""
+    if data[:1] != b"d":
+        raise BencodeError("Torrent file should be a dict")
+    try:
+        pos = 1
+        while data[pos : pos + 1] != b"e":
+            key, pos = _decode(data, pos)
+            start = pos
+            _, pos = _decode(data, pos)
+            if key == b"info":
+                # Hash the raw bytes, re-encoding may change them
+                return hashlib.sha1(data[start:pos]).hexdigest()
+    except (IndexError, ValueError) as e:
+        raise BencodeError(f"Invalid torrent file: {e}") from e
+    raise BencodeError("No info dict in torrent file")
+
+
+def info_hash_from_url(url: str) -> Optional[str]:
+    """Get the info-hash from a magnet link, or from a torrent url named by it
+
+    Returns:
+        Optional[str]: Lowercase hex info-hash, None if it's not in the url
+    """
+    if url.startswith("magnet:"):
+        for xt in parse_qs(urlparse(url).query).get("xt", []):
+            match = BTIH_PATTERN.match(xt)
+            if not match:
+                continue
+            btih = match.group(1)
+            if len(btih) == 32:
+                btih = base64.b32decode(btih.upper()).hex()
+            return btih.lower()
+        return None
+    match = HASH_FILENAME_PATTERN.search(urlparse(url).path)
+    if match:
+        return match.group(1).lower()
+    return None
+
+
+async def fetch_info_hash(
+    url: str, session: aiohttp.ClientSession, timeout: float = 30
+) -> Optional[str]:
+    """Get the info-hash of a resource, download the .torrent file if needed"""
+    info_hash = info_hash_from_url(url)
+    if info_hash or url.startswith("magnet:"):
+        return info_hash
+    try:
+        async with session.get(
+            url, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            response.raise_for_status()
+            data = await response.read()
+        return info_hash_from_torrent(data)
+    except Exception as e:
+        logger.warning(f"Failed to get info-hash of {url}: {e}")
+        return None
+
+
+async def fetch_info_hashes(
+    urls: list[str], concurrency: int = 4, timeout: float = 30
+) -> list[Optional[str]]:
+    """The info-hashes of the resources, in order
+
+    The .torrent files are downloaded in one session, at most concurrency at
+    once.
+    """
+    info_hashes = [info_hash_from_url(url) for url in urls]
+    missing = [
+        i
+        for i, url in enumerate(urls)
+        if info_hashes[i] is None and not url.startswith("magnet:")
+    ]
+    if not missing:
+        return info_hashes
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(url: str) -> Optional[str]:
+        async with semaphore:
+            return await fetch_info_hash(url, session, timeout)
+
+    async with aiohttp.ClientSession(trust_env=True) as session:
+        results = await asyncio.gather(*(fetch(urls[i]) for i in missing))
+    for i, info_hash in zip(missing, results):
+        info_hashes[i] = info_hash
+    return info_hashes
@@ -0,0 +1,301 @@
+"""Per-resource traces: where the time went between a resource appearing in a
+feed and it being downloaded, renamed and notified.
+
+A Trace is attached to the FeedEntry when its feed is fetched, and follows the
+ResourceInfo built from it through the pipeline and the TaskMonitor. Each
+stage adds a span. Code deep in the call stack (homepage scraping, LLM calls)
+adds spans to the trace of the current task via `span(name)`.
+
+Finished traces are appended to a rotating jsonl file by a background
+thread, see TraceLog.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from loguru import logger
+
+
+@dataclass
+class Span:
+    name: str
+    # unix time
+    start: float
+    duration: Optional[float] = None
+    error: Optional[str] = None
+
+    def to_json(self) -> dict:
+        data = {"name": self.name, "start": self.start, "duration": self.duration}
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class Trace:
+    def __init__(self, title: str, start: Optional[float] = None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.title = title
+        self.start = time.time() if start is None else start
+        self.end_time: Optional[float] = None
+        self.status: Optional[str] = None
+        self.spans: list[Span] = []
+        # name -> (span, perf_counter at start)
+        self._open: dict[str, tuple[Span, float]] = {}
+
+    @property
+    def finished(self) -> bool:
+        return self.end_time is not None
+
+    def add_span(
+        self, name: str, start: float, duration: float, error: Optional[str] = None
+    ) -> Span:
+        span = Span(name, start, duration, error)
+        self.spans.append(span)
+        return span
+
+    def begin(self, name: str):
+        """Open a span, closed by end(name)"""
+        span = Span(name, time.time())
+        self.spans.append(span)
+        self._open[name] = (span, time.perf_counter())
+
+    def end(self, name: str, error: Optional[str] = None) -> Optional[Span]:
+        if name not in self._open:
+            return None
+        span, start = self._open.pop(name)
+        span.duration = time.perf_counter() - start
+        span.error = error
+        return span
+
+    @contextmanager
+    def span(self, name: str):
+        self.begin(name)
+        try:
+            yield
+        except BaseException as e:
+            self.end(name, error=repr(e))
+            raise
+        self.end(name)
+
+    def finish(self, status: str = "done", error: Optional[str] = None):
+        """Close the open spans and write the trace to the trace log, once"""
+        if self.finished:
+            return
+        for name in list(self._open):
+            self.end(name, error=error)
+        self.end_time = time.time()
+        self.status = status
+        trace_log.write(self)
+
+    def to_json(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "title": self.title,
+            "start": self.start,
+            "total": self.end_time - self.start if self.end_time else None,
+            "status": self.status,
+            "spans": [span.to_json() for span in self.spans],
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def use_trace(trace: Optional[Trace]):
+    """Make trace the current trace of the task inside the with block"""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str):
+    """A span of the current trace, does nothing without one"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name):
+        yield
+
+
+class TraceLog:
+    """Append the finished traces to a jsonl file, rotated by size like
+    logging.handlers.RotatingFileHandler: path, path.1 ... path.{backup_count}
+
+    The lines are written by a daemon thread like BackgroundLogWriter, so the
+    file I/O never runs on the event loop. Lines beyond maxsize are dropped.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self.path: Optional[str] = None
+        self.max_bytes = 10 * 1024 * 1024
+        self.backup_count = 3
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def configure(
+        self,
+        path: Optional[str],
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 3,
+    ):
+        """Write the traces to path, or stop writing them if path is None"""
+        # The queued traces go to the old path
+        self.stop()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _rotate(self):
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _append(self, title: str, line: str):
+        try:
+            if (
+                os.path.exists(self.path)
+                and os.path.getsize(self.path) + len(line) > self.max_bytes
+            ):
+                self._rotate()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            logger.warning(f"Failed to write trace of {title}: {e}")
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    break
+                self._append(*item)
+            finally:
+                self._queue.task_done()
+
+    def write(self, trace: Trace):
+        if not self.enabled:
+            return
+        line = json.dumps(trace.to_json(), ensure_ascii=False) + "\n"
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="trace-writer", daemon=True
+            )
+            self._thread.start()
+        try:
+            self._queue.put_nowait((trace.title, line))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Wait until the queued traces are written"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def stop(self, timeout: float = 5):
+        """Write the queued traces and stop the writer thread"""
+        if self.dropped:
+            logger.warning(f"{self.dropped} traces dropped, the disk was too slow")
+            self.dropped = 0
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+
+trace_log = TraceLog()
+
+
+def read_traces(path: str, backup_count: int = 3) -> Iterator[dict]:
+    """The traces of the log file and its rotated files, oldest first"""
+    paths = [f"{path}.{i}" for i in range(backup_count, 0, -1)] + [path]
+    for p in paths:
+        if not os.path.exists(p):
+            continue
+        with open(p, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def summarize(traces: Iterator[dict], since: Optional[float] = None) -> dict:
+    """{span name: {count, errors, p50, p95, max}}, "total" for the whole trace
+
+    The durations of the spans of the same name in one trace are summed up.
+    """
+    durations: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+    for trace in traces:
+        if since is not None and trace["start"] < since:
+            continue
+        per_trace: dict[str, float] = {}
+        for s in trace["spans"]:
+            if s["duration"] is not None:
+                per_trace[s["name"]] = per_trace.get(s["name"], 0) + s["duration"]
+            if s.get("error"):
+                errors[s["name"]] = errors.get(s["name"], 0) + 1
+        if trace["total"] is not None:
+            per_trace["total"] = trace["total"]
+        if trace["status"] != "done":
+            errors["total"] = errors.get("total", 0) + 1
+        for name, duration in per_trace.items():
+            durations.setdefault(name, []).append(duration)
+
+    summary = {}
+    for name, values in durations.items():
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "errors": errors.get(name, 0),
+            "p50": _percentile(values, 0.5),
+            "p95": _percentile(values, 0.95),
+            "max": values[-1],
+        }
+    return summary
+
+
+def format_summary(summary: dict) -> str:
+    if not summary:
+        return "No traces"
+    lines = [
+        f"{'stage':12} {'count':>6} {'errors':>6} {'p50':>9} {'p95':>9} {'max':>9}"
+    ]
+    # Stages in the order they appear, total at the end
+    for name, s in sorted(summary.items(), key=lambda item: item[0] == "total"):
+        lines.append(
+            f"{name:12} {s['count']:6} {s['errors']:6} "
+            f"{s['p50']:8.2f}s {s['p95']:8.2f}s {s['max']:8.2f}s"
+        )
+    return "\n".join(lines)
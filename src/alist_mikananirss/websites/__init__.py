@@ -1,5 +1,17 @@
-from .acgrip import AcgRip
 from .base import Website, WebsiteFactory
-from .default import DefaultWebsite
-from .dmhy import Dmhy
-from .mikan import Mikan
+
+# The site parsers import bs4, only load them when used
+_LAZY = {
+    "AcgRip": ".acgrip",
+    "DefaultWebsite": ".default",
+    "Dmhy": ".dmhy",
+    "Mikan": ".mikan",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        import importlib
+
+        return getattr(importlib.import_module(_LAZY[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
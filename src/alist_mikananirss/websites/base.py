@@ -1,13 +1,24 @@
 import abc
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-import feedparser
 from loguru import logger
 
+from alist_mikananirss.utils.metrics import metrics
+
 from .models import FeedEntry, ResourceInfo
 
+if TYPE_CHECKING:
+    import feedparser
+
+FEED_FETCH_SECONDS = metrics.histogram(
+    "website_feed_fetch_seconds", "Time to fetch and parse a rss feed"
+)
+FEED_FETCH_ERRORS = metrics.counter(
+    "website_feed_fetch_errors", "Rss feeds failed to fetch or parse"
+)
+
 
 class Website(abc.ABC):
     """Website，虚基类，提供从各站点Rss链接中提取资源信息的接口"""
@@ -15,16 +26,29 @@ class Website(abc.ABC):
     def __init__(self, rss_url: str):
         self.rss_url = rss_url
 
-    async def parse_feed(self, url) -> Optional[feedparser.FeedParserDict]:
+    async def parse_feed(self, url) -> Optional["feedparser.FeedParserDict"]:
         """使用feedparser库异步解析rss链接"""
+        import feedparser
+
         loop = asyncio.get_event_loop()
-        with ThreadPoolExecutor() as pool:
+        site = type(self).__name__
+        with ThreadPoolExecutor() as pool, FEED_FETCH_SECONDS.time(site=site):
             try:
                 feed = await loop.run_in_executor(pool, feedparser.parse, url)
-                return feed
             except Exception as e:
                 logger.error(f"Failed to get rss feed: {e}")
+                FEED_FETCH_ERRORS.inc(site=site)
                 return None
+        # feedparser doesn't raise on network or parse errors, it returns an
+        # empty feed with bozo set
+        status = feed.get("status", 200)
+        if status >= 400:
+            logger.error(f"Failed to get rss feed {url}: HTTP {status}")
+            FEED_FETCH_ERRORS.inc(site=site)
+        elif feed.get("bozo") and not feed.entries:
+            logger.error(f"Failed to get rss feed {url}: {feed.get('bozo_exception')}")
+            FEED_FETCH_ERRORS.inc(site=site)
+        return feed
 
     @abc.abstractmethod
     async def get_feed_entries(self) -> list[FeedEntry]:
@@ -45,15 +69,15 @@ class WebsiteFactory:
     @staticmethod
     def get_website_parser(rss_url: str) -> Website:
         if "mikan" in rss_url:
-            from . import Mikan
+            from .mikan import Mikan
 
             return Mikan(rss_url)
         elif "dmhy" in rss_url:
-            from . import Dmhy
+            from .dmhy import Dmhy
 
             return Dmhy(rss_url)
         elif "acg.rip" in rss_url:
-            from . import AcgRip
+            from .acgrip import AcgRip
 
             return AcgRip(rss_url)
         else:
@@ -4,6 +4,8 @@ import aiohttp
 import bs4
 
 from alist_mikananirss.extractor import Extractor
+from alist_mikananirss.utils.metrics import metrics
+from alist_mikananirss.utils.tracing import span
 from alist_mikananirss.websites.models import FeedEntry, ResourceInfo
 
 from .base import Website
@@ -11,15 +13,18 @@ from .base import Website
 
 class Dmhy(Website):
     fansub_cache = {}  # {publisher_name: fansub group name}
+    fansub_cache_hits = 0
+    fansub_cache_misses = 0
 
     def __init__(self, rss_url: str):
         super().__init__(rss_url)
 
     async def parse_homepage(self, home_page_url: str) -> Optional[str]:
-        async with aiohttp.ClientSession(trust_env=True) as session:
-            async with session.get(home_page_url) as response:
-                response.raise_for_status()
-                html = await response.text()
+        with span("homepage"):
+            async with aiohttp.ClientSession(trust_env=True) as session:
+                async with session.get(home_page_url) as response:
+                    response.raise_for_status()
+                    html = await response.text()
         soup = bs4.BeautifulSoup(html, "html.parser")
         target_p = soup.select('p:-soup-contains("所屬發佈組")')
         if len(target_p) == 0:
@@ -68,7 +73,9 @@ class Dmhy(Website):
 
             if entry.author in self.fansub_cache and self.fansub_cache[entry.author]:
                 fansub = self.fansub_cache[entry.author]
+                Dmhy.fansub_cache_hits += 1
             else:
+                Dmhy.fansub_cache_misses += 1
                 fansub = await self.parse_homepage(entry.homepage_url)
                 self.fansub_cache[entry.author] = fansub
 
@@ -85,3 +92,9 @@ class Dmhy(Website):
                 version=rtitle_extract_result.version,
             )
         return resource_info
+
+
+metrics.track_cache(
+    "dmhy_fansub",
+    lambda: (Dmhy.fansub_cache_hits, Dmhy.fansub_cache_misses, len(Dmhy.fansub_cache)),
+)
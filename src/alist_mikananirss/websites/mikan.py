@@ -1,10 +1,14 @@
 from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
 
 import aiohttp
 import bs4
 from async_lru import alru_cache
 
 from alist_mikananirss.extractor import Extractor
+from alist_mikananirss.utils.metrics import metrics
+from alist_mikananirss.utils.tracing import span
 from alist_mikananirss.websites.models import FeedEntry, ResourceInfo
 
 from .base import Website
@@ -19,13 +23,22 @@ class MikanHomePageInfo:
 class Mikan(Website):
     def __init__(self, rss_url: str):
         super().__init__(rss_url)
+        self.bangumi_id = self._get_bangumi_id(rss_url)
+
+    @staticmethod
+    def _get_bangumi_id(rss_url: str) -> Optional[str]:
+        """Get the bangumi id from the url of a single bangumi rss feed"""
+        query = parse_qs(urlparse(rss_url).query)
+        bangumi_id = query.get("bangumiId")
+        return bangumi_id[0] if bangumi_id else None
 
     @alru_cache(maxsize=128)
     async def parse_homepage(self, home_page_url: str) -> MikanHomePageInfo:
-        async with aiohttp.ClientSession(trust_env=True) as session:
-            async with session.get(home_page_url) as response:
-                response.raise_for_status()
-                html = await response.text()
+        with span("homepage"):
+            async with aiohttp.ClientSession(trust_env=True) as session:
+                async with session.get(home_page_url) as response:
+                    response.raise_for_status()
+                    html = await response.text()
         soup = bs4.BeautifulSoup(html, "html.parser")
         title_element = soup.find("p", class_="bangumi-title")
         anime_name = title_element.text.strip() if title_element else None
@@ -78,8 +91,12 @@ class Mikan(Website):
             season = None
             if not anime_name:
                 # Can't get anime name from homepage, use tmdb result.
+                # All entries of a bangumi feed belong to the same series
+                series_key = f"mikan:{self.bangumi_id}" if self.bangumi_id else None
                 rtitle_extract_result = await Extractor.analyse_resource_title(
-                    resource_info.resource_title, use_tmdb=True
+                    resource_info.resource_title,
+                    use_tmdb=True,
+                    series_key=series_key,
                 )
                 anime_name = rtitle_extract_result.anime_name
                 season = rtitle_extract_result.season
@@ -103,3 +120,6 @@ class Mikan(Website):
                 version=rtitle_extract_result.version,
             )
         return resource_info
+
+
+metrics.track_alru_cache("mikan_homepage", Mikan.parse_homepage)
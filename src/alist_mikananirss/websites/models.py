@@ -2,6 +2,8 @@ from dataclasses import dataclass, field
 from enum import StrEnum
 from typing import List, Optional
 
+from alist_mikananirss.utils.tracing import Trace
+
 
 class VideoQuality(StrEnum):
     p2160 = "2160p"
@@ -29,10 +31,21 @@ class ResourceInfo:
     quality: Optional[VideoQuality] = None
     languages: List[str] = field(default_factory=list)
     version: int = 1
+    info_hash: Optional[str] = None
+    # From the feed entry, see utils.tracing
+    trace: Optional[Trace] = field(default=None, compare=False, repr=False)
 
     def __hash__(self):
         return hash(self.resource_title)
 
+    def brief(self) -> str:
+        """One line summary: title -> anime S01E01"""
+        if self.anime_name is None:
+            return self.resource_title
+        season = f"S{self.season:02d}" if self.season is not None else ""
+        episode = f"E{self.episode:02d}" if self.episode is not None else ""
+        return f"{self.resource_title} -> {self.anime_name} {season}{episode}".rstrip()
+
     def __str__(self) -> str:
         fields = [
             ("Title", self.resource_title),
@@ -57,6 +70,7 @@ class FeedEntry:
     published_date: Optional[str] = None
     homepage_url: Optional[str] = None
     author: Optional[str] = None
+    trace: Optional[Trace] = field(default=None, compare=False, repr=False)
 
     def __hash__(self):
         return hash(self.resource_title)
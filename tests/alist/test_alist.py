@@ -1,10 +1,12 @@
+import asyncio
 import random
 from datetime import datetime
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
+import aiohttp
 import pytest
 
-from alist_mikananirss.alist.api import Alist
+from alist_mikananirss.alist.api import Alist, AlistCircuitOpenError, AlistClientPolicy
 from alist_mikananirss.alist.tasks import (
     AlistDeletePolicy,
     AlistDownloaderType,
@@ -12,6 +14,9 @@ from alist_mikananirss.alist.tasks import (
     AlistTaskState,
     AlistTaskType,
     AlistTransferTask,
+    InvalidTaskDescription,
+    parse_task_time,
+    raw_task_target_path,
 )
 
 
@@ -217,3 +222,301 @@ def test_tf_task_extract(create_task_json):
         == "/crypt-gd1/Summer Pockets - S01E14 - [三明治摆烂组][简体内嵌][H264 8bit 1080P].mp4"
     )
     assert task2.task_type == AlistTaskType.TRANSFER
+
+
+@pytest.fixture
+def resilient_alist():
+    return Alist(
+        base_url="https://example.com",
+        token="test_token",
+        downloader=AlistDownloaderType.ARIA,
+        policy=AlistClientPolicy(
+            max_retries=2, backoff_base=0, breaker_threshold=3, breaker_reset_time=60
+        ),
+    )
+
+
+def http_error(status):
+    return aiohttp.ClientResponseError(MagicMock(), (), status=status)
+
+
+def connection_error():
+    return aiohttp.ClientConnectorError(MagicMock(), OSError("connection refused"))
+
+
+VERSION_RESPONSE = {"code": 200, "data": {"version": "v3.42.0"}}
+
+
+@pytest.mark.asyncio
+async def test_api_call_retry_idempotent(resilient_alist):
+    endpoint = "/api/public/settings"
+    before = resilient_alist.latency_stats().get(endpoint, {"count": 0, "errors": 0})
+    with patch.object(resilient_alist, "_request", new_callable=AsyncMock) as mock:
+        mock.side_effect = [http_error(502), asyncio.TimeoutError(), VERSION_RESPONSE]
+        assert await resilient_alist.get_alist_ver() == "3.42.0"
+    assert mock.call_count == 3
+    stats = resilient_alist.latency_stats()[endpoint]
+    assert stats["count"] - before["count"] == 3
+    assert stats["errors"] - before["errors"] == 2
+    await resilient_alist.close()
+
+
+@pytest.mark.asyncio
+async def test_api_call_no_retry_non_idempotent(resilient_alist):
+    with patch.object(resilient_alist, "_request", new_callable=AsyncMock) as mock:
+        mock.side_effect = [asyncio.TimeoutError(), {"code": 200, "data": None}]
+        with pytest.raises(asyncio.TimeoutError):
+            await resilient_alist.rename("/a.mkv", "b.mkv")
+        assert mock.call_count == 1
+
+        # Connection errors are safe to retry, the request was never sent
+        mock.side_effect = [connection_error(), {"code": 200, "data": None}]
+        await resilient_alist.rename("/a.mkv", "b.mkv")
+        assert mock.call_count == 3
+    await resilient_alist.close()
+
+
+@pytest.mark.asyncio
+async def test_api_call_client_error_not_retried(resilient_alist):
+    with patch.object(resilient_alist, "_request", new_callable=AsyncMock) as mock:
+        mock.side_effect = [http_error(401)]
+        with pytest.raises(aiohttp.ClientResponseError):
+            await resilient_alist.get_alist_ver()
+    assert resilient_alist.breaker.failures == 0
+    await resilient_alist.close()
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker(resilient_alist):
+    with patch.object(resilient_alist, "_request", new_callable=AsyncMock) as mock:
+        mock.side_effect = http_error(500)
+        with pytest.raises(aiohttp.ClientResponseError):
+            await resilient_alist.get_alist_ver()
+        assert resilient_alist.breaker.state == "open"
+        # Fail fast without requests
+        with pytest.raises(AlistCircuitOpenError):
+            await resilient_alist.get_alist_ver()
+        assert mock.call_count == 3
+
+        # Half open after the reset time, a successful trial closes the circuit
+        resilient_alist.breaker.opened_at -= 60
+        assert resilient_alist.breaker.state == "half_open"
+        mock.side_effect = [VERSION_RESPONSE]
+        assert await resilient_alist.get_alist_ver() == "3.42.0"
+    assert resilient_alist.breaker.state == "closed"
+    await resilient_alist.close()
+
+
+def test_parse_task_time():
+    expected = datetime(2025, 7, 11, 7, 48, 41, 435437)
+    assert parse_task_time("2025-07-11T07:48:41.4354376Z") == expected
+    assert parse_task_time("2025-07-11T07:48:41.435437Z") == expected
+    assert parse_task_time("2025-07-11T07:48:41Z") == datetime(2025, 7, 11, 7, 48, 41)
+    assert parse_task_time("2025-07-11T15:48:41.4+08:00") == datetime(
+        2025, 7, 11, 15, 48, 41, 400000
+    )
+    assert parse_task_time(None) is None
+
+
+def test_task_lazy_description(create_task_json):
+    create_dl_task_json, create_tf_task_json = create_task_json
+    json_data = create_dl_task_json("dl1", AlistTaskState.Pending, "", "")
+    json_data["name"] = "unknown description"
+    # Parsed only when needed
+    task = AlistDownloadTask.from_json(json_data)
+    with pytest.raises(InvalidTaskDescription):
+        task.url
+
+    tf_task = AlistTransferTask.from_json(
+        create_tf_task_json(
+            "tf1",
+            AlistTaskState.Running,
+            "d82ddec1-08f6-4894-b7ed-d9c9f25dc4db",
+            "/Google",
+            "/Anime",
+            "a.mkv",
+        )
+    )
+    assert not hasattr(tf_task, "__dict__")
+    new_task = AlistTransferTask.from_json(
+        create_tf_task_json(
+            "tf1",
+            AlistTaskState.Succeeded,
+            "d82ddec1-08f6-4894-b7ed-d9c9f25dc4db",
+            "/Google",
+            "/Anime",
+            "a.mkv",
+        )
+    )
+    tf_task.update_from(new_task)
+    assert tf_task.state == AlistTaskState.Succeeded
+    assert tf_task.target_path == "/Google/Anime/a.mkv"
+
+
+@pytest.mark.asyncio
+async def test_get_task_list_filters(alist, create_task_json):
+    create_dl_task_json, create_tf_task_json = create_task_json
+    dl_tasks = [
+        create_dl_task_json(f"dl{i}", 2, f"magnet:?xt={i}", f"/Google/Anime/A{i}")
+        for i in range(5)
+    ]
+    tf_tasks = [
+        create_tf_task_json(
+            f"tf{i}",
+            2,
+            "d82ddec1-08f6-4894-b7ed-d9c9f25dc4db",
+            "/Google",
+            f"/Anime/A{i}",
+            "a.mkv",
+        )
+        for i in range(5)
+    ]
+    with (
+        patch.object(alist, "_api_call", new_callable=AsyncMock) as mock_api_call,
+        patch.object(
+            AlistDownloadTask, "from_json", wraps=AlistDownloadTask.from_json
+        ) as mock_from_json,
+    ):
+        mock_api_call.return_value = dl_tasks
+        tasks = await alist.get_task_list(
+            AlistTaskType.DOWNLOAD, "done", tids={"dl1", "dl3"}
+        )
+        assert [t.tid for t in tasks] == ["dl1", "dl3"]
+        # Untracked tasks are never parsed
+        assert mock_from_json.call_count == 2
+
+        tasks = await alist.get_task_list(
+            AlistTaskType.DOWNLOAD,
+            "done",
+            path_prefix="Google/Anime/A2",
+            predicate=lambda t: t["state"] == 2,
+        )
+        assert [t.tid for t in tasks] == ["dl2"]
+
+        mock_api_call.return_value = tf_tasks
+        tasks = await alist.get_task_list(
+            AlistTaskType.TRANSFER, "done", path_prefix="/Google/Anime/A4"
+        )
+        assert [t.tid for t in tasks] == ["tf4"]
+
+
+def test_raw_task_target_path():
+    assert (
+        raw_task_target_path(
+            AlistTaskType.DOWNLOAD, "download magnet:?xt=1 to (/Google/Anime (2024))"
+        )
+        == "/Google/Anime (2024)"
+    )
+    assert (
+        raw_task_target_path(
+            AlistTaskType.TRANSFER,
+            "transfer [](/tmp/qBittorrent/uuid/[ANi] A - 01.mp4) to [/Google](/Anime/A/Season 1)",
+        )
+        == "/Google/Anime/A/Season 1"
+    )
+    assert raw_task_target_path(AlistTaskType.TRANSFER, "upload a.mkv") is None
+
+
+@pytest.mark.asyncio
+async def test_batch_rename(alist):
+    with patch.object(alist, "_api_call", new_callable=AsyncMock) as mock_api_call:
+        await alist.batch_rename("/anime", [("a.mp4", "A.mp4"), ("b.mp4", "B.mp4")])
+        mock_api_call.assert_called_once_with(
+            "POST",
+            "api/fs/batch_rename",
+            json={
+                "src_dir": "/anime",
+                "rename_objects": [
+                    {"src_name": "a.mp4", "new_name": "A.mp4"},
+                    {"src_name": "b.mp4", "new_name": "B.mp4"},
+                ],
+            },
+        )
+
+
+@pytest.mark.asyncio
+async def test_iter_dir_pages(alist):
+    pages = [
+        {"content": [{"name": "1"}, {"name": "2"}], "total": 5},
+        {"content": [{"name": "3"}, {"name": "4"}], "total": 5},
+        {"content": [{"name": "5"}], "total": 5},
+    ]
+    with patch.object(alist, "_api_call", new_callable=AsyncMock) as mock_api_call:
+        mock_api_call.side_effect = pages
+        files = [name async for name in alist.iter_dir("/dir", per_page=2)]
+
+    assert files == ["1", "2", "3", "4", "5"]
+    assert [c.kwargs["json"]["page"] for c in mock_api_call.call_args_list] == [
+        1,
+        2,
+        3,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_list_dir_all_cache(alist):
+    with patch.object(alist, "_api_call", new_callable=AsyncMock) as mock_api_call:
+        mock_api_call.return_value = {"content": [{"name": "a.mp4"}], "total": 1}
+        assert await alist.list_dir_all("/dir/") == ["a.mp4"]
+        assert await alist.list_dir_all("/dir") == ["a.mp4"]
+        assert mock_api_call.call_count == 1
+
+        # Renaming a file of the dir drops the cached listing
+        await alist.rename("/dir/a.mp4", "b.mp4")
+        mock_api_call.return_value = {"content": [{"name": "b.mp4"}], "total": 1}
+        assert await alist.list_dir_all("/dir") == ["b.mp4"]
+        assert mock_api_call.call_count == 3
+
+        alist.invalidate_dir_cache()
+        await alist.list_dir_all("/dir")
+        assert mock_api_call.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_upload_streams_chunks(alist, tmp_path):
+    file_path = tmp_path / "episode.mp4"
+    content = bytes(range(256)) * 40
+    file_path.write_bytes(content)
+    received = []
+
+    async def fake_request(method, url, headers, data=None, **kwargs):
+        assert headers["Content-Length"] == str(len(content))
+        async for chunk in data:
+            received.append(chunk)
+        return {"code": 200, "data": None}
+
+    progresses = []
+    with patch.object(alist, "_request", side_effect=fake_request):
+        assert await alist.upload("/anime", str(file_path), progresses.append, 4096)
+
+    assert b"".join(received) == content
+    assert [len(c) for c in received] == [4096, 4096, 2048]
+    assert [p.sent for p in progresses] == [4096, 8192, 10240]
+    assert progresses[-1].percent == 100
+
+
+@pytest.mark.asyncio
+async def test_upload_many_concurrency(alist, tmp_path):
+    file_paths = []
+    for i in range(5):
+        file_path = tmp_path / f"{i}.ass"
+        file_path.write_text("subtitle")
+        file_paths.append(str(file_path))
+    running = 0
+    max_running = 0
+
+    async def fake_upload(save_path, file_path, progress=None):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if file_path.endswith("3.ass"):
+            raise aiohttp.ClientError("Upload failed")
+        return True
+
+    with patch.object(alist, "upload", side_effect=fake_upload):
+        results = await alist.upload_many("/anime", file_paths, concurrency=2)
+
+    assert results == [True, True, True, False, True]
+    assert max_running == 2
@@ -0,0 +1,101 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+import pytest_asyncio
+
+from alist_mikananirss import AnimeRenamer
+from alist_mikananirss.alist import Alist, AlistDownloaderType, AlistTaskType
+from alist_mikananirss.alist.fake_server import FakeAlistOptions, FakeAlistServer
+from alist_mikananirss.alist.tasks import AlistTaskState
+from alist_mikananirss.core.download_manager import DownloadManager
+from alist_mikananirss.websites.models import ResourceInfo
+
+BTIH = "0123456789abcdef0123456789abcdef01234567"
+
+
+@pytest_asyncio.fixture
+async def server():
+    async with FakeAlistServer(
+        FakeAlistOptions(download_time=0.05, transfer_time=0.05, history_size=100)
+    ) as server:
+        yield server
+
+
+@pytest_asyncio.fixture
+async def alist(server):
+    alist = Alist(server.base_url, server.token, AlistDownloaderType.QBIT)
+    yield alist
+    await alist.close()
+
+
+@pytest.mark.asyncio
+async def test_task_lifecycle(server, alist):
+    assert await alist.get_alist_ver() == "3.42.0"
+    assert len(await alist.get_task_list(AlistTaskType.DOWNLOAD, "done")) == 50
+    assert len(await alist.get_task_list(AlistTaskType.TRANSFER, "done")) == 50
+
+    save_path = "/Google/Anime/Test/Season 1"
+    (dl_task,) = await alist.add_offline_download_task(
+        save_path, [f"magnet:?xt=urn:btih:{BTIH}"]
+    )
+    assert dl_task.state == AlistTaskState.Running
+    assert dl_task.download_path == save_path
+
+    await asyncio.sleep(0.15)
+    (tf_task,) = await alist.get_task_list(
+        AlistTaskType.TRANSFER, "done", path_prefix=save_path
+    )
+    assert tf_task.state == AlistTaskState.Succeeded
+    assert tf_task.start_time > dl_task.start_time
+    assert tf_task.target_path == f"{save_path}/[Fake] {BTIH}.mp4"
+    assert await alist.list_dir_all(save_path) == [f"[Fake] {BTIH}.mp4"]
+
+    await alist.rename(tf_task.target_path, "Test S01E01.mp4")
+    assert await alist.list_dir_all(save_path) == ["Test S01E01.mp4"]
+
+
+@pytest.mark.asyncio
+async def test_failed_tasks(alist, server):
+    server.options.download_failure_rate = 1
+    (dl_task,) = await alist.add_offline_download_task(
+        "/Google/Anime", [f"magnet:?xt=urn:btih:{BTIH}"]
+    )
+    await asyncio.sleep(0.1)
+    (task,) = await alist.get_task_list(AlistTaskType.DOWNLOAD, tids=[dl_task.tid])
+    assert task.state == AlistTaskState.Failed
+    assert await alist.get_task_list(AlistTaskType.TRANSFER, "undone") == []
+
+
+@pytest.mark.asyncio
+async def test_invalid_token(server):
+    alist = Alist(server.base_url, "wrong", AlistDownloaderType.QBIT)
+    with pytest.raises(Exception, match="token is invalidated"):
+        await alist.list_dir_all("/")
+    await alist.close()
+
+
+@pytest.mark.asyncio
+async def test_download_manager_end_to_end(alist, server):
+    DownloadManager.destroy_instance()
+    AnimeRenamer.destroy_instance()
+    AnimeRenamer.initialize(alist, "{name} S{season:02d}E{episode:02d}")
+    db = AsyncMock()
+    DownloadManager.initialize(
+        alist_client=alist, base_download_path="/Google/Anime", use_renamer=True, db=db
+    )
+    resource = ResourceInfo(
+        resource_title="Test - 01",
+        torrent_url=f"magnet:?xt=urn:btih:{BTIH}",
+        anime_name="Test",
+        season=1,
+        episode=1,
+    )
+
+    await DownloadManager.add_download_tasks([resource])
+    await asyncio.wait_for(DownloadManager().task_monitor.wait_finished(), 10)
+
+    assert server.files["/Google/Anime/Test/Season 1"] == {"Test S01E01.mp4": 390419899}
+    db.delete_by_resource_title.assert_not_called()
+    DownloadManager.destroy_instance()
+    AnimeRenamer.destroy_instance()
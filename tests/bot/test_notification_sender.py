@@ -1,10 +1,16 @@
 import asyncio
-from unittest.mock import AsyncMock
+import os
+import uuid
+from unittest.mock import AsyncMock, MagicMock
 
+import aiohttp
 import pytest
+import pytest_asyncio
 
-from alist_mikananirss.bot import NotificationBot
+from alist_mikananirss.bot import BotBase, NotificationBot
+from alist_mikananirss.common.database import SubscribeDatabase, db_dirpath
 from alist_mikananirss.core import NotificationSender
+from alist_mikananirss.core.notification_sender import MAX_SEND_ATTEMPTS
 from alist_mikananirss.websites.models import ResourceInfo
 
 
@@ -13,6 +19,36 @@ def reset_notification_sender():
     NotificationSender.destroy_instance()
 
 
+@pytest_asyncio.fixture
+async def db_name():
+    name = f"test_db_{uuid.uuid4()}.db"
+    yield name
+    db_filepath = os.path.join(db_dirpath, name)
+    if os.path.exists(db_filepath):
+        os.remove(db_filepath)
+
+
+class FlakyBot(BotBase):
+    max_message_length = 120
+    rate = 1000
+    burst = 10
+
+    def __init__(self):
+        self.fail = False
+        self.reject = ()
+        self.messages = []
+
+    async def send_message(self, message: str) -> bool:
+        if self.fail:
+            raise ConnectionError("Network down")
+        if any(title in message for title in self.reject):
+            raise aiohttp.ClientResponseError(
+                MagicMock(), (), status=400, message="Bad Request"
+            )
+        self.messages.append(message)
+        return True
+
+
 @pytest.mark.asyncio
 async def test_initialization():
     mock_bot = AsyncMock(spec=NotificationBot)
@@ -65,6 +101,8 @@ async def test_run_method():
     mock_bot = AsyncMock(spec=NotificationBot)
     mock_bot.send_message.return_value = asyncio.Future()
     mock_bot.send_message.return_value.set_result(None)
+    mock_bot.name = "MockBot"
+    mock_bot.max_message_length = 4096
 
     NotificationSender.initialize([mock_bot], interval=0.1)
     resource = ResourceInfo(
@@ -94,3 +132,169 @@ async def test_send_method_without_bots():
     task = asyncio.create_task(NotificationSender.run())
     await asyncio.sleep(0.2)
     task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_outbox_survives_restart(db_name):
+    resources = [
+        ResourceInfo(
+            anime_name="Test Anime",
+            resource_title=f"[ANi] Test Anime - {i:02d}",
+            torrent_url=f"https://test.com/{i}.torrent",
+        )
+        for i in range(1, 6)
+    ]
+    bot = FlakyBot()
+    bot.fail = True
+    db = await SubscribeDatabase.create(db_name)
+    try:
+        NotificationSender.initialize([NotificationBot(bot)], interval=60, db=db)
+        for resource in resources[:3]:
+            await NotificationSender.add_resource(resource)
+        await NotificationSender.flush()
+        assert len(await db.get_outbox()) == 3
+    finally:
+        await db.close()
+
+    # Restart, the bot is back
+    NotificationSender.destroy_instance()
+    bot.fail = False
+    db = await SubscribeDatabase.create(db_name)
+    try:
+        NotificationSender.initialize([NotificationBot(bot)], interval=60, db=db)
+        for resource in resources[3:]:
+            await NotificationSender.add_resource(resource)
+        await NotificationSender.flush()
+        assert await db.get_outbox() == []
+    finally:
+        await db.close()
+
+    # Coalesced under one anime, split to the size limit of the bot
+    assert len(bot.messages) > 1
+    assert all(len(message) <= bot.max_message_length for message in bot.messages)
+    sent = "".join(bot.messages)
+    for resource in resources:
+        assert sent.count(resource.resource_title) == 1
+
+
+def make_resources(n: int, anime_name: str = "Test Anime") -> list[ResourceInfo]:
+    return [
+        ResourceInfo(
+            anime_name=anime_name,
+            resource_title=f"[ANi] {anime_name} - {i:02d}",
+            torrent_url=f"https://test.com/{anime_name}/{i}.torrent",
+        )
+        for i in range(1, n + 1)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_outbox_drops_after_attempts(db_name):
+    bot = FlakyBot()
+    bot.fail = True
+    db = await SubscribeDatabase.create(db_name)
+    try:
+        NotificationSender.initialize([NotificationBot(bot)], interval=60, db=db)
+        await NotificationSender.add_resource(make_resources(1)[0])
+        for attempt in range(1, MAX_SEND_ATTEMPTS):
+            await NotificationSender.flush()
+            ((_, _, attempts),) = await db.get_outbox()
+            assert attempts == attempt
+        await NotificationSender.flush()
+        assert await db.get_outbox() == []
+
+        # The outbox isn't blocked
+        bot.fail = False
+        await NotificationSender.add_resource(make_resources(2)[1])
+        await NotificationSender.flush()
+        assert len(bot.messages) == 1
+    finally:
+        await db.close()
+
+
+@pytest.mark.asyncio
+async def test_outbox_drops_rejected(db_name):
+    bot = FlakyBot()
+    bad, good = make_resources(1, "Bad"), make_resources(1, "Good")
+    # Too long to share a message with the good one
+    bad[0].resource_title += " " + "x" * 60
+    bot.reject = (bad[0].resource_title,)
+    db = await SubscribeDatabase.create(db_name)
+    try:
+        NotificationSender.initialize([NotificationBot(bot)], interval=60, db=db)
+        await NotificationSender.add_resource(bad[0])
+        await NotificationSender.add_resource(good[0])
+        await NotificationSender.flush()
+        # Dropped at once, the next message is still sent
+        assert await db.get_outbox() == []
+        assert len(bot.messages) == 1
+        assert good[0].resource_title in bot.messages[0]
+    finally:
+        await db.close()
+
+
+class ChatBot(FlakyBot):
+    def __init__(self, chat: str):
+        super().__init__()
+        self.chat = chat
+
+    @property
+    def identity(self) -> str:
+        return self.chat
+
+
+@pytest.mark.asyncio
+async def test_outbox_kept_when_bots_reordered(db_name):
+    resource = make_resources(1)[0]
+    bot_a, bot_b = ChatBot("a"), ChatBot("b")
+    bot_a.fail = bot_b.fail = True
+    db = await SubscribeDatabase.create(db_name)
+    try:
+        NotificationSender.initialize(
+            [NotificationBot(bot_a), NotificationBot(bot_b)], interval=60, db=db
+        )
+        await NotificationSender.add_resource(resource)
+        await NotificationSender.flush()
+    finally:
+        await db.close()
+
+    # Restart with a new bot first and the others swapped
+    NotificationSender.destroy_instance()
+    bot_a.fail = bot_b.fail = False
+    bot_c = ChatBot("c")
+    db = await SubscribeDatabase.create(db_name)
+    try:
+        NotificationSender.initialize(
+            [NotificationBot(bot) for bot in (bot_c, bot_b, bot_a)],
+            interval=60,
+            db=db,
+        )
+        await NotificationSender.flush()
+        assert await db.get_outbox() == []
+    finally:
+        await db.close()
+
+    assert bot_c.messages == []
+    assert len(bot_a.messages) == len(bot_b.messages) == 1
+    assert resource.resource_title in bot_a.messages[0]
+
+
+@pytest.mark.asyncio
+async def test_outbox_legacy_keys(db_name):
+    resources = make_resources(2)
+    bot_a, bot_b = ChatBot("a"), ChatBot("b")
+    db = await SubscribeDatabase.create(db_name)
+    try:
+        # Saved by an older version, keyed by the position of the bot
+        await db.insert_outbox(["0:ChatBot"], resources[0])
+        await db.insert_outbox(["1:ChatBot"], resources[1])
+        NotificationSender.initialize(
+            [NotificationBot(bot_a), NotificationBot(bot_b)], interval=60, db=db
+        )
+        await NotificationSender.flush()
+        assert await db.get_outbox() == []
+    finally:
+        await db.close()
+
+    assert resources[0].resource_title in bot_a.messages[0]
+    assert resources[1].resource_title in bot_b.messages[0]
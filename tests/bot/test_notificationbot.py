@@ -0,0 +1,86 @@
+from alist_mikananirss.bot import (
+    NotificationBot,
+    NotificationMsg,
+    PushPlusBot,
+    TelegramBot,
+)
+from alist_mikananirss.websites.models import ResourceInfo
+
+
+def make_msg() -> NotificationMsg:
+    resources = [
+        ResourceInfo(
+            anime_name=f"Anime {i % 3}",
+            resource_title=f"[ANi] Anime {i % 3} - {i:02d} [1080P][Baha][WEB-DL]",
+            torrent_url=f"https://test.com/{i}.torrent",
+        )
+        for i in range(30)
+    ]
+    return NotificationMsg.from_resources(resources)
+
+
+def test_format_message():
+    msg = NotificationMsg()
+    msg.update("A", ["A - 01", "A - 02"])
+    msg.update("B", ["B - 01"])
+    assert str(msg) == (
+        "你订阅的番剧<b>[A]</b>, <b>[B]</b> 更新啦：\n"
+        "<b>[A]</b>:\nA - 01\nA - 02\n\n"
+        "<b>[B]</b>:\nB - 01\n\n"
+    )
+    assert msg.titles() == ["A - 01", "A - 02", "B - 01"]
+    assert str(NotificationMsg()) == "暂无番剧更新"
+
+
+def test_split():
+    msg = make_msg()
+    assert msg.split(len(str(msg))) == [msg]
+
+    parts = msg.split(300)
+    assert len(parts) > 1
+    assert all(len(str(part)) <= 300 for part in parts)
+    assert all(str(part).startswith("你订阅的番剧") for part in parts)
+    # Every title once, in order
+    assert [t for part in parts for t in part.titles()] == msg.titles()
+
+
+def test_split_long_title():
+    msg = NotificationMsg()
+    msg.update("A", ["A - 01", "A" * 500, "A - 03"])
+    parts = msg.split(100)
+    assert [part.titles() for part in parts] == [["A - 01"], ["A" * 500], ["A - 03"]]
+    assert len(str(parts[1])) == 100
+    assert str(parts[1]).endswith("…\n\n")
+
+
+def test_escape_html():
+    msg = NotificationMsg()
+    msg.update("A&B", ["[Sub] A&B - 01 <1080p>"])
+    assert str(msg) == (
+        "你订阅的番剧<b>[A&amp;B]</b> 更新啦：\n"
+        "<b>[A&amp;B]</b>:\n[Sub] A&amp;B - 01 &lt;1080p&gt;\n\n"
+    )
+    # Titles are kept as is to find the resources
+    assert msg.titles() == ["[Sub] A&B - 01 <1080p>"]
+
+    msg = NotificationMsg()
+    msg.update("A", ["A - 01", "<&>" * 100])
+    _, part = msg.split(80)
+    text = str(part)
+    assert len(text) <= 80
+    # Cut outside of the markup and the entities
+    assert text.count("<b>") == text.count("</b>") == 2
+    assert text.endswith(";…\n\n")
+
+
+def test_bot_key():
+    key = NotificationBot(TelegramBot("token", 1)).key
+    assert key == NotificationBot(TelegramBot("token", 1)).key
+    assert key.startswith("TelegramBot:")
+    # The token isn't saved as is
+    assert "token" not in key
+    assert key != NotificationBot(TelegramBot("token", 2)).key
+    assert (
+        NotificationBot(PushPlusBot("token")).key
+        != NotificationBot(PushPlusBot("token", "mail")).key
+    )
@@ -1,9 +1,17 @@
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
+import pytest_asyncio
+from alist_mikananirss.bot import close_session
 from alist_mikananirss.bot.pushplus_bot import PushPlusBot, PushPlusChannel
 
 
+@pytest_asyncio.fixture(autouse=True)
+async def shared_session():
+    yield
+    await close_session()
+
+
 @pytest.fixture
 def pushplus_bot():
     return PushPlusBot(user_token="test_token")
@@ -5,7 +5,7 @@ import pytest
 import pytest_asyncio
 
 from alist_mikananirss.common.database import SubscribeDatabase, db_dirpath
-from alist_mikananirss.websites.models import LanguageType, ResourceInfo
+from alist_mikananirss.websites.models import LanguageType, ResourceInfo, VideoQuality
 
 
 @pytest_asyncio.fixture
@@ -37,6 +37,9 @@ async def test_create_table(test_db):
     tables = await cursor.fetchall()
     assert ("resource_data",) in tables
     assert ("db_version",) in tables
+    assert ("subscriptions",) in tables
+    assert ("notification_outbox",) in tables
+    assert ("skipped_resources",) in tables
     await test_db.close()
 
 
@@ -136,7 +139,7 @@ async def test_upgrade_database(test_db):
     cursor = await test_db.db.execute("SELECT version FROM db_version")
     version = await cursor.fetchone()
     version = version[0]
-    assert version == 1
+    assert version == 8
 
     cursor = await test_db.db.execute("PRAGMA table_info(resource_data)")
     columns = [info[1] for info in await cursor.fetchall()]
@@ -152,6 +155,7 @@ async def test_upgrade_database(test_db):
         "fansub",
         "quality",
         "language",
+        "info_hash",
     ]
     assert all(column in columns for column in expected_columns)
     await test_db.close()
@@ -183,3 +187,214 @@ async def test_insert_duplicate(test_db):
     count = count[0]
     await test_db.close()
     assert count == 1
+
+
+@pytest.mark.asyncio
+async def test_upgrade_from_version_1(test_db):
+    await test_db.db.execute("DROP TABLE resource_data")
+    await test_db.db.execute(
+        """
+        CREATE TABLE resource_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            resource_title TEXT NOT NULL,
+            torrent_url TEXT UNIQUE,
+            published_date TEXT,
+            downloaded_date TEXT,
+            anime_name TEXT,
+            season INTEGER,
+            episode INTEGER,
+            fansub TEXT,
+            quality TEXT,
+            language TEXT
+        )
+        """
+    )
+    await test_db.db.execute("DELETE FROM db_version")
+    await test_db.db.execute("INSERT INTO db_version (version) VALUES (1)")
+    await test_db.db.commit()
+
+    await test_db._upgrade_database()
+
+    cursor = await test_db.db.execute("SELECT version FROM db_version")
+    assert await cursor.fetchall() == [(8,)]
+    cursor = await test_db.db.execute("PRAGMA index_list(resource_data)")
+    indexes = [info[1] for info in await cursor.fetchall()]
+    assert "idx_info_hash" in indexes
+    assert "idx_episode" in indexes
+
+
+@pytest.mark.asyncio
+async def test_info_hash_exist(test_db):
+    info_hash = "c12fe1c06bba254a9dc9f519b335aa7c1367a88a"
+    resource = ResourceInfo(
+        resource_title="Test Anime",
+        torrent_url="https://example.com/test.torrent",
+        info_hash=info_hash,
+    )
+    await test_db.insert_resource_info(resource)
+
+    assert await test_db.is_info_hash_exist(info_hash)
+    assert not await test_db.is_info_hash_exist("0" * 40)
+
+
+@pytest.mark.asyncio
+async def test_get_resources_by_episode(test_db):
+    resource = ResourceInfo(
+        resource_title="[ANi] Test Anime - 01",
+        torrent_url="https://example.com/test.torrent",
+        anime_name="Test Anime",
+        season=1,
+        episode=1,
+        fansub="ANi",
+        quality=VideoQuality.p1080,
+        languages=[LanguageType.TRADITIONAL_CHINESE, LanguageType.JAPANESE],
+    )
+    await test_db.insert_resource_info(resource)
+
+    result = await test_db.get_resources_by_episode("Test Anime", 1, 1)
+    assert len(result) == 1
+    assert result[0].fansub == "ANi"
+    assert result[0].quality == VideoQuality.p1080
+    assert result[0].languages == ["繁", "日"]
+    assert await test_db.get_resources_by_episode("Test Anime", 1, 2) == []
+
+
+@pytest.mark.asyncio
+async def test_languages_roundtrip(test_db):
+    resource = ResourceInfo(
+        resource_title="[ANi] Test Anime - 02",
+        torrent_url="https://example.com/test2.torrent",
+        anime_name="Test Anime",
+        season=1,
+        episode=2,
+        languages=[LanguageType.UNKNOWN, LanguageType.JAPANESE],
+    )
+    await test_db.insert_resource_info(resource)
+    # Written by the older versions, without separator
+    await test_db.db.execute(
+        """
+            INSERT INTO resource_data
+            (resource_title, torrent_url, anime_name, season, episode, language)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (
+            "[ANi] Test Anime - 03",
+            "https://example.com/test3.torrent",
+            "Test Anime",
+            1,
+            3,
+            "简Unknown",
+        ),
+    )
+    await test_db.db.commit()
+
+    (result,) = await test_db.get_resources_by_episode("Test Anime", 1, 2)
+    assert result.languages == ["Unknown", "日"]
+    (result,) = await test_db.get_resources_by_episode("Test Anime", 1, 3)
+    assert result.languages == ["简", "Unknown"]
+
+
+@pytest.mark.asyncio
+async def test_pending_releases(test_db):
+    resource = ResourceInfo(
+        resource_title="[ANi] Test Anime - 01",
+        torrent_url="https://example.com/test.torrent",
+        anime_name="Test Anime",
+        season=1,
+        episode=1,
+        fansub="ANi",
+        quality=VideoQuality.p1080,
+        languages=["繁"],
+    )
+    await test_db.save_pending_release(resource, 100.0)
+    better = ResourceInfo(
+        resource_title="[LoliHouse] Test Anime - 01",
+        torrent_url="https://example.com/test2.torrent",
+        anime_name="Test Anime",
+        season=1,
+        episode=1,
+    )
+    await test_db.save_pending_release(better, 100.0)
+    assert await test_db.get_pending_releases() == [(better, 100.0)]
+
+    await test_db.save_pending_release(resource, 100.0)
+    ((loaded, deadline),) = await test_db.get_pending_releases()
+    assert loaded == resource
+    assert loaded.quality is VideoQuality.p1080
+    await test_db.delete_pending_release("Test Anime", 1, 1)
+    assert await test_db.get_pending_releases() == []
+
+
+@pytest.mark.asyncio
+async def test_subscriptions(test_db):
+    url = "https://mikanani.me/RSS/Bangumi?bangumiId=3519"
+    assert await test_db.insert_subscription(url, {"fansub_include": ["ANi"]})
+    assert not await test_db.insert_subscription(url)
+    assert await test_db.insert_subscription("https://share.dmhy.org/rss.xml")
+
+    subscriptions = await test_db.get_subscriptions()
+    assert subscriptions == [
+        (url, {"fansub_include": ["ANi"]}),
+        ("https://share.dmhy.org/rss.xml", {}),
+    ]
+
+    assert await test_db.delete_subscription(url)
+    assert not await test_db.delete_subscription(url)
+    assert len(await test_db.get_subscriptions()) == 1
+
+
+@pytest.mark.asyncio
+async def test_notification_outbox(test_db):
+    resources = [
+        ResourceInfo(
+            resource_title=f"[ANi] Test Anime - {i:02d}",
+            torrent_url=f"https://example.com/{i}.torrent",
+            anime_name="Test Anime",
+        )
+        for i in range(1, 4)
+    ]
+    for resource in resources:
+        await test_db.insert_outbox(["0:TelegramBot", "1:PushPlusBot"], resource)
+
+    outbox = await test_db.get_outbox()
+    assert len(outbox) == 6
+    assert outbox[0] == ("0:TelegramBot", resources[0], 0)
+    assert outbox[0][1].anime_name == "Test Anime"
+
+    await test_db.increment_outbox_attempts(
+        "0:TelegramBot", [resources[1].resource_title]
+    )
+    await test_db.delete_outbox("0:TelegramBot", [resources[0].resource_title])
+    await test_db.delete_outbox("1:PushPlusBot")
+    outbox = await test_db.get_outbox()
+    assert [(bot, r.resource_title, attempts) for bot, r, attempts in outbox] == [
+        ("0:TelegramBot", resources[1].resource_title, 1),
+        ("0:TelegramBot", resources[2].resource_title, 0),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_upgrade_outbox_attempts(test_db):
+    await test_db.db.execute("DROP TABLE notification_outbox")
+    await test_db.db.execute(
+        """
+        CREATE TABLE notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bot TEXT NOT NULL,
+            resource_title TEXT NOT NULL,
+            torrent_url TEXT,
+            anime_name TEXT,
+            created_date TEXT
+        )
+        """
+    )
+    await test_db.db.execute(
+        "INSERT INTO notification_outbox (bot, resource_title) VALUES (?, ?)",
+        ("0:TelegramBot", "Test - 01"),
+    )
+    await test_db.db.execute("UPDATE db_version SET version = 7")
+    await test_db.db.commit()
+    await test_db._upgrade_database()
+
+    ((bot, resource, attempts),) = await test_db.get_outbox()
+    assert (bot, resource.resource_title, attempts) == ("0:TelegramBot", "Test - 01", 0)
@@ -30,6 +30,7 @@ def test_build_download_path_with_anime_name(base_path):
     expected_path = os.path.join(base_path, "Test Anime")
     test_instance = DownloadManager()
     assert test_instance._build_download_path(resource) == expected_path
+    assert DownloadManager.download_path(resource) == expected_path
 
 
 def test_build_download_path_with_anime_name_and_season(base_path):
@@ -1,9 +1,12 @@
 import os
+import uuid
 from unittest.mock import AsyncMock, MagicMock
 
 import pytest
+import pytest_asyncio
 
-from alist_mikananirss.alist.tasks import AlistDownloadTask
+from alist_mikananirss.alist.tasks import AlistDownloadTask, AlistTaskState
+from alist_mikananirss.common.database import SubscribeDatabase, db_dirpath
 from alist_mikananirss.core.download_manager import DownloadManager
 from alist_mikananirss.websites.models import ResourceInfo, VideoQuality
 
@@ -205,3 +208,108 @@ async def test_add_download_tasks_unmatched_task(setup_download_manager, resourc
     # Check that only the matched resource was processed
     mock_db.insert_resource_info.assert_called_once_with(resources[0])
     dm.task_monitor.monitor.assert_called_once_with(matched_task, resources[0])
+
+
+@pytest.mark.asyncio
+async def test_add_download_tasks_dedupe_by_info_hash(setup_download_manager):
+    dm, mock_alist_client, mock_db = setup_download_manager
+    dm.dedupe_by_info_hash = True
+    info_hash = "c12fe1c06bba254a9dc9f519b335aa7c1367a88a"
+    mikan = ResourceInfo(
+        resource_title="[ANi] Test Anime - 01 [1080P]",
+        torrent_url=f"https://mikanani.me/Download/20240717/{info_hash}.torrent",
+        anime_name="Test Anime",
+    )
+    dmhy = ResourceInfo(
+        resource_title="【ANi】Test Anime - 01 [1080P]",
+        torrent_url=f"magnet:?xt=urn:btih:{info_hash}",
+        anime_name="Test Anime",
+    )
+    downloaded = ResourceInfo(
+        resource_title="[ANi] Test Anime - 00 [1080P]",
+        torrent_url="magnet:?xt=urn:btih:" + "0" * 40,
+        anime_name="Test Anime",
+    )
+    mock_db.is_info_hash_exist.side_effect = lambda h: h == "0" * 40
+    mock_alist_client.add_offline_download_task.return_value = [
+        MagicMock(spec=AlistDownloadTask, url=mikan.torrent_url)
+    ]
+
+    await DownloadManager.add_download_tasks([mikan, dmhy, downloaded])
+
+    mock_alist_client.add_offline_download_task.assert_called_once_with(
+        os.path.join("/anime", "Test Anime"), [mikan.torrent_url]
+    )
+    assert mikan.info_hash == info_hash
+    # Duplicates are recorded apart from the downloaded resources
+    mock_db.insert_resource_info.assert_called_once_with(mikan)
+    skipped = [c.args[0] for c in mock_db.insert_skipped_resource.call_args_list]
+    assert skipped == [dmhy, downloaded]
+    dm.task_monitor.monitor.assert_called_once()
+
+
+@pytest_asyncio.fixture
+async def real_db():
+    name = f"test_db_{uuid.uuid4()}.db"
+    db = await SubscribeDatabase.create(name)
+    yield db
+    await db.close()
+    os.remove(os.path.join(db_dirpath, name))
+
+
+@pytest.mark.asyncio
+async def test_duplicate_retried_after_failed_download(real_db):
+    mock_alist_client = AsyncMock()
+    DownloadManager.destroy_instance()
+    dm = DownloadManager(
+        alist_client=mock_alist_client,
+        base_download_path="/anime",
+        db=real_db,
+        dedupe_by_info_hash=True,
+    )
+    dm.task_monitor.monitor = AsyncMock()
+    info_hash = "c12fe1c06bba254a9dc9f519b335aa7c1367a88a"
+    mikan = ResourceInfo(
+        resource_title="[ANi] Test Anime - 01 [1080P]",
+        torrent_url=f"https://mikanani.me/Download/20240717/{info_hash}.torrent",
+        anime_name="Test Anime",
+        season=1,
+        episode=1,
+    )
+    dmhy = ResourceInfo(
+        resource_title="【ANi】Test Anime - 01 [1080P]",
+        torrent_url=f"magnet:?xt=urn:btih:{info_hash}",
+        anime_name="Test Anime",
+        season=1,
+        episode=1,
+    )
+    dl_task = MagicMock(spec=AlistDownloadTask, url=mikan.torrent_url)
+    mock_alist_client.add_offline_download_task.return_value = [dl_task]
+
+    await DownloadManager.add_download_tasks([mikan, dmhy])
+    assert await real_db.is_resource_title_exist(mikan.resource_title)
+    # The duplicate is not counted as downloaded
+    assert not await real_db.is_resource_title_exist(dmhy.resource_title)
+    assert await real_db.is_resource_skipped(dmhy.resource_title)
+    assert [
+        r.resource_title
+        for r in await real_db.get_resources_by_episode("Test Anime", 1, 1)
+    ] == [mikan.resource_title]
+
+    # The download fails
+    dl_task.state = AlistTaskState.Failed
+    dl_task.error = "Download error"
+    dm.task_monitor.task_resource_map[dl_task] = mikan
+    await dm.task_monitor._process_failed_tasks([dl_task])
+    assert not await real_db.is_resource_title_exist(mikan.resource_title)
+    assert not await real_db.is_resource_skipped(dmhy.resource_title)
+
+    # The duplicate, seen again in the next poll, is downloaded
+    dmhy_task = MagicMock(spec=AlistDownloadTask, url=dmhy.torrent_url)
+    mock_alist_client.add_offline_download_task.return_value = [dmhy_task]
+    await DownloadManager.add_download_tasks([dmhy])
+    mock_alist_client.add_offline_download_task.assert_called_with(
+        os.path.join("/anime", "Test Anime", "Season 1"), [dmhy.torrent_url]
+    )
+    assert await real_db.is_resource_title_exist(dmhy.resource_title)
+    DownloadManager.destroy_instance()
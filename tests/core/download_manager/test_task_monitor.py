@@ -98,7 +98,7 @@ async def test_monitor_successful_download_and_transfer(
     # Third call: transfer task is succeeded
     calls = []
 
-    async def get_task_list_side_effect(task_type):
+    async def get_task_list_side_effect(task_type, **kwargs):
         calls.append(task_type)
 
         if len(calls) <= 2:  # First iteration
@@ -173,7 +173,7 @@ async def test_monitor_failed_download(setup_task_monitor, create_task):
     )
 
     # Mock get_task_list to return the failed download task
-    async def get_task_list_side_effect(task_type):
+    async def get_task_list_side_effect(task_type, **kwargs):
         if task_type == AlistTaskType.DOWNLOAD:
             dl_task.state = AlistTaskState.Failed
             dl_task.error = "Download error"
@@ -220,7 +220,7 @@ async def test_monitor_no_transfer_task_found(setup_task_monitor, create_task):
     )
 
     # Mock get_task_list to return the successful download task
-    async def get_task_list_side_effect(task_type):
+    async def get_task_list_side_effect(task_type, **kwargs):
         if task_type == AlistTaskType.DOWNLOAD:
             dl_task.state = AlistTaskState.Succeeded
             return [dl_task]
@@ -1,6 +1,8 @@
 import pytest
 
 from alist_mikananirss import RegexFilter  # 请替换为实际的模块名
+from alist_mikananirss.core.filter import SubscriptionFilter
+from alist_mikananirss.websites.models import FeedEntry, VideoQuality
 
 
 @pytest.fixture
@@ -70,3 +72,103 @@ def test_multiple_patterns(test_resources):
     rf = RegexFilter(["简体", "1080p", "非合集"])
     result = rf.filt_list(test_resources)
     assert result == [0, 1]
+
+
+def test_expression(test_resources):
+    rf = RegexFilter(["(简体 | 繁体) & 1080p", "!非合集"])
+    result = rf.filt_list(test_resources)
+    assert result == [2, 4, 8]
+
+    rf = RegexFilter(["繁体 and not 1080p"])
+    assert rf.filt_list(test_resources) == [6]
+
+
+def test_invalid_expression():
+    with pytest.raises(ValueError):
+        RegexFilter(["简体 &"])
+    with pytest.raises(ValueError):
+        RegexFilter(["(简体 | 繁体"])
+    with pytest.raises(KeyError):
+        RegexFilter(["简体 | UnexistPattern"])
+
+
+def test_pattern_name_like_expression():
+    rf = RegexFilter()
+    rf.update_regex({"Baha (WEB-DL) and not 合集": r"Baha.*WEB-DL"})
+    rf.add_pattern("Baha (WEB-DL) and not 合集")
+    assert rf.filt_list(
+        [
+            "[ANi] Undead Unluck - 14 [1080P][Baha][WEB-DL][CHT]",
+            "[ANi] Undead Unluck - 14 [1080P][Baha][CHT]",
+        ]
+    ) == [0]
+
+
+def test_filt_batch_same_as_single(test_resources):
+    rf = RegexFilter(["简体 | 繁体", "1080p", "非合集"])
+    single = [rf.filt_single(s) for s in test_resources]
+    assert rf.filt_batch(test_resources) == single
+
+
+def test_literal_prefilter():
+    rf = RegexFilter(["1080p", "非合集"])
+    rf.filt_list(["[ANi] test - 01 [720P]", "[ANi] test - 01 [1080P]"])
+    stats = {s["name"]: s for s in rf.stats()}
+    # The literal pattern is decided without running the regex
+    assert stats["1080p"]["prefilter_rejects"] == 1
+    assert stats["1080p"]["hits"] == 1
+    # Short circuit: the failed string is not evaluated by the next pattern
+    assert stats["非合集"]["evaluations"] + stats["1080p"]["evaluations"] == 3
+
+
+def test_reorder_by_selectivity():
+    rf = RegexFilter(["非合集", "1080p"])
+    strings = ["[ANi] test - 01 [720P]"] * 10 + ["[ANi] test - 01 [1080P]"]
+    assert rf.filt_list(strings) == [10]
+    # "1080p" rejects most strings, it's evaluated first after the reordering
+    assert str(rf) == "(1080p & 非合集)"
+
+
+def test_subscription_filter():
+    entries = [
+        FeedEntry("[ANi] 葬送的芙莉莲 - 01 [1080P][Baha][CHT]", "t1"),
+        FeedEntry("[LoliHouse] 葬送的芙莉莲 - 01 [WebRip 1080p][CHS]", "t2"),
+        FeedEntry("[LoliHouse] 葬送的芙莉莲 - 01 [WebRip 720p][CHS]", "t3"),
+        FeedEntry("[喵萌奶茶屋] 葬送的芙莉莲 [01][简日双语]", "t4"),
+        FeedEntry("葬送的芙莉莲 [01-12 合集][简日]", "t5", author="LoliHouse"),
+    ]
+    default_filter = RegexFilter(["非合集"])
+
+    sub_filter = SubscriptionFilter(
+        fansub_exclude=["ANi"], qualities=[VideoQuality.p1080]
+    )
+    result = sub_filter.filt_entries(entries, default_filter)
+    # Unknown quality is kept
+    assert [e.torrent_url for e in result] == ["t2", "t4"]
+
+    sub_filter = SubscriptionFilter(
+        regex_filter=RegexFilter(["简体 | 繁体"]), fansub_include=["LoliHouse"]
+    )
+    result = sub_filter.filt_entries(entries, default_filter)
+    # Subscription filter replaces the default one, author is used for fansub
+    assert [e.torrent_url for e in result] == ["t2", "t3", "t5"]
+
+
+def test_subscription_filter_fansub_match():
+    entries = [
+        FeedEntry("[ANi] 瓦尼塔斯的手记 - 01 [1080P][Baha][CHT]", "t1"),
+        FeedEntry("[LoliHouse] Vanitas no Carte - 01 [WebRip 1080p]", "t2"),
+        FeedEntry("【喵萌奶茶屋】Animation Kobo - 01 [1080p]", "t3"),
+        FeedEntry("[喵萌奶茶屋&LoliHouse] Mahou Shoujo - 01 [1080p]", "t4"),
+        FeedEntry("Vanitas no Carte - 02 [1080p]", "t5", author="ani"),
+    ]
+    default_filter = RegexFilter()
+
+    sub_filter = SubscriptionFilter(fansub_exclude=["ANi"])
+    result = sub_filter.filt_entries(entries, default_filter)
+    # "ANi" is a fansub, not a substring of "Vanitas" or "Animation"
+    assert [e.torrent_url for e in result] == ["t2", "t3", "t4"]
+
+    sub_filter = SubscriptionFilter(fansub_include=["lolihouse"])
+    result = sub_filter.filt_entries(entries, default_filter)
+    assert [e.torrent_url for e in result] == ["t2", "t4"]
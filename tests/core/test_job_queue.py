@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from alist_mikananirss.core.job_queue import JobQueue, JobState
+from alist_mikananirss.utils.tracing import span
+
+
+@pytest.mark.asyncio
+async def test_job_queue():
+    jobs = JobQueue(workers=1, maxsize=2)
+    release = asyncio.Event()
+
+    async def work(name):
+        with span("fetch"):
+            await release.wait()
+        with span("extract"):
+            await asyncio.sleep(0)
+        if name == "bad":
+            raise ValueError("Network error")
+        return name
+
+    first = jobs.submit("first", lambda: work("first"))
+    second = jobs.submit("bad", lambda: work("bad"))
+    with pytest.raises(asyncio.QueueFull):
+        jobs.submit("third", lambda: work("third"))
+    assert jobs.position(first) == 1
+    assert jobs.position(second) == 2
+
+    jobs.start()
+    await asyncio.sleep(0.01)
+    assert first.state == JobState.RUNNING
+    assert first.current_stages == ["fetch"]
+    assert jobs.position(first) is None
+    assert jobs.position(second) == 1
+    assert "fetch" in str(first)
+
+    release.set()
+    await jobs.join()
+    await jobs.stop()
+
+    assert first.state == JobState.DONE
+    assert first.result == "first"
+    assert list(first.stage_durations()) == ["fetch", "extract"]
+    assert second.state == JobState.FAILED
+    assert second.error == "Network error"
+    assert [job.job_id for job in jobs.jobs()] == [1, 2]
+    assert jobs.get(2) is second
+
+
+@pytest.mark.asyncio
+async def test_job_history():
+    jobs = JobQueue(workers=2, maxsize=10, history=3)
+    jobs.start()
+    for i in range(6):
+        jobs.submit(f"job {i}", lambda: asyncio.sleep(0))
+    await jobs.join()
+    await jobs.stop()
+    assert [job.job_id for job in jobs.jobs()] == [4, 5, 6]
+    assert jobs.get(1) is None
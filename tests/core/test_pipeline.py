@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from alist_mikananirss.core.pipeline import BatchStage, Pipeline, Stage
+
+
+@pytest.mark.asyncio
+async def test_pipeline_flow():
+    batches = []
+
+    async def double(x):
+        return [x, x]
+
+    async def square(x):
+        if x == 3:
+            raise ValueError("bad item")
+        return [x * x]
+
+    async def collect(items):
+        batches.append(items)
+        return []
+
+    pipeline = Pipeline(
+        [
+            Stage("double", double, workers=2),
+            Stage("square", square, workers=3),
+            BatchStage("collect", collect, batch_size=4),
+        ]
+    )
+    pipeline.start()
+    for i in range(1, 5):
+        await pipeline.put(i)
+    await pipeline.join()
+    await pipeline.stop()
+
+    results = [x for batch in batches for x in batch]
+    assert sorted(results) == [1, 1, 4, 4, 16, 16]
+    assert all(len(batch) <= 4 for batch in batches)
+
+    stats = {s["stage"]: s for s in pipeline.stats()}
+    assert stats["double"]["processed"] == 4
+    assert stats["square"]["processed"] == 8
+    assert stats["square"]["failed"] == 2
+    assert stats["collect"]["processed"] == 6
+    assert not pipeline.running
+
+
+@pytest.mark.asyncio
+async def test_pipeline_backpressure():
+    release = asyncio.Event()
+    produced = 0
+
+    async def produce(x):
+        nonlocal produced
+        produced += 1
+        return [x]
+
+    async def blocked(x):
+        await release.wait()
+        return []
+
+    pipeline = Pipeline(
+        [Stage("produce", produce, maxsize=1), Stage("blocked", blocked, maxsize=1)]
+    )
+    pipeline.start()
+    for i in range(4):
+        await pipeline.put(i)
+    await asyncio.sleep(0.01)
+    # 0 is being handled by the blocked stage, 1 waits in its queue, 2 waits
+    # in the producer to be queued and 3 waits in the first queue
+    assert produced == 3
+    assert pipeline.stages[0].queue.full()
+    assert pipeline.stages[1].queue.full()
+    put_task = asyncio.create_task(pipeline.put(4))
+    await asyncio.sleep(0.01)
+    assert not put_task.done()
+
+    release.set()
+    await put_task
+    await pipeline.join()
+    await pipeline.stop()
+    assert pipeline.stages[1].processed == 5
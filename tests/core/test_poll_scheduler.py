@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from alist_mikananirss.core.poll_scheduler import PollScheduler, parse_published_date
+
+HOUR = 3600
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+
+
+def test_parse_published_date():
+    expected = datetime(2024, 7, 17, 11, 9, tzinfo=timezone.utc).timestamp()
+    assert parse_published_date("2024-07-17T19:09:00") == expected
+    assert parse_published_date("Wed, 17 Jul 2024 19:09:00 +0800") == expected
+    assert parse_published_date("not a date") is None
+    assert parse_published_date(None) is None
+
+
+def iso(ts: float) -> str:
+    tz = timezone(timedelta(hours=8))
+    return datetime.fromtimestamp(ts, tz).replace(tzinfo=None).isoformat()
+
+
+def simulate(scheduler: PollScheduler, releases: list[float], start, end):
+    """Poll a feed until end, return the poll count and max detection delay"""
+    url = "https://mikanani.me/RSS/Bangumi?bangumiId=1"
+    now = start
+    polls = 0
+    delays = []
+    seen = set()
+    while now < end:
+        published = [r for r in releases if r <= now]
+        for r in published:
+            if r not in seen:
+                seen.add(r)
+                delays.append(now - r)
+        next_poll = scheduler.record_poll(url, [iso(r) for r in published], now=now)
+        polls += 1
+        now = next_poll
+    return polls, max(delays, default=0)
+
+
+def test_weekly_feed():
+    start = datetime(2024, 7, 1, tzinfo=timezone.utc).timestamp()
+    # Four released episodes, then ten weeks of airing
+    history = [start - (4 - i) * WEEK + 0.5 * HOUR for i in range(4)]
+    releases = history + [start + i * WEEK + 0.5 * HOUR for i in range(10)]
+    end = start + 10 * WEEK
+
+    fixed = PollScheduler(300, 300)
+    fixed_polls, fixed_delay = simulate(fixed, releases, start, end)
+    adaptive = PollScheduler(300, 6 * HOUR, window=HOUR)
+    adaptive_polls, adaptive_delay = simulate(adaptive, releases, start, end)
+
+    assert adaptive_polls < fixed_polls / 10
+    # No extra latency for the new episodes
+    assert adaptive_delay <= fixed_delay
+
+
+def test_backoff_and_reset():
+    url = "https://share.dmhy.org/topics/rss/rss.xml"
+    scheduler = PollScheduler(60, 1000)
+    now = 1_000_000
+    scheduler.record_poll(url, [], now=now)
+    intervals = []
+    for _ in range(6):
+        last = now
+        now = scheduler.record_poll(url, [], now=now)
+        intervals.append(now - last)
+    assert intervals == [240, 480, 960, 1000, 1000, 1000]
+    # New entries reset the interval
+    next_poll = scheduler.record_poll(url, [iso(now - 10)], now=now)
+    assert next_poll - now == 60
+
+
+def test_due_and_persistence(tmp_path):
+    state_path = str(tmp_path / "schedule.json")
+    urls = ["a", "b"]
+    scheduler = PollScheduler(60, 600, state_path=state_path)
+    assert scheduler.due(urls, now=0) == urls
+    scheduler.start_poll("a", now=0)
+    assert scheduler.due(urls, now=0) == ["b"]
+    scheduler.record_poll("a", [], now=0)
+    assert scheduler.seconds_until_next(urls, now=0) == 0
+    scheduler.save()
+
+    restored = PollScheduler(60, 600, state_path=state_path)
+    assert restored.next_poll_time("a") == scheduler.next_poll_time("a")
+    assert set(restored.schedule()) == {"a", "b"}
+
+
+def test_invalid_bounds():
+    with pytest.raises(ValueError):
+        PollScheduler(600, 60)
+
+
+@pytest.mark.asyncio
+async def test_save_changes(tmp_path):
+    state_path = tmp_path / "schedule.json"
+    scheduler = PollScheduler(60, 600, state_path=str(state_path))
+    scheduler.start_poll("a", now=0)
+    # Nothing polled, nothing written
+    await scheduler.save_changes()
+    assert not state_path.exists()
+
+    scheduler.record_poll("a", [], now=0)
+    await scheduler.save_changes()
+    assert state_path.exists()
+    assert not scheduler.dirty
+
+    # Saved once per change
+    state_path.unlink()
+    await scheduler.save_changes()
+    assert not state_path.exists()
@@ -0,0 +1,140 @@
+from unittest.mock import MagicMock
+
+import os
+import uuid
+
+import pytest
+import pytest_asyncio
+
+from alist_mikananirss import SubscribeDatabase
+from alist_mikananirss.common.database import db_dirpath
+from alist_mikananirss.core.release_selector import ReleaseSelector
+from alist_mikananirss.websites.models import ResourceInfo, VideoQuality
+
+
+def release(fansub, quality=VideoQuality.p1080, languages=("简", "日"), episode=1):
+    return ResourceInfo(
+        resource_title=f"[{fansub}] Test Anime - {episode:02d} [{quality}]",
+        torrent_url=f"https://example.com/{fansub}-{episode}-{quality}.torrent",
+        anime_name="Test Anime",
+        season=1,
+        episode=episode,
+        fansub=fansub,
+        quality=quality,
+        languages=list(languages),
+    )
+
+
+@pytest.fixture
+def mock_db():
+    db = MagicMock(spec=SubscribeDatabase)
+    db.get_resources_by_episode.return_value = []
+    db.get_pending_releases.return_value = []
+    return db
+
+
+@pytest.fixture
+def selector(mock_db):
+    return ReleaseSelector(
+        mock_db, window=600, fansubs=["喵萌奶茶屋", "ANi"], on_reject=MagicMock()
+    )
+
+
+def test_score(selector):
+    assert selector.score(release("喵萌奶茶屋")) > selector.score(release("ANi"))
+    assert selector.score(release("ANi")) > selector.score(release("Other"))
+    assert selector.score(release("ANi", VideoQuality.p2160)) > selector.score(
+        release("ANi", VideoQuality.p1080)
+    )
+    assert selector.score(release("ANi", languages=["简", "日"])) > selector.score(
+        release("ANi", languages=["繁"])
+    )
+
+
+@pytest.mark.asyncio
+async def test_select_best_in_window(selector):
+    ani = release("ANi")
+    other = release("Other")
+    best = release("喵萌奶茶屋")
+    next_episode = release("Other", episode=2)
+
+    assert await selector.add(ani, now=0) == []
+    assert await selector.add(other, now=100) == []
+    assert await selector.add(best, now=200) == []
+    assert await selector.add(next_episode, now=300) == []
+
+    assert await selector.pop_ready(now=599) == []
+    assert selector.seconds_until_ready(now=599) == 1
+    assert await selector.pop_ready(now=600) == [best]
+    assert await selector.pop_ready(now=900) == [next_episode]
+    assert selector.seconds_until_ready() is None
+
+    rejected = [c.args[0] for c in selector.on_reject.call_args_list]
+    assert rejected == [other, ani]
+    assert selector.is_rejected(ani.resource_title)
+    skipped = [c.args for c in selector.db.insert_skipped_resource.call_args_list]
+    assert skipped == [(other, "rejected"), (ani, "rejected")]
+
+
+@pytest.mark.asyncio
+async def test_upgrade_downloaded(selector, mock_db):
+    mock_db.get_resources_by_episode.return_value = [release("ANi")]
+
+    worse = release("Other")
+    assert await selector.add(worse) == []
+    assert selector.is_rejected(worse.resource_title)
+
+    better = release("喵萌奶茶屋")
+    assert await selector.add(better) == [better]
+    mock_db.get_resources_by_episode.assert_called_with("Test Anime", 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_pass_through(mock_db):
+    selector = ReleaseSelector(mock_db, window=0)
+    assert await selector.add(release("ANi")) == [release("ANi")]
+    unknown = ResourceInfo("Unknown", "https://example.com/unknown.torrent")
+    assert await selector.add(unknown) == [unknown]
+
+
+@pytest_asyncio.fixture
+async def db_name():
+    name = f"test_db_{uuid.uuid4()}.db"
+    yield name
+    os.remove(os.path.join(db_dirpath, name))
+
+
+@pytest.mark.asyncio
+async def test_restart_keeps_selection(db_name):
+    ani = release("ANi")
+    other = release("Other")
+    db = await SubscribeDatabase.create(db_name)
+    try:
+        selector = ReleaseSelector(db, window=600, fansubs=["ANi"])
+        assert await selector.add(ani, now=0) == []
+        assert await selector.add(other, now=100) == []
+    finally:
+        await db.close()
+
+    db = await SubscribeDatabase.create(db_name)
+    try:
+        selector = ReleaseSelector(db, window=600, fansubs=["ANi"])
+        assert await selector.load() == [ani]
+        # The rejection is remembered, the held release keeps its window
+        assert await db.is_resource_skipped(other.resource_title)
+        assert await selector.pop_ready(now=599) == []
+        assert await selector.pop_ready(now=600) == [ani]
+        assert await db.get_pending_releases() == []
+    finally:
+        await db.close()
+
+
+@pytest.mark.asyncio
+async def test_no_persist(mock_db):
+    selector = ReleaseSelector(mock_db, window=600, persist=False)
+    await selector.add(release("ANi"), now=0)
+    await selector.add(release("Other"), now=0)
+    await selector.pop_ready(now=600)
+    mock_db.save_pending_release.assert_not_called()
+    mock_db.insert_skipped_resource.assert_not_called()
+    mock_db.delete_pending_release.assert_not_called()
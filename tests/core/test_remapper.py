@@ -2,7 +2,7 @@ from copy import deepcopy
 
 import pytest
 
-from alist_mikananirss import RemapFrom, Remapper, RemapTo
+from alist_mikananirss import RemapFrom, Remapper, RemapperManager, RemapTo
 from alist_mikananirss.websites.models import LanguageType, ResourceInfo, VideoQuality
 
 
@@ -51,3 +51,80 @@ def test_remap(test_data):
     assert test_data_copy.season == 2
     assert test_data_copy.episode == 1
     assert test_data_copy.fansub == "ANi"
+
+
+@pytest.fixture(autouse=True)
+def reset_remapper_manager():
+    RemapperManager.destroy_instance()
+    yield
+    RemapperManager.destroy_instance()
+
+
+def test_manager_first_match_wins(test_data):
+    RemapperManager.add_remapper(RemapFrom(fansub="ANi"), RemapTo(anime_name="first"))
+    RemapperManager.add_remapper(
+        RemapFrom(anime_name="死神 千年血战篇-相克谭-", season=1, fansub="ANi"),
+        RemapTo(anime_name="second"),
+    )
+    assert RemapperManager.match(test_data).to_.anime_name == "first"
+
+    RemapperManager.clear_remappers()
+    RemapperManager.add_remapper(
+        RemapFrom(anime_name="死神 千年血战篇-相克谭-", season=2),
+        RemapTo(anime_name="not_match"),
+    )
+    exact = RemapperManager.add_remapper(
+        RemapFrom(anime_name="死神 千年血战篇-相克谭-", season=1, fansub="ANi"),
+        RemapTo(anime_name="exact"),
+    )
+    RemapperManager.add_remapper(RemapFrom(), RemapTo(anime_name="wildcard"))
+    assert RemapperManager.match(test_data) is exact
+
+    RemapperManager.remove_remapper(exact)
+    assert RemapperManager.match(test_data).to_.anime_name == "wildcard"
+
+
+def test_regex_match(test_data):
+    remapper = RemapperManager.add_remapper(
+        RemapFrom(anime_name="死神.*", regex=True), RemapTo(anime_name="死神")
+    )
+    RemapperManager.add_remapper(RemapFrom(fansub="ANi"), RemapTo(anime_name="later"))
+    assert RemapperManager.match(test_data) is remapper
+
+    not_match = Remapper(RemapFrom(anime_name="千年血战篇", regex=True), RemapTo())
+    assert not not_match.match(test_data)
+
+
+def test_reload_cfg(tmp_path, test_data):
+    cfg_path = tmp_path / "remap.yaml"
+    cfg_path.write_text(
+        """
+remap:
+  - from:
+      anime_name: 死神 千年血战篇-相克谭-
+    to:
+      anime_name: 死神
+      season: 2
+""",
+        encoding="utf-8",
+    )
+    RemapperManager.load_remappers_from_cfg(str(cfg_path))
+    assert RemapperManager.match(test_data).to_.anime_name == "死神"
+
+    cfg_path.write_text(
+        """
+remap:
+  - from:
+      fansub: ANi
+    to:
+      anime_name: BLEACH
+""",
+        encoding="utf-8",
+    )
+    assert RemapperManager.reload_cfg(str(cfg_path))
+    assert RemapperManager.match(test_data).to_.anime_name == "BLEACH"
+
+    # Failed parse keeps the previous rules
+    cfg_path.write_text("remap:\n  - from: [", encoding="utf-8")
+    assert not RemapperManager.reload_cfg(str(cfg_path))
+    assert RemapperManager.match(test_data).to_.anime_name == "BLEACH"
@@ -1,3 +1,4 @@
+import asyncio
 from unittest.mock import AsyncMock, patch
 
 import pytest
@@ -56,7 +57,7 @@ async def test_build_new_name(alist_mock, resource_info):
 
     old_filepath = "/path/to/old_file.mp4"
 
-    alist_mock.list_dir.return_value = ["file1", "file2", "file3"]
+    alist_mock.list_dir_all.return_value = ["file1", "file2", "file3"]
 
     new_filename = await AnimeRenamer()._build_new_name(old_filepath, resource_info)
 
@@ -71,7 +72,7 @@ async def test_build_new_name_ova(alist_mock, resource_info):
     old_filepath = "/path/to/old_file.mp4"
     resource_info.season = 0
 
-    alist_mock.list_dir.return_value = ["file1", "file2", "file3"]
+    alist_mock.list_dir_all.return_value = ["file1", "file2", "file3"]
 
     new_filename = await AnimeRenamer()._build_new_name(old_filepath, resource_info)
 
@@ -134,3 +135,105 @@ async def test_rename_max_retry_exceeded(alist_mock, resource_info):
 
     assert alist_mock.rename.call_count == 3
     mock_logger_error.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_batch_rename(alist_mock, resource_info):
+    AnimeRenamer.initialize(alist_mock, "{name} S{season:02d}E{episode:02d}", 0.01)
+    other_episode = ResourceInfo(
+        resource_title="title2",
+        torrent_url="https://test2.torrent",
+        anime_name="Test Anime",
+        season=1,
+        episode=6,
+    )
+
+    await asyncio.gather(
+        AnimeRenamer.rename("/anime/Season 1/a.mp4", resource_info),
+        AnimeRenamer.rename("/anime/Season 1/b.mkv", other_episode),
+        AnimeRenamer.rename("/anime/Season 2/c.mp4", resource_info),
+    )
+
+    alist_mock.batch_rename.assert_called_once_with(
+        "/anime/Season 1",
+        [("a.mp4", "Test Anime S01E05.mp4"), ("b.mkv", "Test Anime S01E06.mkv")],
+    )
+    # A single file is renamed directly
+    alist_mock.rename.assert_called_once_with(
+        "/anime/Season 2/c.mp4", "Test Anime S01E05.mp4"
+    )
+
+
+@pytest.mark.asyncio
+async def test_batch_rename_fallback(alist_mock, resource_info):
+    AnimeRenamer.initialize(alist_mock, "{name} S{season:02d}E{episode:02d}", 0.01)
+    alist_mock.batch_rename.side_effect = Exception("Not supported")
+    alist_mock.list_dir_all.return_value = ["a.mp4", "b.mp4"]
+
+    await asyncio.gather(
+        AnimeRenamer.rename("/anime/a.mp4", resource_info),
+        AnimeRenamer.rename("/anime/b.mp4", resource_info),
+    )
+
+    assert alist_mock.rename.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_rename_fallback_partly_renamed(alist_mock, resource_info):
+    AnimeRenamer.initialize(alist_mock, "{name} S{season:02d}E{episode:02d}", 0.01)
+    alist_mock.batch_rename.side_effect = Exception("Timeout")
+    # a.mp4 was renamed before the error
+    alist_mock.list_dir_all.return_value = ["Test Anime S01E05.mp4", "b.mp4"]
+    other_episode = ResourceInfo(
+        resource_title="title2",
+        torrent_url="https://test2.torrent",
+        anime_name="Test Anime",
+        season=1,
+        episode=6,
+    )
+
+    await asyncio.gather(
+        AnimeRenamer.rename("/anime/a.mp4", resource_info),
+        AnimeRenamer.rename("/anime/b.mp4", other_episode),
+    )
+
+    alist_mock.invalidate_dir_cache.assert_called_with("/anime")
+    alist_mock.rename.assert_called_once_with("/anime/b.mp4", "Test Anime S01E06.mp4")
+
+
+@pytest.mark.asyncio
+# Cancelled before the flush task started, and while it waits
+@pytest.mark.parametrize("delay", [0, 0.01])
+async def test_batch_rename_cancelled(alist_mock, resource_info, delay):
+    AnimeRenamer.initialize(alist_mock, "{name} S{season:02d}E{episode:02d}", 10)
+    renamer = AnimeRenamer()
+
+    rename = asyncio.create_task(AnimeRenamer.rename("/anime/a.mp4", resource_info))
+    await asyncio.sleep(0)
+    await asyncio.sleep(delay)
+    renamer._flush_tasks["/anime"].cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(rename, 1)
+    assert not renamer._pending
+    assert not renamer._flush_tasks
+    alist_mock.batch_rename.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_batch_rename_specials(alist_mock, resource_info):
+    AnimeRenamer.initialize(alist_mock, "{name} S{season:02d}E{episode:02d}", 0.01)
+    resource_info.season = 0
+    alist_mock.list_dir_all.return_value = ["S00E01.mp4", "a.mp4", "b.mp4"]
+
+    await asyncio.gather(
+        AnimeRenamer.rename("/anime/Season 0/a.mp4", resource_info),
+        AnimeRenamer.rename("/anime/Season 0/b.mp4", resource_info),
+    )
+
+    # Each special of the batch gets its own number
+    alist_mock.batch_rename.assert_called_once_with(
+        "/anime/Season 0",
+        [("a.mp4", "Test Anime S00E02.mp4"), ("b.mp4", "Test Anime S00E03.mp4")],
+    )
+    alist_mock.invalidate_dir_cache.assert_called_once_with("/anime/Season 0")
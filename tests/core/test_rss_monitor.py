@@ -1,9 +1,20 @@
 import asyncio
+import gc
+import weakref
 from unittest.mock import AsyncMock, MagicMock, call, patch
 
 import pytest
 
-from alist_mikananirss import RegexFilter, RssMonitor, SubscribeDatabase
+from alist_mikananirss import (
+    RegexFilter,
+    ReleaseSelector,
+    RssMonitor,
+    SubscribeDatabase,
+    SubscriptionFilter,
+)
+from alist_mikananirss.common.config.basic import SubscriptionConfig
+from alist_mikananirss.utils.metrics import metrics
+from alist_mikananirss.utils.tracing import trace_log
 from alist_mikananirss.websites.models import FeedEntry, ResourceInfo
 
 
@@ -19,7 +30,10 @@ def mock_filter():
 
 @pytest.fixture
 def mock_db():
-    return MagicMock(spec=SubscribeDatabase)
+    db = MagicMock(spec=SubscribeDatabase)
+    db.get_subscriptions.return_value = []
+    db.is_resource_skipped.return_value = False
+    return db
 
 
 @pytest.mark.asyncio
@@ -58,7 +72,7 @@ async def test_get_new_resources(mock_website, mock_filter, mock_db):
         FeedEntry("Resource 2", "https://example.com/torrent2"),
     ]
     mock_website.get_feed_entries.return_value = feed_entries
-    mock_filter.filt_single.side_effect = [True, False]
+    mock_filter.filt_list.return_value = [0]
     mock_db.is_resource_title_exist.return_value = False
 
     resource_info = ResourceInfo("Resource 1", "https://example.com/torrent1")
@@ -72,7 +86,7 @@ async def test_get_new_resources(mock_website, mock_filter, mock_db):
     assert len(new_resources) == 1
     assert new_resources[0] == resource_info
     mock_website.get_feed_entries.assert_called_once()
-    mock_filter.filt_single.assert_has_calls([call("Resource 1"), call("Resource 2")])
+    mock_filter.filt_list.assert_called_once_with(["Resource 1", "Resource 2"])
     mock_db.is_resource_title_exist.assert_called_once_with("Resource 1")
     mock_website.extract_resource_info.assert_called_once_with(feed_entries[0], False)
 
@@ -84,28 +98,115 @@ async def test_run(mock_website, mock_filter, mock_db):
             "alist_mikananirss.websites.WebsiteFactory.get_website_parser",
             return_value=mock_website,
         ),
-        patch("asyncio.sleep", new_callable=AsyncMock) as mock_sleep,
         patch(
             "alist_mikananirss.core.download_manager.DownloadManager.add_download_tasks",
             new_callable=AsyncMock,
         ) as mock_add_tasks,
     ):
+        mock_website.rss_url = "https://mikanani.me/rss"
+        mock_website.get_feed_entries.return_value = [
+            FeedEntry("New Resource", "https://example.com/new"),
+            FeedEntry("Old Resource", "https://example.com/old"),
+        ]
+        mock_filter.filt_list.return_value = [0, 1]
+        mock_db.is_resource_title_exist.side_effect = lambda title: (
+            title == "Old Resource"
+        )
+        resource = ResourceInfo("New Resource", "https://example.com/new")
+        mock_website.extract_resource_info.return_value = resource
 
-        monitor = RssMonitor("https://mikanani.me/rss", mock_filter, mock_db)
+        monitor = RssMonitor(["https://mikanani.me/rss"], mock_filter, mock_db)
         monitor.db = mock_db
-        monitor.get_new_resources = AsyncMock(
-            return_value=[ResourceInfo("New Resource", "https://example.com/new")]
-        )
 
-        # 让run方法在第二次循环后退出
-        mock_sleep.side_effect = [None, asyncio.CancelledError]
+        real_sleep = asyncio.sleep
+        clock = 1000.0
+        polls = 0
+
+        async def fake_sleep(delay):
+            nonlocal polls, clock
+            assert delay == 300
+            polls += 1
+            # let the poll flow through the pipeline
+            await monitor.pipeline.join()
+            if polls == 2:
+                raise asyncio.CancelledError
+            clock += delay
+            await real_sleep(0)
+
+        with (
+            patch("asyncio.sleep", side_effect=fake_sleep),
+            patch(
+                "alist_mikananirss.core.poll_scheduler.time.time",
+                side_effect=lambda: clock,
+            ),
+        ):
+            with pytest.raises(asyncio.CancelledError):
+                await monitor.run()
+
+        assert mock_website.get_feed_entries.call_count == 2
+        assert mock_add_tasks.call_count == 2
+        mock_add_tasks.assert_called_with([resource])
+        assert not monitor.pipeline.running
 
-        with pytest.raises(asyncio.CancelledError):
-            await monitor.run()
 
-        assert monitor.get_new_resources.call_count == 2
-        assert mock_add_tasks.call_count == 2
-        mock_sleep.assert_called_with(300)
+@pytest.mark.asyncio
+async def test_pipeline_dedupe_in_flight(mock_website, mock_filter, mock_db):
+    with (
+        patch(
+            "alist_mikananirss.websites.WebsiteFactory.get_website_parser",
+            return_value=mock_website,
+        ),
+        patch(
+            "alist_mikananirss.core.download_manager.DownloadManager.add_download_tasks",
+            new_callable=AsyncMock,
+        ) as mock_add_tasks,
+    ):
+        mock_website.rss_url = "https://mikanani.me/rss"
+        mock_website.get_feed_entries.return_value = [
+            FeedEntry("Resource 1", "https://example.com/1"),
+            FeedEntry("Resource 2", "https://example.com/2"),
+        ]
+        mock_filter.filt_list.return_value = [0, 1]
+        mock_db.is_resource_title_exist.return_value = False
+
+        async def slow_extract(entry, use_extractor):
+            await asyncio.sleep(0.01)
+            if entry.resource_title == "Resource 2":
+                raise Exception("Network error")
+            return ResourceInfo(entry.resource_title, entry.torrent_url)
+
+        mock_website.extract_resource_info.side_effect = slow_extract
+
+        monitor = RssMonitor(["https://mikanani.me/rss"], mock_filter, mock_db)
+        monitor.db = mock_db
+        monitor.set_pipeline_options(extract_workers=2, submit_batch_size=5)
+        # The second poll comes while the first one is still extracting
+        await monitor.poll()
+        await monitor.poll()
+        await monitor.pipeline.join()
+        await monitor.pipeline.stop()
+
+        submitted = [
+            r.resource_title for c in mock_add_tasks.call_args_list for r in c.args[0]
+        ]
+        assert submitted == ["Resource 1"]
+        assert mock_website.extract_resource_info.call_count == 2
+        # failed and submitted titles are released
+        assert not monitor._inflight_titles
+        stats = {s["stage"]: s for s in monitor.pipeline.stats()}
+        assert stats["fetch"]["processed"] == 2
+        assert stats["extract"]["processed"] == 2
+
+
+def test_set_pipeline_options(mock_db):
+    with patch("alist_mikananirss.websites.WebsiteFactory.get_website_parser"):
+        monitor = RssMonitor(
+            ["https://example.com/rss"], MagicMock(spec=RegexFilter), mock_db
+        )
+    monitor.set_pipeline_options(extract_workers=3)
+    assert monitor.pipeline_options["extract_workers"] == 3
+    with pytest.raises(ValueError):
+        monitor.set_pipeline_options(unknown=1)
 
 
 @pytest.mark.asyncio
@@ -115,7 +216,7 @@ async def test_get_new_resources_with_exceptions(mock_website, mock_filter, mock
         FeedEntry("Resource 2", "https://mikanani.me/rss/torrent2"),
     ]
     mock_website.get_feed_entries.return_value = feed_entries
-    mock_filter.filt_single.side_effect = [True, True]
+    mock_filter.filt_list.return_value = [0, 1]
     mock_db.is_resource_title_exist.return_value = False
     # extract_resource_info方法报错
     mock_website.extract_resource_info.side_effect = [
@@ -142,3 +243,284 @@ async def test_get_new_resources_with_non_feed(mock_filter, mock_db):
     new_resources = await monitor.get_new_resources([], mock_filter)
 
     assert len(new_resources) == 0
+
+
+@pytest.mark.asyncio
+async def test_get_new_resources_with_subscription_filter(
+    mock_website, mock_filter, mock_db
+):
+    feed_entries = [
+        FeedEntry("[ANi] Resource - 01 [1080P]", "https://example.com/torrent1"),
+        FeedEntry("[LoliHouse] Resource - 01 [1080P]", "https://example.com/torrent2"),
+    ]
+    mock_website.rss_url = "https://share.dmhy.org/rss"
+    mock_website.get_feed_entries.return_value = feed_entries
+    mock_filter.filt_list.return_value = [0, 1]
+    mock_db.is_resource_title_exist.return_value = False
+    mock_website.extract_resource_info.return_value = ResourceInfo(
+        feed_entries[1].resource_title, feed_entries[1].torrent_url
+    )
+
+    monitor = RssMonitor(
+        ["https://share.dmhy.org/rss"],
+        mock_filter,
+        mock_db,
+        subscription_filters={
+            "https://share.dmhy.org/rss": SubscriptionFilter(fansub_exclude=["ANi"])
+        },
+    )
+    new_resources = await monitor.get_new_resources([mock_website], mock_filter)
+
+    assert len(new_resources) == 1
+    # Excluded entry is dropped before extracting resource info
+    mock_website.extract_resource_info.assert_called_once_with(feed_entries[1], False)
+
+
+@pytest.mark.asyncio
+async def test_pipeline_release_selection(mock_website, mock_filter, mock_db):
+    with (
+        patch(
+            "alist_mikananirss.websites.WebsiteFactory.get_website_parser",
+            return_value=mock_website,
+        ),
+        patch(
+            "alist_mikananirss.core.download_manager.DownloadManager.add_download_tasks",
+            new_callable=AsyncMock,
+        ) as mock_add_tasks,
+    ):
+        mock_website.rss_url = "https://mikanani.me/rss"
+        mock_website.get_feed_entries.return_value = [
+            FeedEntry("[ANi] Test - 01", "https://example.com/1"),
+            FeedEntry("[Other] Test - 01", "https://example.com/2"),
+        ]
+        mock_filter.filt_list.return_value = [0, 1]
+        mock_db.is_resource_title_exist.return_value = False
+        mock_db.get_resources_by_episode.return_value = []
+
+        async def extract(entry, use_extractor):
+            fansub = entry.resource_title[1:].split("]")[0]
+            return ResourceInfo(
+                entry.resource_title,
+                entry.torrent_url,
+                anime_name="Test",
+                season=1,
+                episode=1,
+                fansub=fansub,
+            )
+
+        mock_website.extract_resource_info.side_effect = extract
+
+        monitor = RssMonitor(["https://mikanani.me/rss"], mock_filter, mock_db)
+        monitor.db = mock_db
+        monitor.set_release_selector(
+            ReleaseSelector(mock_db, window=0.05, fansubs=["ANi"])
+        )
+        await monitor.poll()
+        await monitor.pipeline.join()
+        mock_add_tasks.assert_not_called()
+
+        await asyncio.sleep(0.1)
+        await monitor.pipeline.join()
+        await monitor.stop_pipeline()
+
+        mock_add_tasks.assert_called_once()
+        assert [r.fansub for r in mock_add_tasks.call_args.args[0]] == ["ANi"]
+        assert not monitor._inflight_titles
+
+
+@pytest.mark.asyncio
+async def test_run_once(mock_website, mock_filter, mock_db):
+    with (
+        patch(
+            "alist_mikananirss.websites.WebsiteFactory.get_website_parser",
+            return_value=mock_website,
+        ),
+        patch(
+            "alist_mikananirss.core.download_manager.DownloadManager.add_download_tasks",
+            new_callable=AsyncMock,
+        ) as mock_add_tasks,
+    ):
+        mock_website.rss_url = "https://mikanani.me/rss"
+        mock_website.get_feed_entries.return_value = [
+            FeedEntry(f"[ANi] Test - {i:02d}", f"https://example.com/{i}")
+            for i in range(1, 6)
+        ] + [FeedEntry("[Other] Test - 01", "https://example.com/other")]
+        mock_filter.filt_list.return_value = list(range(6))
+        mock_db.is_resource_title_exist.return_value = False
+        mock_db.get_resources_by_episode.return_value = []
+
+        async def extract(entry, use_extractor):
+            fansub = entry.resource_title[1:].split("]")[0]
+            episode = int(entry.resource_title.split(" - ")[1])
+            return ResourceInfo(
+                entry.resource_title,
+                entry.torrent_url,
+                anime_name="Test",
+                season=1,
+                episode=episode,
+                fansub=fansub,
+            )
+
+        mock_website.extract_resource_info.side_effect = extract
+
+        monitor = RssMonitor(["https://mikanani.me/rss"], mock_filter, mock_db)
+        monitor.set_pipeline_options(extract_workers=2, submit_batch_size=2)
+        # The selection window is not waited for
+        monitor.set_release_selector(
+            ReleaseSelector(mock_db, window=3600, fansubs=["ANi"])
+        )
+
+        resources = await monitor.run_once(dry_run=True)
+        assert sorted(r.episode for r in resources) == [1, 2, 3, 4, 5]
+        assert all(r.fansub == "ANi" for r in resources)
+        mock_add_tasks.assert_not_called()
+        assert not monitor.pipeline.running
+        assert not monitor._inflight_titles
+
+        monitor.selector.pending.clear()
+        monitor.selector._rejected = set()
+        resources = await monitor.run_once()
+        submitted = [r for c in mock_add_tasks.call_args_list for r in c.args[0]]
+        assert sorted(submitted, key=lambda r: r.episode) == sorted(
+            resources, key=lambda r: r.episode
+        )
+        assert len(submitted) == 5
+        # Batched submissions
+        assert all(len(c.args[0]) <= 2 for c in mock_add_tasks.call_args_list)
+
+
+@pytest.mark.asyncio
+async def test_runtime_subscriptions(mock_website, mock_filter, mock_db):
+    url = "https://mikanani.me/RSS/Bangumi?bangumiId=3519"
+    with (
+        patch(
+            "alist_mikananirss.websites.WebsiteFactory.get_website_parser",
+            side_effect=lambda u: MagicMock(rss_url=u) if u != url else mock_website,
+        ),
+        patch(
+            "alist_mikananirss.core.download_manager.DownloadManager.add_download_tasks",
+            new_callable=AsyncMock,
+        ) as mock_add_tasks,
+    ):
+        mock_website.rss_url = url
+        mock_website.get_feed_entries.return_value = [
+            FeedEntry("[ANi] Test - 01", "https://example.com/1"),
+            FeedEntry("[Other] Test - 01", "https://example.com/2"),
+        ]
+        mock_filter.filt_list.side_effect = lambda titles: list(range(len(titles)))
+        mock_db.is_resource_title_exist.return_value = False
+        mock_db.insert_subscription.return_value = True
+        mock_website.extract_resource_info.side_effect = (
+            lambda entry, use_extractor: ResourceInfo(
+                entry.resource_title, entry.torrent_url
+            )
+        )
+
+        monitor = RssMonitor(["https://mikanani.me/rss"], mock_filter, mock_db)
+        monitor.start_pipeline()
+        pipeline = monitor.pipeline
+        await monitor.add_subscription(
+            SubscriptionConfig(url=url, fansub_include=["ANi"])
+        )
+        # Polled at once by the running pipeline, with the rules of the subscription
+        await pipeline.join()
+        submitted = [r for c in mock_add_tasks.call_args_list for r in c.args[0]]
+        assert [r.resource_title for r in submitted] == ["[ANi] Test - 01"]
+        mock_db.insert_subscription.assert_called_once_with(
+            url, {"fansub_include": ["ANi"]}
+        )
+        assert monitor.list_subscriptions() == [
+            ("https://mikanani.me/rss", False),
+            (url, True),
+        ]
+        with pytest.raises(ValueError):
+            await monitor.add_subscription(SubscriptionConfig(url=url))
+        with pytest.raises(ValueError):
+            await monitor.remove_subscription("https://mikanani.me/rss")
+
+        await monitor.remove_subscription(url)
+        mock_db.delete_subscription.assert_called_once_with(url)
+        assert [w.rss_url for w in monitor.websites] == ["https://mikanani.me/rss"]
+        # The pipeline is kept
+        assert monitor.pipeline is pipeline and pipeline.running
+
+        # Changed by another process
+        mock_db.get_subscriptions.return_value = [(url, {"qualities": ["1080p"]})]
+        await monitor.load_subscriptions()
+        assert (url, True) in monitor.list_subscriptions()
+        assert monitor.subscription_filters[url].qualities == ["1080p"]
+        mock_db.get_subscriptions.return_value = []
+        await monitor.load_subscriptions()
+        assert url not in monitor.subscribe_urls
+        await monitor.stop_pipeline()
+
+
+@pytest.mark.asyncio
+async def test_fetch_entries_traces(mock_website, tmp_path):
+    mock_website.get_feed_entries.return_value = [
+        FeedEntry("[ANi] Test - 01", "https://example.com/1")
+    ]
+    (entry,) = await RssMonitor._fetch_entries(mock_website)
+    # No trace when tracing is disabled
+    assert entry.trace is None
+
+    trace_log.configure(str(tmp_path / "traces.jsonl"))
+    try:
+        (entry,) = await RssMonitor._fetch_entries(mock_website)
+    finally:
+        trace_log.configure(None)
+    assert [s.name for s in entry.trace.spans] == ["fetch"]
+
+
+@pytest.mark.asyncio
+async def test_add_subscription_during_load(mock_website, mock_filter, mock_db):
+    url = "https://mikanani.me/RSS/Bangumi?bangumiId=3519"
+    monitor = RssMonitor([], mock_filter, mock_db)
+
+    async def insert_subscription(url, rules):
+        # The run loop syncs the subscriptions while the row is being saved
+        mock_db.get_subscriptions.return_value = [(url, rules)]
+        await monitor.load_subscriptions()
+        return True
+
+    mock_db.insert_subscription.side_effect = insert_subscription
+    with patch(
+        "alist_mikananirss.websites.WebsiteFactory.get_website_parser",
+        side_effect=lambda u: MagicMock(rss_url=u),
+    ):
+        await monitor.add_subscription(SubscriptionConfig(url=url))
+        assert monitor.subscribe_urls == [url]
+        assert [w.rss_url for w in monitor.websites] == [url]
+
+        # Not saved, not added
+        mock_db.insert_subscription.side_effect = None
+        mock_db.insert_subscription.return_value = False
+        other = "https://mikanani.me/RSS/Bangumi?bangumiId=1"
+        with pytest.raises(ValueError):
+            await monitor.add_subscription(SubscriptionConfig(url=other))
+        assert monitor.subscribe_urls == [url]
+
+    await monitor.remove_subscription(url)
+    assert monitor.websites == []
+
+
+@pytest.mark.asyncio
+async def test_metrics_follow_running_monitor(mock_filter, mock_db):
+    inflight = metrics.get("rss_inflight_resources")
+    monitor = RssMonitor([], mock_filter, mock_db)
+    monitor.start_pipeline()
+    monitor._inflight_titles.add("[ANi] Test - 01")
+    # Built to manage the subscriptions, never started
+    RssMonitor([], mock_filter, mock_db)
+    assert inflight.get() == 1
+    assert metrics.get("pipeline_processed").get(stage="fetch") == 0
+    await monitor.stop_pipeline()
+    # Let the loop drop the finished worker tasks
+    await asyncio.sleep(0)
+
+    # Not kept alive by the metrics
+    ref = weakref.ref(monitor)
+    del monitor
+    gc.collect()
+    assert ref() is None
+    assert inflight.get() == 0
@@ -0,0 +1,96 @@
+from unittest.mock import AsyncMock
+
+import pytest
+from pydantic import BaseModel
+
+from alist_mikananirss.extractor.llm import (
+    LLMProvider,
+    LLMProviderType,
+    create_llm_provider,
+)
+from alist_mikananirss.extractor.llm.replay import RecordingProvider, ReplayProvider
+
+MESSAGES = [
+    {"role": "system", "content": "prompt"},
+    {"role": "user", "content": "[ANi] 葬送的芙莉莲 - 01 [1080P]"},
+]
+
+
+class TitleResult(BaseModel):
+    anime_name: str
+    episode: int
+
+
+@pytest.fixture
+def real_provider():
+    provider = AsyncMock(spec=LLMProvider)
+    provider.parse_as_json.return_value = {"anime_name": "葬送的芙莉莲", "episode": 1}
+    provider.parse_with_schema.return_value = TitleResult(
+        anime_name="葬送的芙莉莲", episode=1
+    )
+    return provider
+
+
+@pytest.mark.asyncio
+async def test_record_and_replay(tmp_path, real_provider):
+    record_path = str(tmp_path / "records.jsonl")
+    recorder = RecordingProvider(real_provider, record_path)
+    await recorder.parse_as_json(MESSAGES)
+    await recorder.parse_with_schema(MESSAGES, TitleResult)
+    # Recorded once only
+    await recorder.parse_as_json(MESSAGES)
+    with open(record_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+
+    replay = ReplayProvider(record_path)
+    assert await replay.parse_as_json(MESSAGES) == {
+        "anime_name": "葬送的芙莉莲",
+        "episode": 1,
+    }
+    result = await replay.parse_with_schema(MESSAGES, TitleResult)
+    assert result == TitleResult(anime_name="葬送的芙莉莲", episode=1)
+
+    with pytest.raises(ValueError):
+        await replay.parse_as_json(MESSAGES[:1])
+    assert replay.calls == 3
+    assert replay.misses == 1
+
+
+@pytest.mark.asyncio
+async def test_replay_simulated_errors(tmp_path, real_provider):
+    record_path = str(tmp_path / "records.jsonl")
+    await RecordingProvider(real_provider, record_path).parse_as_json(MESSAGES)
+
+    replay = ReplayProvider(record_path, error_rate=1)
+    with pytest.raises(ConnectionError):
+        await replay.parse_as_json(MESSAGES)
+
+    replay = ReplayProvider(record_path, error_rate=0.5, seed=0)
+    errors = 0
+    for _ in range(100):
+        try:
+            await replay.parse_as_json(MESSAGES)
+        except ConnectionError:
+            errors += 1
+    assert 30 < errors < 70
+
+
+def test_create_llm_provider(tmp_path):
+    record_path = str(tmp_path / "records.jsonl")
+    provider = create_llm_provider(
+        LLMProviderType.OPENAI, record_path=record_path, api_key="sk-test"
+    )
+    assert isinstance(provider, RecordingProvider)
+
+    with pytest.raises(ValueError):
+        create_llm_provider(LLMProviderType.REPLAY, record_path=record_path)
+    (tmp_path / "records.jsonl").write_text("")
+
+    provider = create_llm_provider(
+        LLMProviderType.REPLAY, record_path=record_path, latency=0.1
+    )
+    assert isinstance(provider, ReplayProvider)
+    assert provider.latency == 0.1
+
+    with pytest.raises(ValueError):
+        create_llm_provider(LLMProviderType.REPLAY)
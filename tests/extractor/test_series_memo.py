@@ -0,0 +1,120 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from alist_mikananirss.extractor import (
+    Extractor,
+    LLMExtractor,
+    SeriesMemo,
+    build_series_key,
+)
+from alist_mikananirss.extractor.llm import LLMProvider
+from alist_mikananirss.extractor.models import TMDBTvInfo
+from alist_mikananirss.utils.tracing import Trace, use_trace
+
+
+@pytest.fixture(autouse=True)
+def reset_extractor():
+    Extractor.destroy_instance()
+
+
+@pytest.fixture
+def llm_extractor():
+    provider = AsyncMock(spec=LLMProvider)
+    provider.parse_as_json.side_effect = lambda messages: {
+        "anime_name": "llm_name",
+        "season": 1,
+        "episode": int(messages[1]["content"].split(" - ")[1][:2]),
+        "quality": "1080p",
+        "fansub": "ANi",
+        "languages": ["繁"],
+        "version": 1,
+    }
+    return LLMExtractor(provider)
+
+
+def test_build_series_key():
+    ep5 = "[ANi] 超超超超超喜欢你的 100 个女朋友 - 05 [1080P][Baha][WEB-DL][AAC AVC][CHT][MP4]"
+    ep6 = "[ANi] 超超超超超喜欢你的 100 个女朋友 - 06 [1080P][Baha][WEB-DL][AAC AVC][CHT][MP4]"
+    assert build_series_key(ep5) == "ani 超超超超超喜欢你的 100 个女朋友"
+    assert build_series_key(ep5) == build_series_key(ep6)
+
+    ep13 = (
+        "【喵萌奶茶屋】★01月新番★[金牌得主 / Medalist][13][1080p][简日双语][招募翻译]"
+    )
+    ep12 = (
+        "【喵萌奶茶屋】★01月新番★[金牌得主 / Medalist][12v2][1080p][简日双语][招募翻译]"
+    )
+    assert build_series_key(ep13) == "喵萌奶茶屋 金牌得主 medalist"
+    assert build_series_key(ep13) == build_series_key(ep12)
+
+    # Different fansub, different series key
+    other = (
+        "[LoliHouse] 超超超超超喜欢你的 100 个女朋友 - 05 [WebRip 1080p HEVC-10bit AAC]"
+    )
+    assert build_series_key(other) != build_series_key(ep5)
+
+    # No episode number, e.g. collections
+    assert build_series_key("[彻夜之歌 / Yofukashi no Uta][修正合集][繁日双语]") is None
+
+
+def test_memo_override_and_invalidate():
+    memo = SeriesMemo()
+    memo.override("key", "override_name", season=2)
+    memo.set("key", memo.get("key").model_copy(update={"anime_name": "auto"}))
+    # Automatic resolution doesn't replace manual override
+    assert memo.get("key").anime_name == "override_name"
+    memo.invalidate("key")
+    assert memo.get("key") is None
+
+
+@pytest.mark.asyncio
+async def test_resolve_series_once(llm_extractor):
+    tmdb_info = TMDBTvInfo(anime_name="tmdb_name", tvid=123)
+    titles = [
+        f"[ANi] 超超超超超喜欢你的 100 个女朋友 - {i:02d} [1080P][Baha][CHT]"
+        for i in range(1, 6)
+    ]
+    with patch.object(
+        llm_extractor, "search_name_in_tmdb", return_value=tmdb_info
+    ) as mock_search:
+        results = [await llm_extractor.analyse_resource_title(t) for t in titles]
+
+    mock_search.assert_called_once()
+    assert [r.anime_name for r in results] == ["tmdb_name"] * 5
+    assert [r.episode for r in results] == [1, 2, 3, 4, 5]
+    # single episode parse per title
+    assert llm_extractor.llm.parse_as_json.call_count == 5
+
+
+@pytest.mark.asyncio
+async def test_override_series(llm_extractor):
+    Extractor.initialize(llm_extractor)
+    title = "[ANi] 超超超超超喜欢你的 100 个女朋友 - 05 [1080P][Baha][CHT]"
+    with patch.object(
+        llm_extractor,
+        "search_name_in_tmdb",
+        return_value=TMDBTvInfo(anime_name="wrong_name", tvid=1),
+    ) as mock_search:
+        result = await Extractor.analyse_resource_title(title)
+        assert result.anime_name == "wrong_name"
+
+        Extractor.override_series(build_series_key(title), "right_name", season=2)
+        result = await Extractor.analyse_resource_title(title)
+        assert result.anime_name == "right_name"
+        assert result.season == 2
+
+        Extractor.invalidate_series()
+        await Extractor.analyse_resource_title(title)
+
+    assert mock_search.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_llm_span(llm_extractor):
+    trace = Trace("[ANi] Test - 01")
+    with use_trace(trace):
+        await llm_extractor.analyse_resource_title("[ANi] Test - 01", use_tmdb=False)
+    # Only the LLM call itself, not the whole extraction
+    assert [s.name for s in trace.spans] == ["llm"]
+    assert trace.spans[0].duration is not None
@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Optional dependencies, imported only when their feature is configured
+HEAVY_MODULES = ("telegram", "bs4", "feedparser", "openai", "google.genai")
+# Import time of alist_mikananirss.main and its dependencies, in seconds.
+# Wall clock time depends on the machine, so the budget is only checked when
+# set, e.g. IMPORT_TIME_BUDGET=0.8 pytest tests/test_startup.py
+IMPORT_TIME_BUDGET = os.environ.get("IMPORT_TIME_BUDGET")
+
+
+def import_times(module: str) -> dict[str, float]:
+    """{module: cumulative import time in seconds} from python -X importtime,
+    "total" for all the top level imports
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {"total": 0.0}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        times[name.strip()] = int(cumulative) / 1e6
+        # Nested imports are indented by two more spaces
+        if not name.startswith("  "):
+            times["total"] += int(cumulative) / 1e6
+    return times
+
+
+def test_heavy_dependencies_not_imported():
+    times = import_times("alist_mikananirss.main")
+    imported = [m for m in HEAVY_MODULES if m in times]
+    assert imported == []
+
+
+@pytest.mark.skipif(IMPORT_TIME_BUDGET is None, reason="IMPORT_TIME_BUDGET is not set")
+def test_import_time_budget():
+    # The best of a few runs, the first one may be slowed by a cold disk cache
+    best = min(import_times("alist_mikananirss.main")["total"] for _ in range(3))
+    assert best < float(IMPORT_TIME_BUDGET)
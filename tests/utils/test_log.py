@@ -0,0 +1,50 @@
+import sys
+import threading
+
+from loguru import logger
+
+from alist_mikananirss.utils.log import BackgroundLogWriter, LogThrottle
+
+
+def test_log_throttle():
+    throttle = LogThrottle(10, maxsize=2)
+    assert throttle.allow("a", now=0) == (True, 0)
+    assert throttle.allow("a", now=5) == (False, 0)
+    assert throttle.allow("a", now=6) == (False, 0)
+    assert throttle.allow("b", now=6) == (True, 0)
+    assert throttle.allow("a", now=10) == (True, 2)
+
+    # "a" is the oldest and is forgotten for "c"
+    assert throttle.allow("c", now=11) == (True, 0)
+    assert "a" not in throttle._state
+    throttle.forget("c")
+    assert throttle.allow("c", now=12) == (True, 0)
+
+
+def test_background_log_writer():
+    logger.remove()
+    writer = BackgroundLogWriter()
+    lines = []
+    threads = set()
+
+    def sink(message):
+        threads.add(threading.current_thread().name)
+        lines.append(str(message))
+
+    writer.add(sink, level="INFO", format="{level} {message}")
+    try:
+        logger.debug("filtered")
+        logger.info("hello {}", "world")
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.exception("failed")
+    finally:
+        writer.stop()
+        logger.add(sys.stderr)
+
+    assert lines[0] == "INFO hello world\n"
+    assert lines[1].startswith("ERROR failed\n")
+    assert "ZeroDivisionError" in lines[1]
+    assert len(lines) == 2
+    assert threads == {"log-writer"}
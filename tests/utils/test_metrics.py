@@ -0,0 +1,81 @@
+import aiohttp
+import pytest
+from async_lru import alru_cache
+
+from alist_mikananirss.utils.metrics import MetricsRegistry, MetricsServer, labels
+
+
+def test_counter_and_histogram_render():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests", "Requests")
+    requests.inc(endpoint="/api/fs/list")
+    requests.inc(2, endpoint="/api/fs/list")
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    text = registry.render()
+    assert "# TYPE requests counter" in text
+    assert 'requests_total{endpoint="/api/fs/list"} 3' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_count 3" in text
+    assert "latency_seconds_sum 5.55" in text
+    assert latency.quantile(0.5) == 1
+    assert latency.quantile(0.95) == float("inf")
+    assert latency.quantile(0.5, endpoint="/none") == 0
+
+
+def test_callback_follows_latest_instance():
+    registry = MetricsRegistry()
+    queue = [1, 2]
+    registry.gauge("queue_size", "Queue size", lambda: len(queue))
+    assert registry.get("queue_size").get() == 2
+
+    new_queue = [1, 2, 3]
+    registry.gauge("queue_size", "Queue size", lambda: len(new_queue))
+    assert "queue_size 3" in registry.render()
+
+    registry.gauge("stage_size", "", lambda: {labels(stage="fetch"): 4})
+    assert 'stage_size{stage="fetch"} 4' in registry.render()
+
+    with pytest.raises(ValueError):
+        registry.counter("queue_size", "Not a counter")
+
+
+@pytest.mark.asyncio
+async def test_track_alru_cache():
+    registry = MetricsRegistry()
+
+    @alru_cache(maxsize=8)
+    async def square(x):
+        return x * x
+
+    registry.track_alru_cache("square", square)
+    registry.track_cache("dict", lambda: (5, 1, 1))
+    await square(2)
+    await square(2)
+    await square(3)
+    text = registry.render()
+    assert 'cache_hits_total{cache="square"} 1' in text
+    assert 'cache_misses_total{cache="square"} 2' in text
+    assert 'cache_size{cache="square"} 2' in text
+    assert 'cache_hits_total{cache="dict"} 5' in text
+
+
+@pytest.mark.asyncio
+async def test_metrics_server():
+    registry = MetricsRegistry()
+    registry.counter("polls", "Polls").inc()
+    server = MetricsServer(registry)
+    base_url = await server.start(port=0)
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(base_url + "metrics") as resp:
+                assert resp.status == 200
+                assert resp.headers["Content-Type"].startswith("text/plain")
+                assert "polls_total 1" in await resp.text()
+    finally:
+        await server.close()
@@ -0,0 +1,28 @@
+import asyncio
+import time
+
+import pytest
+
+from alist_mikananirss.utils.ratelimit import TokenBucket
+
+
+def test_try_acquire():
+    bucket = TokenBucket(rate=2, capacity=2)
+    now = time.monotonic()
+    assert bucket.try_acquire(now)
+    assert bucket.try_acquire(now)
+    assert not bucket.try_acquire(now)
+    assert bucket.try_acquire(now + 0.5)
+    # Never more than capacity
+    assert bucket.try_acquire(now + 100)
+    assert bucket.try_acquire(now + 100)
+    assert not bucket.try_acquire(now + 100)
+
+
+@pytest.mark.asyncio
+async def test_acquire():
+    bucket = TokenBucket(rate=50, capacity=2)
+    start = time.monotonic()
+    await asyncio.gather(*(bucket.acquire() for _ in range(7)))
+    # 2 at once, then 5 at 50 per second
+    assert time.monotonic() - start >= 0.09
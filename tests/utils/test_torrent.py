@@ -0,0 +1,88 @@
+import asyncio
+import hashlib
+
+import pytest
+from aiohttp import web
+
+from alist_mikananirss.utils.torrent import (
+    BencodeError,
+    bdecode,
+    fetch_info_hashes,
+    info_hash_from_torrent,
+    info_hash_from_url,
+)
+
+INFO = b"d6:lengthi1024e4:name8:test.mkv12:piece lengthi16384e6:pieces20:aaaaaaaaaaaaaaaaaaaae"
+TORRENT = b"d8:announce23:http://tracker/announce4:info" + INFO + b"e"
+INFO_HASH = hashlib.sha1(INFO).hexdigest()
+
+
+def test_bdecode():
+    assert bdecode(b"i-42e") == -42
+    assert bdecode(b"l4:spami3ee") == [b"spam", 3]
+    assert bdecode(TORRENT)[b"info"][b"name"] == b"test.mkv"
+    with pytest.raises(BencodeError):
+        bdecode(b"l4:spam")
+    with pytest.raises(BencodeError):
+        bdecode(b"i1ei2e")
+
+
+def test_info_hash_from_torrent():
+    assert info_hash_from_torrent(TORRENT) == INFO_HASH
+    with pytest.raises(BencodeError):
+        info_hash_from_torrent(b"d8:announce3:urle")
+    with pytest.raises(BencodeError):
+        info_hash_from_torrent(b"<html></html>")
+
+
+def test_info_hash_from_url():
+    hex_hash = "c12fe1c06bba254a9dc9f519b335aa7c1367a88a"
+    assert (
+        info_hash_from_url(f"magnet:?xt=urn:btih:{hex_hash.upper()}&dn=test")
+        == hex_hash
+    )
+    # base32 form
+    assert (
+        info_hash_from_url("magnet:?xt=urn:btih:YEX6DQDLXISUVHOJ6UM3GNNKPQJWPKEK")
+        == hex_hash
+    )
+    assert (
+        info_hash_from_url(f"https://mikanani.me/Download/20240717/{hex_hash}.torrent")
+        == hex_hash
+    )
+    assert info_hash_from_url("https://acg.rip/t/123.torrent") is None
+    assert info_hash_from_url("magnet:?dn=test") is None
+
+
+@pytest.mark.asyncio
+async def test_fetch_info_hashes():
+    active = peak = 0
+
+    async def torrent(request: web.Request):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if request.match_info["name"] == "missing":
+            raise web.HTTPNotFound()
+        return web.Response(body=TORRENT)
+
+    app = web.Application()
+    app.router.add_get("/{name}.torrent", torrent)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    try:
+        urls = [f"http://{host}:{port}/{i}.torrent" for i in range(10)]
+        urls += [
+            f"http://{host}:{port}/missing.torrent",
+            f"magnet:?xt=urn:btih:{'ab' * 20}",
+        ]
+        info_hashes = await fetch_info_hashes(urls, concurrency=3)
+    finally:
+        await runner.cleanup()
+    assert info_hashes == [INFO_HASH] * 10 + [None, "ab" * 20]
+    assert peak == 3
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+
+from alist_mikananirss import AnimeRenamer, DownloadManager
+from alist_mikananirss.alist import Alist, AlistDownloaderType
+from alist_mikananirss.alist.fake_server import FakeAlistOptions, FakeAlistServer
+from alist_mikananirss.utils.tracing import (
+    Trace,
+    format_summary,
+    read_traces,
+    span,
+    summarize,
+    trace_log,
+    use_trace,
+)
+from alist_mikananirss.websites.models import ResourceInfo
+
+
+@pytest.fixture
+def trace_path(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    trace_log.configure(path, max_bytes=1024 * 1024, backup_count=2)
+    yield path
+    trace_log.configure(None)
+
+
+def test_trace_spans(trace_path):
+    trace = Trace("Test - 01", start=time.time() - 1)
+    trace.add_span("fetch", trace.start, 0.5)
+    with use_trace(trace):
+        with span("extract"):
+            with span("llm"):
+                pass
+    trace.begin("download")
+    trace.finish("failed", "download failed")
+    # Only written once
+    trace.finish()
+
+    trace_log.flush()
+    (record,) = list(read_traces(trace_path))
+    assert record["title"] == "Test - 01"
+    assert record["status"] == "failed"
+    assert record["total"] >= 1
+    assert [s["name"] for s in record["spans"]] == [
+        "fetch",
+        "extract",
+        "llm",
+        "download",
+    ]
+    assert record["spans"][-1]["error"] == "download failed"
+
+
+def test_span_without_trace():
+    with span("llm"):
+        pass
+
+
+def test_trace_log_rotation(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    trace_log.configure(path, max_bytes=300, backup_count=2)
+    try:
+        for i in range(10):
+            Trace(f"Test - {i:02d}").finish()
+    finally:
+        trace_log.configure(None)
+    assert (tmp_path / "traces.jsonl.1").exists()
+    assert (tmp_path / "traces.jsonl.2").exists()
+    assert not (tmp_path / "traces.jsonl.3").exists()
+    titles = [t["title"] for t in read_traces(path, backup_count=2)]
+    # Oldest first, the oldest ones rotated out
+    assert titles == sorted(titles)
+    assert titles[-1] == "Test - 09"
+    assert len(titles) < 10
+
+
+def test_summarize():
+    traces = [
+        {
+            "start": 100,
+            "total": total,
+            "status": "done",
+            "spans": [
+                {"name": "extract", "start": 100, "duration": total / 2},
+                {"name": "llm", "start": 100, "duration": total / 4},
+                {"name": "llm", "start": 101, "duration": total / 4},
+            ],
+        }
+        for total in range(1, 101)
+    ]
+    traces.append({"start": 0, "total": 5, "status": "failed", "spans": []})
+    summary = summarize(traces, since=50)
+    assert summary["total"]["count"] == 100
+    assert summary["total"]["p50"] == 51
+    assert summary["total"]["p95"] == 96
+    assert summary["llm"]["p50"] == 25.5
+    assert summary["extract"]["max"] == 50
+    assert "total" in format_summary(summary).splitlines()[-1]
+
+
+@pytest.mark.asyncio
+async def test_download_trace(trace_path):
+    options = FakeAlistOptions(download_time=0.1, transfer_time=0.1)
+    async with FakeAlistServer(options) as server:
+        alist = Alist(server.base_url, server.token, AlistDownloaderType.QBIT)
+        DownloadManager.destroy_instance()
+        AnimeRenamer.destroy_instance()
+        AnimeRenamer.initialize(alist, "{name} S{season:02d}E{episode:02d}")
+        DownloadManager.initialize(
+            alist_client=alist,
+            base_download_path="/Google/Anime",
+            use_renamer=True,
+            db=AsyncMock(),
+        )
+        resource = ResourceInfo(
+            resource_title="Test - 01",
+            torrent_url=f"magnet:?xt=urn:btih:{'ab' * 20}",
+            anime_name="Test",
+            season=1,
+            episode=1,
+            trace=Trace("Test - 01"),
+        )
+        try:
+            await DownloadManager.add_download_tasks([resource])
+            await asyncio.wait_for(DownloadManager().task_monitor.wait_finished(), 10)
+        finally:
+            await alist.close()
+            DownloadManager.destroy_instance()
+            AnimeRenamer.destroy_instance()
+
+    trace_log.flush()
+    with open(trace_path, encoding="utf-8") as f:
+        record = json.loads(f.readline())
+    assert record["status"] == "done"
+    names = [s["name"] for s in record["spans"]]
+    assert names == ["submit", "download", "link", "transfer", "rename"]
+    assert all(s["duration"] is not None for s in record["spans"])
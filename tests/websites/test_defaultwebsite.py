@@ -4,6 +4,7 @@ import feedparser
 import pytest
 from loguru import logger
 
+from alist_mikananirss.utils.metrics import metrics
 from alist_mikananirss.websites.default import DefaultWebsite
 from alist_mikananirss.websites.models import FeedEntry
 
@@ -139,3 +140,28 @@ async def test_unsupported_rss(default_website, mock_unsupported_rss):
     mock_logger_error.assert_called_once()
     assert isinstance(result, list)
     assert len(result) == 0
+
+
+@pytest.mark.asyncio
+async def test_parse_feed_errors(default_website, mock_nyaa_rss):
+    errors = metrics.counter("website_feed_fetch_errors", "")
+
+    def count():
+        return errors.values.get((("site", "DefaultWebsite"),), 0)
+
+    before = count()
+    feed = await default_website.parse_feed(mock_nyaa_rss)
+    assert feed.entries
+    assert count() == before
+
+    # Not a feed, feedparser only sets bozo
+    feed = await default_website.parse_feed("<html><body>502 Bad Gateway")
+    assert not feed.entries
+    assert count() == before + 1
+
+    with patch(
+        "feedparser.parse",
+        return_value=feedparser.FeedParserDict(status=404, entries=[], bozo=0),
+    ):
+        await default_website.parse_feed(default_website.rss_url)
+    assert count() == before + 2